@@ -0,0 +1,94 @@
+import os
+import gzip
+import tarfile
+import subprocess
+from distutils.spawn import find_executable
+from discovery_lib import glob_entries
+
+
+# Number of threads compressing archives, if pigz is installed:
+archive_threads = 4
+
+
+def get_archive_members(patterns, excludes=None):
+  """ Returns the paths matching the shell patterns, which are archived.
+      Input:
+       patterns: List of shell patterns relative to the current directory,
+         e.g. ['run_1/pbs.sh', 'run_1/*_checkpoint*']
+       excludes: List of paths (relative to the current directory) which
+         are not archived, including everything below them (Default: None)
+      Output:
+       members: List of strings of the paths, sorted
+  """
+  excludes = [path.rstrip('/') for path in (excludes or [])]
+  members = set()
+  for pattern in patterns:
+    for (path, entry_type) in glob_entries('.', pattern):
+      path = path.rstrip('/')
+      if (not is_excluded(path, excludes)):
+        members.add(path)
+  return sorted(members)
+
+
+def is_excluded(path, excludes):
+  """ Returns True if the path is one of the excluded paths or below one.
+  """
+  return any([path == exclude or path.startswith(exclude+'/') for exclude in excludes])
+
+
+def write_archive(filename, members, excludes=None, compresslevel=6):
+  """ Writes a gzip compressed tar archive of the given paths, which is
+      compressed while the files are read, thus the uncompressed archive
+      is never written to disk. If 'pigz' is installed, it compresses with
+      'archive_threads' threads, otherwise Python's gzip is used.
+      The archive is written to a temporary file first, which replaces
+      'filename' once it is complete.
+      Input:
+       filename: String of the filename of the archive
+       members: List of paths to archive, directories are archived with
+         everything in them
+       excludes: List of paths that are not archived, including
+         everything below them (Default: None)
+       compresslevel: Integer of the compression level from 1 (fastest)
+         to 9 (smallest) (Default: 6)
+      Output:
+       status: 0 if the archive was written, 1 otherwise
+  """
+  excludes = [path.rstrip('/') for path in (excludes or [])]
+  def exclude_filter(tarinfo):
+    if (is_excluded(tarinfo.name, excludes)):
+      return None
+    return tarinfo
+  tmp_filename = filename+'.tmp'
+  pigz = find_executable('pigz')
+  status = 0
+  archive = open(tmp_filename, 'wb')
+  try:
+    if (pigz is None):
+      compressor = gzip.GzipFile(filename='', mode='wb', compresslevel=compresslevel, fileobj=archive)
+      tar = tarfile.open(fileobj=compressor, mode='w|')
+      process = None
+    else:
+      compressor = None
+      process = subprocess.Popen([pigz, '-c', '-'+str(compresslevel), '-p', str(archive_threads)], stdin=subprocess.PIPE, stdout=archive)
+      tar = tarfile.open(fileobj=process.stdin, mode='w|')
+    try:
+      for path in members:
+        tar.add(path, filter=exclude_filter)
+    finally:
+      tar.close()
+      if (not (compressor is None)):
+        compressor.close()
+      if (not (process is None)):
+        process.stdin.close()
+        if (process.wait() != 0):
+          status = 1
+  except (IOError, OSError, tarfile.TarError):
+    status = 1
+  finally:
+    archive.close()
+  if (status == 0):
+    os.rename(tmp_filename, filename)
+  elif (os.path.exists(tmp_filename)):
+    os.remove(tmp_filename)
+  return status
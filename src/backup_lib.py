@@ -0,0 +1,311 @@
+import os
+import json
+import time
+import glob
+import zlib
+import hashlib
+from numpy import array, frombuffer, nonzero, uint8, uint32
+
+
+
+def get_gear_table():
+  """ Returns the 256 random 32-bit integers of the rolling (gear) hash,
+      derived from md5 such that they are the same on every machine.
+  """
+  return [int(hashlib.md5(chr(i)).hexdigest()[:8], 16) for i in range(256)]
+
+
+gear_table = array(get_gear_table(), dtype=uint32)
+
+
+
+class BackupStore:
+  """ A class for keeping backups of the files of a simulation, e.g. its
+      result files (stat/detectors/detectors.dat) and checkpoint files, in a
+      content-addressed store. The files are split into chunks at
+      positions determined by their content (where a rolling hash of the
+      last 32 bytes has its 'mask_bits' highest bits zero), and every chunk is stored
+      once as a zlib compressed file named by its sha1 hash:
+       store_dir/chunks/<first 2 characters of hash>/<hash>
+      Every backup is a snapshot, a JSON file listing the chunks of every
+      file:
+       store_dir/snapshots/<number>.json:
+        {"time": <seconds since epoch>, "label": label,
+         "files": {name: {"size": size, "mtime": mtime, "mode": mode,
+                          "chunks": [[hash, size], ...]}}}
+      As the chunk boundaries only depend on the content, a backup only
+      writes the chunks that changed since the previous snapshot, e.g. the
+      appended end of a growing stat file. Files that were not modified
+      since the previous snapshot (same size and mtime) are not read at
+      all, and the unchanged beginning of a file is only compared to the
+      previous snapshot by its hashes, before the rest is chunked.
+      Chunks are shared by all files and snapshots, thus the checkpoint
+      files, which have new names at every checkpoint, only add the chunks
+      that differ from the ones of the previous checkpoints.
+      Only the last 'keep' snapshots are kept, chunks that are not used by
+      them anymore are removed.
+  """
+  def __init__(self, store_dir, keep=10, min_size=262144, mask_bits=18, max_size=2097152):
+    """
+        Constructor with 1 input argument and 4 optional input arguments:
+        Input:
+         store_dir: String of the directory of the store
+         keep: Integer of the number of snapshots that are kept (Default: 10)
+         min_size: Integer of the minimum size of a chunk in bytes
+           (Default: 262144)
+         mask_bits: Integer of the number of highest bits of the rolling
+           hash, which are zero at a chunk boundary, thus chunks are about min_size+2**mask_bits
+           bytes large (Default: 18)
+         max_size: Integer of the maximum size of a chunk in bytes
+           (Default: 2097152)
+    """
+    self.store_dir = store_dir
+    self.keep = max(1, keep)
+    self.min_size = min_size
+    self.shift = uint32(32 - mask_bits)
+    self.max_size = max(min_size, max_size)
+    # Number of positions whose hashes are computed at once:
+    self.block_size = 1 << max(16, mask_bits)
+    self.chunk_dir = os.path.join(store_dir, 'chunks')
+    self.snapshot_dir = os.path.join(store_dir, 'snapshots')
+
+
+  def find_boundary(self, data):
+    """ Returns the length of the first chunk of 'data', which is either
+        the position after a boundary, at most 'self.max_size', or all of
+        'data'.
+        The gear hash h = (h<<1)+gear[byte] of 32 bits at a position only
+        depends on the last 32 bytes, it is the sum of gear[byte]<<k of the
+        byte k positions before. Thus it is computed with numpy for a whole
+        block of positions at once, by 32 shifted additions.
+        Input:
+         data: bytearray starting at a chunk boundary
+        Output:
+         length: Integer of the length of the chunk
+    """
+    end = min(len(data), self.max_size)
+    pos = self.min_size
+    while (pos < end):
+      stop = min(end, pos+self.block_size)
+      # The hashes at pos..stop-1 need the 31 bytes before pos as well:
+      start = max(0, pos-31)
+      gear = gear_table[frombuffer(data, dtype=uint8, count=stop-start, offset=start)]
+      h = gear.copy()
+      for k in range(1, min(32, len(gear))):
+        h[k:] += gear[:-k] << uint32(k)
+      boundaries = nonzero((h[pos-start:] >> self.shift) == 0)[0]
+      if (len(boundaries) > 0):
+        return pos+int(boundaries[0])+1
+      pos = stop
+    return end
+
+
+  def get_chunk_filename(self, hash):
+    """ Returns the filename of the chunk with the sha1 hash 'hash'.
+    """
+    return os.path.join(self.chunk_dir, hash[:2], hash)
+
+
+  def write_chunk(self, data):
+    """ Stores a chunk, if it is not in the store already.
+        Input:
+         data: String of the content of the chunk
+        Output:
+         hash: String of the sha1 hash of the chunk
+         written: Integer of the number of bytes written to the store
+    """
+    hash = hashlib.sha1(data).hexdigest()
+    filename = self.get_chunk_filename(hash)
+    if (os.path.isfile(filename)):
+      return hash, 0
+    if (not os.path.isdir(os.path.dirname(filename))):
+      os.makedirs(os.path.dirname(filename))
+    compressed = zlib.compress(data, 6)
+    f = open(filename+'.tmp', 'wb')
+    try:
+      f.write(compressed)
+    finally:
+      f.close()
+    os.rename(filename+'.tmp', filename)
+    return hash, len(compressed)
+
+
+  def read_chunk(self, hash):
+    """ Returns the content of the chunk with the sha1 hash 'hash'.
+    """
+    f = open(self.get_chunk_filename(hash), 'rb')
+    try:
+      return zlib.decompress(f.read())
+    finally:
+      f.close()
+
+
+  def store_file(self, filename, previous=None):
+    """ Splits a file into chunks, which are stored.
+        Input:
+         filename: String of the filename
+         previous: Dictionary of the file in the previous snapshot, whose
+           chunks are reused as long as the file starts with them
+           (Default: None)
+        Output:
+         chunks: List of [hash, size] of the chunks of the file
+         written: Integer of the number of bytes written to the store
+    """
+    chunks = []; written = 0
+    f = open(filename, 'rb')
+    try:
+      # Reuse the chunks of the previous snapshot the file still starts with,
+      # except for the last one, which ended with the file, not at a boundary:
+      if (not (previous is None)):
+        for (hash, size) in previous['chunks'][:-1]:
+          data = f.read(size)
+          if (len(data) != size or hashlib.sha1(data).hexdigest() != hash):
+            f.seek(-len(data), 1)
+            break
+          chunks.append([hash, size])
+      # Chunk the rest of the file:
+      data = bytearray()
+      eof = False
+      while (not eof or len(data) > 0):
+        if (not eof and len(data) < self.max_size):
+          block = f.read(self.max_size)
+          if (block == ''):
+            eof = True
+          else:
+            data.extend(block)
+          continue
+        length = self.find_boundary(data)
+        (hash, nbytes) = self.write_chunk(str(data[:length]))
+        chunks.append([hash, length])
+        written = written + nbytes
+        del data[:length]
+    finally:
+      f.close()
+    return chunks, written
+
+
+  def get_snapshots(self):
+    """ Returns the filenames of all snapshots, oldest first.
+    """
+    return sorted(glob.glob(os.path.join(self.snapshot_dir, '*.json')))
+
+
+  def load_snapshot(self, snapshot=None):
+    """ Loads a snapshot.
+        Input:
+         snapshot: String of the filename of the snapshot, or None for
+           the most recent one (Default: None)
+        Output:
+         manifest: Dictionary of the snapshot, or None if there is none
+    """
+    if (snapshot is None):
+      snapshots = self.get_snapshots()
+      if (not snapshots):
+        return None
+      snapshot = snapshots[-1]
+    f = open(snapshot, 'r')
+    try:
+      return json.load(f)
+    finally:
+      f.close()
+
+
+  def backup(self, filenames, label=None):
+    """ This method makes a snapshot of the given files, and removes
+        snapshots older than the last 'self.keep' ones.
+        Input:
+         filenames: List of strings of the filenames, which are stored by
+           their basename
+         label: String describing the snapshot, e.g. the checkpoint
+           (Default: None)
+        Output:
+         snapshot: String of the filename of the new snapshot
+         written: Integer of the number of bytes written to the store
+    """
+    if (not os.path.isdir(self.snapshot_dir)):
+      os.makedirs(self.snapshot_dir)
+    snapshots = self.get_snapshots()
+    latest = self.load_snapshot()
+    if (latest is None):
+      latest = {'files' : {}}
+    files = {}; written = 0
+    for filename in filenames:
+      name = os.path.basename(filename)
+      stat = os.stat(filename)
+      previous = latest['files'].get(name)
+      if (not (previous is None) and previous['size'] == stat.st_size and previous['mtime'] == stat.st_mtime):
+        # The file was not modified:
+        chunks = previous['chunks']
+      else:
+        (chunks, nbytes) = self.store_file(filename, previous)
+        written = written + nbytes
+      files[name] = {'size' : stat.st_size, 'mtime' : stat.st_mtime, 'mode' : stat.st_mode & 07777, 'chunks' : chunks}
+    if (snapshots):
+      number = int(os.path.basename(snapshots[-1]).split('.')[0])+1
+    else:
+      number = 0
+    snapshot = os.path.join(self.snapshot_dir, '%06d.json' % number)
+    f = open(snapshot+'.tmp', 'w')
+    try:
+      json.dump({'time' : time.time(), 'label' : label, 'files' : files}, f, sort_keys=True)
+    finally:
+      f.close()
+    os.rename(snapshot+'.tmp', snapshot)
+    self.prune()
+    return snapshot, written
+
+
+  def prune(self):
+    """ This method removes all but the last 'self.keep' snapshots, and
+        the chunks which are not used by the remaining snapshots.
+        Output:
+         nremoved: Integer of the number of removed chunks
+    """
+    snapshots = self.get_snapshots()
+    if (len(snapshots) <= self.keep):
+      return 0
+    for snapshot in snapshots[:-self.keep]:
+      os.remove(snapshot)
+    used = set()
+    for snapshot in snapshots[-self.keep:]:
+      for entry in self.load_snapshot(snapshot)['files'].values():
+        used.update([hash for (hash, size) in entry['chunks']])
+    nremoved = 0
+    for filename in glob.glob(os.path.join(self.chunk_dir, '*', '*')):
+      if (not (os.path.basename(filename) in used)):
+        os.remove(filename)
+        nremoved = nremoved + 1
+    return nremoved
+
+
+  def restore(self, target_dir, snapshot=None, names=None):
+    """ This method restores files of a snapshot.
+        Input:
+         target_dir: String of the directory the files are written to
+         snapshot: String of the filename of the snapshot, or None for
+           the most recent one (Default: None)
+         names: List of the names of the files to restore, or None for
+           all files (Default: None)
+        Output:
+         restored: List of strings of the restored filenames
+    """
+    manifest = self.load_snapshot(snapshot)
+    if (manifest is None):
+      return []
+    if (not os.path.isdir(target_dir)):
+      os.makedirs(target_dir)
+    restored = []
+    for (name, entry) in sorted(manifest['files'].items()):
+      if (not (names is None) and not (name in names)):
+        continue
+      filename = os.path.join(target_dir, name)
+      f = open(filename, 'wb')
+      try:
+        for (hash, size) in entry['chunks']:
+          f.write(self.read_chunk(hash))
+      finally:
+        f.close()
+      os.chmod(filename, entry['mode'])
+      os.utime(filename, (entry['mtime'], entry['mtime']))
+      restored.append(filename)
+    return restored
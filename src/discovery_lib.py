@@ -0,0 +1,200 @@
+import os
+import stat
+import time
+import fnmatch
+import threading
+
+
+
+class DirectoryCache:
+  """ A class that keeps the listings of directories, meaning the names
+      and types of their entries, such that looking for files in the same
+      directory over and over again does not read the directory every
+      time. A listing is read again when the modification time of its
+      directory changed, which is the case whenever an entry is created,
+      removed or renamed. In addition, the whole cache should be cleared
+      once per round of monitoring, which keeps its size bounded.
+      The cache can be used from several threads.
+  """
+  def __init__(self, granularity=2.0):
+    """
+        Constructor with 1 optional input argument:
+        Input:
+         granularity: Float of the resolution of modification times
+           in seconds of the file system, listings of directories that
+           were modified less than this long before they were read are
+           not used, as a later modification might not change the
+           modification time (Default: 2.0)
+    """
+    self.granularity = granularity
+    # Listings, path : (mtime, [(name, type), ...]):
+    self.listings = {}
+    self.lock = threading.Lock()
+
+
+  def get_listing(self, dir):
+    """ Returns the entries of a directory, sorted by their names.
+        Input:
+         dir: String of the directory
+        Output:
+         entries: List of tuples (name, type), where type is 'f' for
+           files, 'd' for directories, 'l' for symbolic links and '?'
+           otherwise, or None if 'dir' is not a directory
+    """
+    path = os.path.abspath(dir)
+    try:
+      mtime = os.stat(path).st_mtime
+    except OSError:
+      return None
+    with self.lock:
+      listing = self.listings.get(path)
+    if (not (listing is None) and listing[0] == mtime):
+      return listing[1]
+    listed_at = time.time()
+    try:
+      names = os.listdir(path)
+    except OSError:
+      return None
+    entries = []
+    for name in sorted(names):
+      entry_type = get_entry_type(os.path.join(path, name))
+      if (not (entry_type is None)):
+        entries.append((name, entry_type))
+    if (listed_at-mtime > self.granularity):
+      with self.lock:
+        self.listings[path] = (mtime, entries)
+    return entries
+
+
+  def clear(self):
+    """ Removes all listings from the cache.
+    """
+    with self.lock:
+      self.listings.clear()
+
+
+
+def get_entry_type(path):
+  """ Returns the type of a directory entry, without following symbolic
+      links (like 'find -type').
+      Input:
+       path: String of the path of the entry
+      Output:
+       type: 'f' for files, 'd' for directories, 'l' for symbolic links,
+         '?' otherwise, and None if the entry does not exist
+  """
+  try:
+    mode = os.lstat(path).st_mode
+  except OSError:
+    return None
+  if (stat.S_ISLNK(mode)):
+    return 'l'
+  elif (stat.S_ISDIR(mode)):
+    return 'd'
+  elif (stat.S_ISREG(mode)):
+    return 'f'
+  return '?'
+
+
+def has_magic(pattern):
+  """ Returns True if the pattern contains wildcards.
+  """
+  return any([char in pattern for char in '*?['])
+
+
+def match_name(name, pattern):
+  """ Returns True if the name matches the shell pattern, where wildcards
+      do not match a leading '.' (hidden entries), like in the shell.
+  """
+  if (name.startswith('.') and not pattern.startswith('.')):
+    return False
+  return fnmatch.fnmatchcase(name, pattern)
+
+
+# Cache shared by all discovery routines:
+directory_cache = DirectoryCache()
+
+
+def glob_entries(dir, pattern, cache=None):
+  """ Expands a shell pattern relative to the directory 'dir', like the
+      shell does with the arguments of a command.
+      Input:
+       dir: String of the directory the pattern is relative to
+       pattern: String of the shell pattern, e.g. '*.stat' or 'run*/*.flml'
+       cache: DirectoryCache object (Default: shared cache)
+      Output:
+       paths: List of tuples (path, type) of the matching entries, where
+         path is relative to 'dir'
+  """
+  if (cache is None):
+    cache = directory_cache
+  if (pattern.startswith('/')):
+    (dir, pattern) = ('/', pattern.lstrip('/'))
+    prefix = '/'
+  else:
+    prefix = ''
+  # Candidates (path relative to 'dir', type), with 'path' being '' for 'dir':
+  candidates = [(prefix, 'd')]
+  segments = [segment for segment in pattern.split('/') if (segment != '')]
+  for (i, segment) in enumerate(segments):
+    matches = []
+    for (path, entry_type) in candidates:
+      parent = os.path.join(dir, path)
+      if (segment in ['.', '..']):
+        entry_type = get_entry_type(os.path.join(parent, segment))
+        if (not (entry_type is None)):
+          matches.append((os.path.join(path, segment), entry_type))
+      elif (has_magic(segment)):
+        for (name, entry_type) in (cache.get_listing(parent) or []):
+          if (match_name(name, segment)):
+            matches.append((os.path.join(path, name), entry_type))
+      else:
+        entry_type = get_entry_type(os.path.join(parent, segment))
+        if (not (entry_type is None)):
+          matches.append((os.path.join(path, segment), entry_type))
+    if (i < len(segments)-1):
+      # Only directories (or links to them) can hold further segments:
+      matches = [match for match in matches if (os.path.isdir(os.path.join(dir, match[0])))]
+    candidates = matches
+  if (len(segments) == 0):
+    return []
+  return candidates
+
+
+def find_entries(dir, patterns, names=None, excludes=None, type=None, maxdepth=None, cache=None):
+  """ Looks for directory entries like the command
+       cd dir; find patterns -maxdepth maxdepth -name names -not -name excludes -type type
+      would, but without running a subprocess.
+      Input:
+       dir: String of the directory the search starts in
+       patterns: List of shell patterns of the starting points,
+         relative to 'dir', e.g. ['*.stat'] or ['.']
+       names: List of shell patterns every name must match (Default: None)
+       excludes: List of shell patterns no name may match (Default: None)
+       type: 'f', 'd' or 'l' for files, directories or symbolic links,
+         or None for any type (Default: None)
+       maxdepth: Integer of the maximum depth below the starting points,
+         or None for no limit (Default: None)
+       cache: DirectoryCache object (Default: shared cache)
+      Output:
+       paths: List of strings of the found entries, relative to 'dir'
+  """
+  if (cache is None):
+    cache = directory_cache
+  names = names or []
+  excludes = excludes or []
+  paths = []
+  def visit(path, entry_type, depth):
+    name = os.path.basename(path.rstrip('/')) or path
+    if ((type is None or entry_type == type)
+        and all([fnmatch.fnmatchcase(name, pattern) for pattern in names])
+        and not any([fnmatch.fnmatchcase(name, pattern) for pattern in excludes])):
+      paths.append(path)
+    # Links are not followed (like 'find -P'):
+    if (entry_type == 'd' and (maxdepth is None or depth < maxdepth)):
+      for (child, child_type) in (cache.get_listing(os.path.join(dir, path)) or []):
+        visit(os.path.join(path, child), child_type, depth+1)
+  for pattern in patterns:
+    for (path, entry_type) in glob_entries(dir, pattern, cache=cache):
+      visit(path, entry_type, 0)
+  return paths
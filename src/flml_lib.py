@@ -0,0 +1,242 @@
+import os
+import threading
+import xml.etree.cElementTree as ElementTree
+## Requires libspud to be installed:
+import libspud
+
+
+# libspud holds one global option tree per process, thus only one flml file
+# can be loaded at a time:
+libspud_lock = threading.RLock()
+
+
+class FlmlOptions:
+  """ A class holding the options of one flml file that are needed for
+      monitoring a simulation, e.g. its simulation name, current time and
+      finish time. The flml file is loaded only once and all these options
+      are read in at the same time. Other options are read in with their
+      first request and kept as well.
+      The options are read in by streaming through the XML of the flml
+      file, which stops as soon as all requested options were found. This
+      neither needs the whole option tree of libspud, nor its global
+      state, thus flml files can be read from several threads at the same
+      time. libspud is only used for options that cannot be read in this
+      way (e.g. tensor-valued options), and for modifying flml files.
+      FlmlOptions objects should be obtained from a FlmlOptionsCache,
+      which loads the flml file again when it changed.
+  """
+  # Options read in from every flml file when it is loaded:
+  default_options = ['/simulation_name', '/timestepping/current_time', '/timestepping/finish_time', '/timestepping/wall_time_limit', '/timestepping/final_timestep', '/embedded_models/fsi_model']
+  # Options of which only their existence is of interest:
+  existence_options = ['/embedded_models/fsi_model']
+  # Elements holding the values of options, and their types:
+  value_types = {'string_value' : str, 'real_value' : float, 'integer_value' : int}
+
+  def __init__(self, filename):
+    """
+        Constructor with the filename of the flml file, which is loaded
+        right away.
+        Input:
+         filename: String of the flml filename (including its directory)
+    """
+    self.filename = filename
+    # Signature of the loaded file, the file is loaded again when it changes:
+    self.signature = get_flml_signature(filename)
+    # Values of the read in options, option path : value:
+    self.options = {}
+    self.read_options(self.default_options)
+
+
+  def read_options(self, option_strings):
+    """ This method reads in the given options of the flml file, options
+        that are not set in the flml file are False.
+        Input:
+         option_strings: List of strings of option paths in the flml file
+    """
+    try:
+      unresolved = self.read_options_from_xml(option_strings)
+    except (SyntaxError, IOError, ValueError):
+      # Not readable as plain XML, libspud reports the error:
+      unresolved = option_strings
+    if (unresolved):
+      self.read_options_from_libspud(unresolved)
+
+
+  def read_options_from_xml(self, option_strings):
+    """ This method reads in the given options by parsing the flml file as
+        XML until all of them were found. Options with a value of a type
+        that is not in 'value_types' (or not of rank 0) are not read in.
+        Input:
+         option_strings: List of strings of option paths in the flml file
+        Output:
+         unresolved: List of the options which could not be read in
+    """
+    wanted = set(option_strings)
+    unresolved = []
+    # Option path of the current element, e.g. ['timestepping', 'current_time']:
+    path = []
+    f = open(self.filename, 'rb')
+    try:
+      for (event, elem) in ElementTree.iterparse(f, events=('start', 'end')):
+        if (event == 'start'):
+          name = elem.get('name')
+          if (name is None):
+            path.append(elem.tag)
+          else:
+            path.append(elem.tag+'::'+name)
+          option_string = '/'+'/'.join(path[1:])
+          if (option_string in wanted and option_string in self.existence_options):
+            self.options[option_string] = True
+            wanted.discard(option_string)
+        else:
+          option_string = '/'+'/'.join(path[1:])
+          parent_string = '/'+'/'.join(path[1:-1])
+          if (elem.tag in self.value_types and parent_string in wanted):
+            if (elem.get('rank', '0') == '0'):
+              if (elem.tag == 'string_value'):
+                self.options[parent_string] = elem.text or ''
+              else:
+                self.options[parent_string] = self.value_types[elem.tag]((elem.text or '').strip())
+            else:
+              unresolved.append(parent_string)
+            wanted.discard(parent_string)
+          elif (option_string in wanted):
+            # Option without a value of a known type:
+            unresolved.append(option_string)
+            wanted.discard(option_string)
+          path.pop()
+          elem.clear()
+        if (len(wanted) == 0):
+          break
+    finally:
+      f.close()
+    # Options not found are not set:
+    for option_string in wanted:
+      self.options[option_string] = False
+    return unresolved
+
+
+  def read_options_from_libspud(self, option_strings):
+    """ This method loads the flml file in libspud and reads in the given
+        options. Options that are not set in the flml file are False.
+        Input:
+         option_strings: List of strings of option paths in the flml file
+    """
+    with libspud_lock:
+      load_flml_options(self.filename)
+      try:
+        for option_string in option_strings:
+          self.options[option_string] = self.read_option(option_string)
+      finally:
+        libspud.clear_options()
+
+
+  def read_option(self, option_string):
+    """ This method reads in one option of the flml file that is loaded in
+        libspud. It must be called with 'libspud_lock' held.
+        Input:
+         option_string: String of the option path in the flml file
+        Output:
+         option_value: Value of the option, or False if it is not set
+    """
+    try:
+      if (option_string in self.existence_options):
+        option_value = libspud.have_option(option_string)
+      else:
+        if (libspud.have_option(option_string)):
+          option_value = libspud.get_option(option_string)
+        else:
+          option_value = False
+    except:
+      errormsg = 'ERROR: '+option_string+' of flml "'+self.filename+'" could not be read in!'
+      print errormsg
+      raise Exception('Exception caught in "get_option_from_flml": '+errormsg)
+    return option_value
+
+
+  def get_option(self, option_string):
+    """ Returns the value of an option of the flml file, which is only
+        read in from the file if it was not read in before.
+        Input:
+         option_string: String of the option path in the flml file,
+           e.g. 'timestepping/current_time'
+        Output:
+         option_value: Value of the option, or False if it is not set
+    """
+    option_string = '/'+option_string.lstrip('/')
+    if (not (option_string in self.options)):
+      self.read_options([option_string])
+    return self.options[option_string]
+
+
+
+class FlmlOptionsCache:
+  """ A class that keeps one FlmlOptions object per flml file, keyed by
+      its path. A flml file is loaded again if its modification time or
+      size changed, e.g. because it was checkpointed or modified.
+      The cache can be used from several threads.
+  """
+  def __init__(self):
+    # Loaded flml files, path : FlmlOptions:
+    self.flmls = {}
+    self.lock = threading.Lock()
+
+
+  def get(self, filename):
+    """ Returns the FlmlOptions object of 'filename', which is loaded only
+        if it was not loaded before or changed since.
+        Input:
+         filename: String of the flml filename (including its directory)
+        Output:
+         flml: FlmlOptions object
+    """
+    path = os.path.abspath(filename)
+    signature = get_flml_signature(filename)
+    with self.lock:
+      flml = self.flmls.get(path)
+    if (flml is None or flml.signature != signature):
+      flml = FlmlOptions(filename)
+      with self.lock:
+        self.flmls[path] = flml
+    return flml
+
+
+  def forget(self, filename):
+    """ Removes the flml file from the cache, e.g. after it was modified.
+        Input:
+         filename: String of the flml filename (including its directory)
+    """
+    with self.lock:
+      self.flmls.pop(os.path.abspath(filename), None)
+
+
+
+def get_flml_signature(filename):
+  """ Returns the modification time and size of a flml file, which
+      identify the version of the file that was loaded.
+      Input:
+       filename: String of the flml filename
+      Output:
+       signature: Tuple of (mtime, size), or None if the file does
+         not exist
+  """
+  try:
+    statinfo = os.stat(filename)
+  except OSError:
+    return None
+  return (statinfo.st_mtime, statinfo.st_size)
+
+
+def load_flml_options(filename):
+  """ Loads the flml file in libspud, e.g. in order to modify its options.
+      It must be called with 'libspud_lock' held.
+      Input:
+       filename: String of the flml filename (including its directory)
+  """
+  try:
+    libspud.clear_options()
+    libspud.load_options(filename)
+  except:
+    errormsg = "ERROR: Flml file "+filename+" could not be loaded. Trying again..."
+    print errormsg
+    raise Exception('Exception caught in "get_option_from_flml": '+errormsg)
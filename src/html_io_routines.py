@@ -0,0 +1,152 @@
+## This module comprehends routines to write the status table of the
+## simulations as a static HTML page and as a JSON snapshot, which are
+## cheap to regenerate compared to the pgfplotstable/pdflatex table
+import os
+import cgi
+import json
+import time
+
+
+# Colors of the rows/entries of the table, the same as in the pdf table:
+html_colors = {'err' : '#990000', 'run' : '#000099', 'que' : '#cc00a3', 'fin' : '#009900'}
+
+# Columns holding booleans, and whether True is the good (finished) state:
+html_boolean_columns = {'simulation_running' : True, 'simulation_crashed' : False, 'simulation_finished' : True, 'sim_clean_exit' : True, 'infiniband' : True}
+
+
+def get_status_row_color(row):
+  """ Returns the color of a row of the status table, depending on whether
+      the simulation crashed, is running/queueing or finished.
+      Input:
+       row: 1D dictionary of the properties of a simulation
+      Output:
+       color: String of the key in 'html_colors', or '' for no color
+  """
+  if (row.get('simulation_crashed') == True or row.get('status') in ['E', 'H'] or row.get('sim_clean_exit') == False):
+    return 'err'
+  elif (row.get('simulation_running') == True):
+    if (row.get('status') == 'R'):
+      return 'run'
+    elif (row.get('status') == 'Q'):
+      return 'que'
+  elif (row.get('simulation_finished') == True and row.get('status') == 'F'):
+    return 'fin'
+  return ''
+
+
+def get_status_cell(colname, value):
+  """ Returns the text and color of an entry of the status table, with
+      the same replacements as in the pdf table, e.g. checkmarks for
+      booleans and colored cluster states.
+      Input:
+       colname: String of the column name
+       value: Value of the entry
+      Output:
+       text: String of the HTML of the entry
+       color: String of the key in 'html_colors', or '' for no color
+  """
+  text = cgi.escape(str(value))
+  color = ''
+  if (colname == 'status'):
+    color = {'Q' : 'que', 'R' : 'run', 'F' : 'fin', 'E' : 'err', 'H' : 'err'}.get(str(value), '')
+    text = '<b>'+text+'</b>'
+  elif (colname in html_boolean_columns and str(value) in ['True', 'False']):
+    if (str(value) == 'True'):
+      text = '&#10003;'
+    else:
+      text = '&#10007;'
+    if ((str(value) == 'True') == html_boolean_columns[colname]):
+      color = 'fin'
+    else:
+      color = 'err'
+  elif (colname == 'error_status'):
+    if (str(value) == '0'):
+      color = 'fin'
+    else:
+      color = 'err'
+    text = '<b>'+text+'</b>'
+  elif (colname == 'memory' and str(value).lower() == 'nan'):
+    text = '---'
+  elif (colname == 'sim_time' and text != ''):
+    text = text+'&nbsp;s'
+  return text, color
+
+
+def write_dict_status_html(filename, dict, printcols, printcolnames=None, caption=None, refresh=None):
+  """ Writes the status table of the simulations as a static HTML page.
+      Input:
+       filename: String of the HTML filename
+       dict: 2D Dictionary of dir : {column : value}
+       printcols: List of columns to print in the table, with 'dirname'
+         being the directory name of the simulation
+       printcolnames: 1D dictionary of column names and their values being
+         the string that should be printed instead (Default: None)
+       caption: String of the caption of the table (Default: None)
+       refresh: Integer of seconds after which a browser reloads the page,
+         or None for no reload (Default: None)
+  """
+  if (printcolnames is None):
+    printcolnames = {}
+  lines = ['<!DOCTYPE html>', '<html>', '<head>', '<meta charset="utf-8">']
+  if (not (refresh is None)):
+    lines.append('<meta http-equiv="refresh" content="'+str(refresh)+'">')
+  lines.append('<title>Status of simulations</title>')
+  lines.append('<style>')
+  lines.append('table {border-collapse: collapse; font-family: sans-serif; font-size: 10pt;}')
+  lines.append('th, td {padding: 2px 6px; text-align: right;} th {border-bottom: 1px solid black;}')
+  lines.append('td.dirname {text-align: left;}')
+  for (name, color) in sorted(html_colors.items()):
+    lines.append('.'+name+' {color: '+color+';}')
+  lines.append('</style>')
+  lines.append('</head>')
+  lines.append('<body>')
+  lines.append('<table>')
+  if (not (caption is None)):
+    lines.append('<caption>'+cgi.escape(caption)+'</caption>')
+  lines.append('<tr>'+''.join(['<th>'+cgi.escape(printcolnames.get(colname, colname))+'</th>' for colname in printcols])+'</tr>')
+  for dir in sorted(dict.keys()):
+    row = dict[dir]
+    row_color = get_status_row_color(row)
+    cells = []
+    for colname in printcols:
+      if (colname == 'dirname'):
+        (text, color) = (cgi.escape(dir), row_color)
+      else:
+        (text, color) = get_status_cell(colname, row.get(colname, ''))
+      classes = ' '.join([name for name in [colname, color] if (name != '')])
+      cells.append('<td class="'+classes+'">'+text+'</td>')
+    lines.append('<tr>'+''.join(cells)+'</tr>')
+  lines.append('</table>')
+  lines.append('<p>Last update: '+time.strftime('%Y-%m-%d %H:%M:%S')+'</p>')
+  lines.append('</body>')
+  lines.append('</html>')
+  write_file_atomically(filename, '\n'.join(lines)+'\n')
+
+
+def write_dict_status_json(filename, dict, printcols):
+  """ Writes a snapshot of the status table of the simulations as JSON:
+       {"time": <seconds since epoch>, "columns": printcols,
+        "simulations": {dir: {column: value}}}
+      Input:
+       filename: String of the JSON filename
+       dict: 2D Dictionary of dir : {column : value}
+       printcols: List of the columns of the table
+  """
+  snapshot = {'time' : time.time(), 'columns' : printcols, 'simulations' : dict}
+  write_file_atomically(filename, json.dumps(snapshot, sort_keys=True, default=str))
+
+
+def write_file_atomically(filename, data):
+  """ Writes 'data' to a temporary file, which then replaces 'filename',
+      such that readers never see an incomplete file.
+      Input:
+       filename: String of the filename
+       data: String of the content of the file
+  """
+  tmp_filename = filename+'.tmp'
+  f = open(tmp_filename, 'wb')
+  try:
+    f.write(data)
+  finally:
+    f.close()
+  os.rename(tmp_filename, filename)
@@ -3,7 +3,10 @@ import os
 import commands
 import sys
 import re
-import fluidity_tools
+import shutil
+import shlex
+from stat_lib import get_stat_file
+from discovery_lib import directory_cache, glob_entries, find_entries
 
 """
    Module for IO routines, i.e. reading input from files,
@@ -82,28 +85,84 @@ def print_ascii_table(data, separate_head=True):
 
 
 def file_append_to_file(firstfile, secondfile):
-  """ This subroutine uses the linux command 'cat' in
-      order to append the content of the secondfile
-      to the firstfile.
+  """ This subroutine appends the content of the secondfile
+      to the firstfile, see stream_append_to_file.
       Input:
        firstfile: String of the filename of the file
          to which we want to append data to.
        secondfile: String of the filename of the file we
          wish to append to firstfile.
   """
+  return stream_append_to_file(firstfile, secondfile)
+
+
+def stream_append_to_file(firstfile, secondfile, skip_header=False, blocksize=4194304):
+  """ This subroutine appends the content of the secondfile
+      to the firstfile by copying large blocks, such that
+      the content never has to be held in memory as a whole.
+      The appended data is flushed to disk (fsync), and if
+      anything goes wrong, the firstfile is truncated to its
+      previous size again, thus the firstfile either has the
+      whole secondfile appended or is left unchanged.
+      Input:
+       firstfile: String of the filename of the file
+         to which we want to append data to.
+       secondfile: String of the filename of the file we
+         wish to append to firstfile.
+       skip_header: Boolean, if True the XML header of the
+         secondfile (its first lines containing '<') is not
+         appended, e.g. for .stat and .detectors files
+         (Default: False)
+       blocksize: Integer of the number of bytes copied at
+         once (Default: 4 MB)
+      Output:
+       status: Integer which is 0 if no error occured, and
+         non-zero otherwise
+  """
   status = 0
-  cmd = "cat "+secondfile+" >> "+firstfile
-  out = commands.getoutput(cmd)
-  if (out.find("No such file or directory") >= 0):
-    errormsg = "Error: Could not append "+secondfile+" to "+firstfile+" via the 'cat' command. Error was: "+out+"."
+  try:
+    src = open(secondfile, 'rb')
+  except IOError as e:
+    errormsg = "Error: Could not append "+secondfile+" to "+firstfile+". Error was: "+str(e)+"."
     printc(errormsg, 'red', False); print
-    status = 1
+    return 1
+  try:
+    dst = open(firstfile, 'ab')
+  except IOError as e:
+    src.close()
+    errormsg = "Error: Could not append "+secondfile+" to "+firstfile+". Error was: "+str(e)+"."
+    printc(errormsg, 'red', False); print
+    return 1
+  size = os.fstat(dst.fileno()).st_size
+  try:
+    try:
+      if (skip_header):
+        # The header only spans the first lines, find its end once:
+        offset = 0
+        for line in iter(src.readline, ''):
+          if (line.find('<') < 0):
+            break
+          offset = offset + len(line)
+        src.seek(offset)
+      shutil.copyfileobj(src, dst, blocksize)
+      dst.flush()
+      os.fsync(dst.fileno())
+    except (IOError, OSError) as e:
+      # Do not leave a partially appended file behind:
+      dst.flush()
+      os.ftruncate(dst.fileno(), size)
+      errormsg = "Error: Could not append "+secondfile+" to "+firstfile+". Error was: "+str(e)+"."
+      printc(errormsg, 'red', False); print
+      status = 1
+  finally:
+    src.close()
+    dst.close()
   return status
 
 
 def string_append_to_file(data, file, append=True):
-  """ This subroutine uses the linux command 'echo' in
-      order to append a string to the file 'file'.
+  """ This subroutine appends a string as one line to the
+      file 'file'.
       Input:
        data: String of some text that should be appended
          to the file 'file'.
@@ -114,11 +173,13 @@ def string_append_to_file(data, file, append=True):
          overwritten.
   """
   if (append):
-    tofile = '>>'
+    f = open(file, 'a')
   else:
-    tofile = '>'
-  cmd = 'echo -e "'+data+'" '+tofile+' '+file
-  out = commands.getoutput(cmd)
+    f = open(file, 'w')
+  try:
+    f.write(data+'\n')
+  finally:
+    f.close()
 
 
 def python_append_to_file(filename, data, append=True):
@@ -148,7 +209,11 @@ def find_file_dir_name(dir, searchstring, type, depth=None):
   """
      This routine takes in a searchstring for the shell command
      'find' as well as its optional argument of which type it 
-     is supposed to look for, e.g. 'd' for directory
+     is supposed to look for, e.g. 'd' for directory.
+     The usual searchstrings (shell patterns followed by
+     '-maxdepth', '-name' and '-not -name' tests) are evaluated
+     in-process via discovery_lib.find_entries, without running
+     'find'; other searchstrings are passed on to 'find'.
      Input:
       dir: String of the directory name where it should look for the files.
       searchstring: String of what 'find' should search for
@@ -160,7 +225,7 @@ def find_file_dir_name(dir, searchstring, type, depth=None):
   """
   status = 0
   if (depth is None):
-    cmd = 'cd '+dir+'; find '+searchstring+' -type '+type
+    search = parse_find_searchstring(searchstring)
   else:
     try:
       depth = int(depth)
@@ -168,10 +233,17 @@ def find_file_dir_name(dir, searchstring, type, depth=None):
       errormsg = "input argument 'depth' must be an integer number!"
       print errormsg
       raise SystemExit()
-    #cmd = 'cd '+dir+'; find '+searchstring+' -maxdepth '+str(depth)+' -type '+type
-    cmd = 'cd '+dir+'; find -maxdepth '+str(depth)+' -name "'+searchstring+'" -type '+type
-  files = commands.getoutput(cmd)
-  if (files.rfind("No such file or directory") >= 0 or files == ""):
+    search = (['.'], [searchstring], [], depth)
+  if (search is None):
+    # Searchstring with other tests/actions, let 'find' evaluate it:
+    cmd = 'cd '+dir+'; find '+searchstring+' -type '+type
+    files = commands.getoutput(cmd)
+    if (files.rfind("No such file or directory") >= 0):
+      files = ""
+  else:
+    (patterns, names, excludes, maxdepth) = search
+    files = '\n'.join(find_entries(dir, patterns, names=names, excludes=excludes, type=type, maxdepth=maxdepth))
+  if (files == ""):
     errormsg = 'ERROR: Could not find any '
     if (type == 'd'): 
       errormsg = errormsg+'directory'
@@ -185,6 +257,44 @@ def find_file_dir_name(dir, searchstring, type, depth=None):
   return files, status
 
 
+def parse_find_searchstring(searchstring):
+  """
+     This routine splits a searchstring for the shell command 'find'
+     into the arguments of discovery_lib.find_entries.
+     Input:
+      searchstring: String of what 'find' should search for, e.g.
+        '*.stat -maxdepth 0 -not -name "*checkpoint*"'
+     Output:
+      search: Tuple of (patterns, names, excludes, maxdepth), or None
+        if the searchstring contains anything else than shell patterns
+        followed by '-maxdepth', '-name' and '-not -name' tests
+  """
+  try:
+    tokens = shlex.split(searchstring)
+  except ValueError:
+    return None
+  patterns = []; names = []; excludes = []; maxdepth = None
+  i = 0
+  while (i < len(tokens)):
+    if (tokens[i] == '-maxdepth' and i+1 < len(tokens) and tokens[i+1].isdigit()):
+      maxdepth = int(tokens[i+1])
+      i = i+2
+    elif (tokens[i] == '-name' and i+1 < len(tokens)):
+      names.append(tokens[i+1])
+      i = i+2
+    elif (tokens[i] in ['-not', '!'] and i+2 < len(tokens) and tokens[i+1] == '-name'):
+      excludes.append(tokens[i+2])
+      i = i+3
+    elif (not tokens[i].startswith('-') and not (names or excludes or not (maxdepth is None))):
+      patterns.append(tokens[i])
+      i = i+1
+    else:
+      return None
+  if (len(patterns) == 0):
+    patterns = ['.']
+  return patterns, names, excludes, maxdepth
+
+
 def find_dir_names(dir, searchstring, depth=None):
   dirname = []
   (dirs, status) = find_file_dir_name(dir, searchstring, 'd', depth)
@@ -231,19 +341,35 @@ def find_file_names(dir, searchstring, depth=None):
 
 
 def get_file_names(searchstring):
+  """
+     This routine lists the files that match the searchstring, just
+     like 'ls searchstring', and returns their names without the
+     directory. The files are found in-process via discovery_lib,
+     without running 'ls'.
+     Input:
+      searchstring: String of a shell pattern, e.g. 'dir/*.stat'
+     Output:
+      files: List of strings with the found filenames
+      status: Status is 0 when file were found that match the searchstring,
+        and 1 if no such files were found.
+  """
   status = 0
   filename = []
-  files = commands.getoutput('ls '+searchstring)
-  files = files.split('\n')
-  for i in files:
-    try:
-      file = i.split('/')[-1]
-    except:
-      file = i
-    filename.append(file)
+  if (len(searchstring.split()) == 1):
+    for (path, entry_type) in glob_entries('.', searchstring):
+      if (os.path.isdir(path)):
+        # Like 'ls', list the content of directories:
+        filename.extend([entry[0] for entry in (directory_cache.get_listing(path) or []) if (not entry[0].startswith('.'))])
+      else:
+        filename.append(path.split('/')[-1])
+  else:
+    files = commands.getoutput('ls '+searchstring)
+    for i in files.split('\n'):
+      if (i.find("No such file or directory") < 0 and i != ''):
+        filename.append(i.split('/')[-1])
   # Removing duplicates in filename:
   correct_filename = list(set(filename))
-  if (correct_filename[0].find("No such file or directory") >= 0):
+  if (len(correct_filename) == 0):
     # Error occured:
     errormsg = 'Error: Trying to find files with '+searchstring+' but none were found!'
     printc(errormsg, 'red', False); print
@@ -417,6 +543,46 @@ def get_csv_sepcharacter(filename):
 # From stat files #
 ###################
 
+# Get filenames of stat file(s):
+def get_stat_filenames(statfilename):
+  """
+     returns the filenames of the .stat files to read,
+     which is either the .stat file itself, or the files listed
+     in 'statfilename' if it is a file containing a list of
+     .stat files in the directory 'statfiles/'
+  """
+  if (statfilename.startswith('statfiles/list_')):
+    f = open(statfilename)
+    statfiles = [filename.rstrip('\n') for filename in f.readlines() if filename.strip()]
+    f.close()
+    return statfiles
+  else:
+    return [statfilename]
+
+
+# Get a column from stat file(s):
+def read_column_from_stat(statfilename, *keys):
+  """
+     reads the column of the given keys from a .stat file
+     and stores it in an one-dimensional array, e.g.
+     read_column_from_stat(statfilename, 'fluid', 'Pressure', 'min').
+     Every .stat file is parsed only once and kept in memory
+     (see stat_lib.get_stat_file), such that reading several
+     quantities of the same file is cheap.
+     input: is a file containing a list of .stat files
+     in the directory 'statfiles/'
+     output: one-dimensional numpy array (not a list), which is
+     a copy and may be changed without affecting the cached file
+  """
+  columns = [get_stat_file(filename).get(*keys) for filename in get_stat_filenames(statfilename)]
+  if (len(columns) == 0):
+    return array([])
+  elif (len(columns) == 1):
+    # Copy, the cached array is shared by all readers of the file:
+    return columns[0].copy()
+  return concatenate(columns)
+
+
 # Get time from stat file(s):
 def read_time_from_stat(statfilename):
   """
@@ -424,24 +590,9 @@ def read_time_from_stat(statfilename):
      an one-dimensional array 'time'
      input: is a file containing a list of .stat files
      in the directory 'statfiles/'
+     output: numpy array (not a list), which may be changed
   """
-  #Initialising time as an empty array:
-  time = []
-  # Get string-array with stat filenames:
-  if (statfilename.startswith('statfiles/list_')):
-    f = open(statfilename)
-    statfiles = f.readlines()
-    f.close()
-    # Read in time values, append them to 'time'
-    # over all .stat files listed in 'statlistfilename'
-    for filename in statfiles:
-        filename = filename[0:len(filename)-1]
-        stat = fluidity_tools.stat_parser(filename)
-        time.extend(stat['ElapsedTime']['value'])
-  else:
-    stat = fluidity_tools.stat_parser(statfilename)
-    time.extend(stat['ElapsedTime']['value'])
-  return time
+  return read_column_from_stat(statfilename, 'ElapsedTime', 'value')
 
 
 # Get timestep from stat file(s):
@@ -451,24 +602,9 @@ def read_timestep_from_stat(statfilename):
      an one-dimensional array 'timestep'
      input: is a file containing a list of .stat files
      in the directory 'statfiles/'
+     output: numpy array (not a list), which may be changed
   """
-  #Initialising timestep as an empty array:
-  timestep = []
-  # Get string-array with stat filenames:
-  if (statfilename.startswith('statfiles/list_')):
-    f = open(statfilename)
-    statfiles = f.readlines()
-    f.close()
-    # Read in timestep values, append them to 'timestep'
-    # over all .stat files listed in 'statlistfilename'
-    for filename in statfiles:
-        filename = filename[0:len(filename)-1]
-        stat = fluidity_tools.stat_parser(filename)
-        timestep.extend(stat['dt']['value'])
-  else:
-    stat = fluidity_tools.stat_parser(statfilename)
-    timestep.extend(stat['dt']['value'])
-  return timestep
+  return read_column_from_stat(statfilename, 'dt', 'value')
 
 
 # Get walltime from stat file(s):
@@ -480,33 +616,19 @@ def read_walltime_from_stat(statfilename, totalwt=False):
       statfilename: String of the statfile
       totalwt: locigal, if True, the overall walltime is computed
         otherwise the walltime of each timestep is given back.
-     
+     output: numpy array (not a list), which may be changed
   """
-  #Initialising walltime as an empty array:
-  walltime = []; walltime_tmp = []
-  # Get string-array with stat filenames:
-  if (statfilename.startswith('statfiles/list_')):
-    f = open(statfilename)
-    statfiles = f.readlines()
-    f.close()
-    # Read in time values, append them to 'time'
-    # over all .stat files listed in 'statlistfilename'
-    for filename in statfiles:
-        filename = filename[0:len(filename)-1]
-        stat = fluidity_tools.stat_parser(filename)
-        if (totalwt):
-          # if totalwt == True, then compute the total walltime
-          # of all (checkpointed) statfiles
-          walltime_tmp = stat['ElapsedWallTime']['value']
-          if (walltime):
-            walltime_tmp = walltime_tmp + walltime[-1]
-          walltime.extend(walltime_tmp)
-        else:
-          walltime.extend(stat['ElapsedWallTime']['value'])
-  else:
-    stat = fluidity_tools.stat_parser(statfilename)
-    walltime.extend(stat['ElapsedWallTime']['value'])
-  return walltime
+  walltime = []
+  for filename in get_stat_filenames(statfilename):
+    walltime_tmp = get_stat_file(filename).get('ElapsedWallTime', 'value')
+    if (totalwt and walltime and len(walltime[-1]) > 0):
+      # if totalwt == True, then compute the total walltime
+      # of all (checkpointed) statfiles
+      walltime_tmp = walltime_tmp + walltime[-1][-1]
+    walltime.append(walltime_tmp)
+  if (len(walltime) == 0):
+    return array([])
+  return concatenate(walltime)
 
 
 # Correcting the walltime in a statfile that was merged from several statfiles:
@@ -553,24 +675,9 @@ def read_num_of_nodes_from_stat(statfilename):
      an one-dimensional array 'num_nodes'
      input: is a file containing a list of .stat files
      in the directory 'statfiles/'
+     output: numpy array (not a list), which may be changed
   """
-  #Initialising num_nodes as an empty array:
-  num_nodes = []
-  # Get string-array with stat filenames:
-  if (statfilename.startswith('statfiles/list_')):
-    f = open(statfilename)
-    statfiles = f.readlines()
-    f.close()
-    # Read in time values, append them to 'time'
-    # over all .stat files listed in 'statlistfilename'
-    for filename in statfiles:
-        filename = filename[0:len(filename)-1]
-        stat = fluidity_tools.stat_parser(filename)
-        num_nodes.extend(stat['CoordinateMesh']['nodes'])
-  else:
-    stat = fluidity_tools.stat_parser(statfilename)
-    num_nodes.extend(stat['CoordinateMesh']['nodes'])
-  return num_nodes
+  return read_column_from_stat(statfilename, 'CoordinateMesh', 'nodes')
 
 
 # Get number of elements from stat file(s):
@@ -580,24 +687,9 @@ def read_num_of_elements_from_stat(statfilename):
      an one-dimensional array 'num_elem'
      input: is a file containing a list of .stat files
      in the directory 'statfiles/'
+     output: numpy array (not a list), which may be changed
   """
-  #Initialising num_elem as an empty array:
-  num_elem = []
-  # Get string-array with stat filenames:
-  if (statfilename.startswith('statfiles/list_')):
-    f = open(statfilename)
-    statfiles = f.readlines()
-    f.close()
-    # Read in time values, append them to 'time'
-    # over all .stat files listed in 'statlistfilename'
-    for filename in statfiles:
-        filename = filename[0:len(filename)-1]
-        stat = fluidity_tools.stat_parser(filename)
-        num_elem.extend(stat['CoordinateMesh']['elements'])
-  else:
-    stat = fluidity_tools.stat_parser(statfilename)
-    num_elem.extend(stat['CoordinateMesh']['elements'])
-  return num_elem
+  return read_column_from_stat(statfilename, 'CoordinateMesh', 'elements')
 
 
 # Get u from stat file(s):
@@ -607,25 +699,10 @@ def read_u_from_stat(statfilename):
      an two-dimensional array 'u'
      input: is a file containing a list of .stat files
      in the directory 'statfiles/'
+     output: numpy arrays of the minimum and maximum (not lists)
   """
-  #Initialising pmin and pmax as empty arrays:
-  umin = []; umax=[]
-  # Get string-array with stat filenames:
-  if (statfilename.startswith('statfiles/list_')):
-    f = open(statfilename)
-    statfiles = f.readlines()
-    f.close()
-    # Read in time values, append them to 'time'
-    # over all .stat files listed in 'statlistfilename'
-    for filename in statfiles:
-        filename = filename[0:len(filename)-1]
-        stat = fluidity_tools.stat_parser(filename)
-        umin.extend(stat['fluid']['Velocity%magnitude']['min'])
-        umax.extend(stat['fluid']['Velocity%magnitude']['max'])
-  else:
-    stat = fluidity_tools.stat_parser(statfilename)
-    umin.extend(stat['fluid']['Velocity%magnitude']['min'])
-    umax.extend(stat['fluid']['Velocity%magnitude']['max'])
+  umin = read_column_from_stat(statfilename, 'fluid', 'Velocity%magnitude', 'min')
+  umax = read_column_from_stat(statfilename, 'fluid', 'Velocity%magnitude', 'max')
   return umin, umax
 
 
@@ -636,25 +713,10 @@ def read_p_from_stat(statfilename):
      an two-dimensional array 'p'
      input: is a file containing a list of .stat files
      in the directory 'statfiles/'
+     output: numpy arrays of the minimum and maximum (not lists)
   """
-  #Initialising pmin and pmax as empty arrays:
-  pmin = []; pmax=[]
-  # Get string-array with stat filenames:
-  if (statfilename.startswith('statfiles/list_')):
-    f = open(statfilename)
-    statfiles = f.readlines()
-    f.close()
-    # Read in time values, append them to 'time'
-    # over all .stat files listed in 'statlistfilename'
-    for filename in statfiles:
-        filename = filename[0:len(filename)-1]
-        stat = fluidity_tools.stat_parser(filename)
-        pmin.extend(stat['fluid']['Pressure']['min'])
-        pmax.extend(stat['fluid']['Pressure']['max'])
-  else:
-    stat = fluidity_tools.stat_parser(statfilename)
-    pmin.extend(stat['fluid']['Pressure']['min'])
-    pmax.extend(stat['fluid']['Pressure']['max'])
+  pmin = read_column_from_stat(statfilename, 'fluid', 'Pressure', 'min')
+  pmax = read_column_from_stat(statfilename, 'fluid', 'Pressure', 'max')
   return pmin, pmax
 
 
@@ -665,24 +727,9 @@ def read_p_l2norm_from_stat(statfilename):
      and stores it in an one-dimensional array 'p_l2norm'
      input: is a file containing a list of .stat files
      in the directory 'statfiles/'
+     output: numpy array (not a list), which may be changed
   """
-  #Initialising pmin and pmax as empty arrays:
-  p_l2norm = []
-  # Get string-array with stat filenames:
-  if (statfilename.startswith('statfiles/list_')):
-    f = open(statfilename)
-    statfiles = f.readlines()
-    f.close()
-    # Read in time values, append them to 'time'
-    # over all .stat files listed in 'statlistfilename'
-    for filename in statfiles:
-        filename = filename[0:len(filename)-1]
-        stat = fluidity_tools.stat_parser(filename)
-        p_l2norm.extend(stat['fluid']['Pressure']['l2norm'])
-  else:
-    stat = fluidity_tools.stat_parser(statfilename)
-    p_l2norm.extend(stat['fluid']['Pressure']['l2norm'])
-  return p_l2norm
+  return read_column_from_stat(statfilename, 'fluid', 'Pressure', 'l2norm')
 
 
 # Get p from stat file(s):
@@ -692,24 +739,9 @@ def read_p_int_from_stat(statfilename):
      and stores it in an one-dimensional array 'p_int'
      input: is a file containing a list of .stat files
      in the directory 'statfiles/'
+     output: numpy array (not a list), which may be changed
   """
-  #Initialising pmin and pmax as empty arrays:
-  p_int = []
-  # Get string-array with stat filenames:
-  if (statfilename.startswith('statfiles/list_')):
-    f = open(statfilename)
-    statfiles = f.readlines()
-    f.close()
-    # Read in time values, append them to 'time'
-    # over all .stat files listed in 'statlistfilename'
-    for filename in statfiles:
-        filename = filename[0:len(filename)-1]
-        stat = fluidity_tools.stat_parser(filename)
-        p_int.extend(stat['fluid']['Pressure']['integral'])
-  else:
-    stat = fluidity_tools.stat_parser(statfilename)
-    p_int.extend(stat['fluid']['Pressure']['integral'])
-  return p_int
+  return read_column_from_stat(statfilename, 'fluid', 'Pressure', 'integral')
 
 
 # Get integral of specific vector component of solidforce from stat file(s):
@@ -720,6 +752,7 @@ def read_int_solidforce_comp_from_stat(statfilename, solidname='', component=1):
      an one-dimensional array 'int_solidforce_comp'
      input: is a file containing a list of .stat files
      in the directory 'statfiles/'
+     output: numpy array (not a list), which may be changed
   """
   if (component=='x' or component==1 or component=='1'):
     comp='1'
@@ -729,24 +762,7 @@ def read_int_solidforce_comp_from_stat(statfilename, solidname='', component=1):
     comp='3'
   else:
     comp='1'
-
-  #Initialising int_solidforce_comp as empty arrays:
-  int_solidforce_comp = []
-  # Get string-array with stat filenames:
-  if (statfilename.startswith('statfiles/list_')):
-    f = open(statfilename)
-    statfiles = f.readlines()
-    f.close()
-    # Read in the values
-    # over all .stat files listed in 'statlistfilename'
-    for filename in statfiles:
-        filename = filename[0:len(filename)-1]
-        stat = fluidity_tools.stat_parser(filename)
-        int_solidforce_comp.extend(stat['fluid'][solidname+'SolidForce%'+str(comp)]['integral'])
-  else:
-    stat = fluidity_tools.stat_parser(statfilename)
-    int_solidforce_comp.extend(stat['fluid'][solidname+'SolidForce%'+str(comp)]['integral'])
-  return int_solidforce_comp
+  return read_column_from_stat(statfilename, 'fluid', solidname+'SolidForce%'+str(comp), 'integral')
 
 
 # Get integral of solidconcentration from stat file(s):
@@ -757,24 +773,9 @@ def read_int_solidconcentration_from_stat(statfilename, solidname=''):
      an one-dimensional array 'int_alpha'
      input: is a file containing a list of .stat files
      in the directory 'statfiles/'
+     output: numpy array (not a list), which may be changed
   """
-  #Initialising int_alpha as empty arrays:
-  int_alpha = []
-  # Get string-array with stat filenames:
-  if (statfilename.startswith('statfiles/list_')):
-    f = open(statfilename)
-    statfiles = f.readlines()
-    f.close()
-    # Read in the values
-    # over all .stat files listed in 'statlistfilename'
-    for filename in statfiles:
-        filename = filename[0:len(filename)-1]
-        stat = fluidity_tools.stat_parser(filename)
-        int_alpha.extend(stat['fluid'][solidname+'SolidConcentration']['integral'])
-  else:
-    stat = fluidity_tools.stat_parser(statfilename)
-    int_alpha.extend(stat['fluid'][solidname+'SolidConcentration']['integral'])
-  return int_alpha
+  return read_column_from_stat(statfilename, 'fluid', solidname+'SolidConcentration', 'integral')
 
 
 # Get drag force (IMB) from stat file(s):
@@ -785,22 +786,9 @@ def read_immersed_df_from_stat(statfilename):
      an one-dimensional array 'df'
      input: is a file containing a list of .stat files
      in the directory 'statfiles/'
+     output: numpy array (not a list), which may be changed
   """
-  #Initialising df as an empty array:
-  df = []
-  # Get string-array with stat filenames:
-  if (statfilename.startswith('statfiles/list_')):
-    f = open(statfilename)
-    statfiles = f.readlines()
-    f.close()
-    for filename in statfiles:
-        filename = filename[0:len(filename)-1]
-        stat = fluidity_tools.stat_parser(filename)
-        df.extend(stat['Force1']['Value'])
-  else:
-    stat = fluidity_tools.stat_parser(statfilename)
-    df.extend(stat['Force1']['Value'])
-  return df
+  return read_column_from_stat(statfilename, 'Force1', 'Value')
 
 
 # Get drag force (FSI Model) from stat file(s):
@@ -811,22 +799,9 @@ def read_fsi_model_df_from_stat(statfilename, component=1, solidmeshname=''):
      an one-dimensional array 'df'
      input: is a file containing a list of .stat files
      in the directory 'statfiles/'
+     output: numpy array (not a list), which may be changed
   """
-  #Initialising df as an empty array:
-  df = []
-  # Get string-array with stat filenames:
-  if (statfilename.startswith('statfiles/list_')):
-    f = open(statfilename)
-    statfiles = f.readlines()
-    f.close()
-    for filename in statfiles:
-        filename = filename[0:len(filename)-1]
-        stat = fluidity_tools.stat_parser(filename)
-        df.extend(stat['ForceOnSolid_'+str(solidmeshname)+str(component)]['Value'])
-  else:
-    stat = fluidity_tools.stat_parser(statfilename)
-    df.extend(stat['ForceOnSolid_'+str(solidmeshname)+str(component)]['Value'])
-  return df
+  return read_column_from_stat(statfilename, 'ForceOnSolid_'+str(solidmeshname)+str(component), 'Value')
 
 
 # Get drag force (void) from stat file(s):
@@ -837,22 +812,9 @@ def read_void_df_from_stat(statfilename, surfacename, component=1):
      an one-dimensional array ''
      input: is a file containing a list of .stat files
      in the directory 'statfiles/'
+     output: numpy array (not a list), which may be changed
   """
-  #Initialising time as an empty array:
-  df = []
-  # Get string-array with stat filenames:
-  if (statfilename.startswith('statfiles/list_')):
-    f = open(statfilename)
-    statfiles = f.readlines()
-    f.close()
-    for filename in statfiles:
-        filename = filename[0:len(filename)-1]
-        stat = fluidity_tools.stat_parser(filename)
-        df.extend(stat['fluid']['Velocity']['force_'+surfacename+'%'+str(component)])
-  else:
-    stat = fluidity_tools.stat_parser(statfilename)
-    df.extend(stat['fluid']['Velocity']['force_'+surfacename+'%'+str(component)])
-  return df
+  return read_column_from_stat(statfilename, 'fluid', 'Velocity', 'force_'+surfacename+'%'+str(component))
 
 
 # Get pressure component of drag force (void) from stat file(s):
@@ -863,22 +825,9 @@ def read_void_df_pressurecomponent_from_stat(statfilename, surfacename, componen
      an one-dimensional array ''
      input: is a file containing a list of .stat files
      in the directory 'statfiles/'
+     output: numpy array (not a list), which may be changed
   """
-  #Initialising time as an empty array:
-  df_pcmp = []
-  # Get string-array with stat filenames:
-  if (statfilename.startswith('statfiles/list_')):
-    f = open(statfilename)
-    statfiles = f.readlines()
-    f.close()
-    for filename in statfiles:
-        filename = filename[0:len(filename)-1]
-        stat = fluidity_tools.stat_parser(filename)
-        df_pcmp.extend(stat['fluid']['Velocity']['pressure_force_'+surfacename+'%'+str(component)])
-  else:
-    stat = fluidity_tools.stat_parser(statfilename)
-    df_pcmp.extend(stat['fluid']['Velocity']['pressure_force_'+surfacename+'%'+str(component)])
-  return df_pcmp
+  return read_column_from_stat(statfilename, 'fluid', 'Velocity', 'pressure_force_'+surfacename+'%'+str(component))
 
 
 # Get viscous component of drag force (void) from stat file(s):
@@ -889,22 +838,9 @@ def read_void_df_viscouscomponent_from_stat(statfilename, surfacename, component
      an one-dimensional array ''
      input: is a file containing a list of .stat files
      in the directory 'statfiles/'
+     output: numpy array (not a list), which may be changed
   """
-  #Initialising time as an empty array:
-  df_vsccmp = []
-  # Get string-array with stat filenames:
-  if (statfilename.startswith('statfiles/list_')):
-    f = open(statfilename)
-    statfiles = f.readlines()
-    f.close()
-    for filename in statfiles:
-        filename = filename[0:len(filename)-1]
-        stat = fluidity_tools.stat_parser(filename)
-        df_vsccmp.extend(stat['fluid']['Velocity']['viscous_force_'+surfacename+'%'+str(component)])
-  else:
-    stat = fluidity_tools.stat_parser(statfilename)
-    df_vsccmp.extend(stat['fluid']['Velocity']['viscous_force_'+surfacename+'%'+str(component)])
-  return df_vsccmp
+  return read_column_from_stat(statfilename, 'fluid', 'Velocity', 'viscous_force_'+surfacename+'%'+str(component))
 
 
 # Get dragforce from file 'drag_force':
@@ -942,15 +878,15 @@ def read_position_from_detector(detfilename, detname):
     f.close()
     for filename in detfiles:
         filename = filename[0:len(filename)-1]
-        detectors = fluidity_tools.stat_parser(filename)
+        detectors = get_stat_file(filename)
         if (len(pos) == 0):
-            pos = detectors[detname]['position']
+            pos = detectors.get(detname, 'position')
         else:
-            pos = column_stack((pos,detectors[detname]['position']))
+            pos = column_stack((pos,detectors.get(detname, 'position')))
   else:
     # Get velocity
-    detectors = fluidity_tools.stat_parser(detfilename)
-    pos = detectors[detname]['position']
+    detectors = get_stat_file(detfilename)
+    pos = detectors.get(detname, 'position').copy()
   return pos
 
 # Get pressure from detector with name 'detname':
@@ -970,12 +906,12 @@ def read_pressure_from_detector(detfilename, detname):
     f.close()
     for filename in detfiles:
         filename = filename[0:len(filename)-1]
-        detectors = fluidity_tools.stat_parser(filename)
-        p.extend(detectors['fluid']['Pressure'][detname])
+        detectors = get_stat_file(filename)
+        p.extend(detectors.get('fluid', 'Pressure', detname))
   else:
     # Get pressure
-    detectors = fluidity_tools.stat_parser(detfilename)
-    p = detectors['fluid']['Pressure'][detname]
+    detectors = get_stat_file(detfilename)
+    p = detectors.get('fluid', 'Pressure', detname).copy()
   return p
 
 # Get velocity from detector with name 'detname':
@@ -995,15 +931,15 @@ def read_velocity_from_detector(detfilename, detname):
     f.close()
     for filename in detfiles:
         filename = filename[0:len(filename)-1]
-        detectors = fluidity_tools.stat_parser(filename)
+        detectors = get_stat_file(filename)
         if (len(v) == 0):
-            v = detectors['fluid']['Velocity'][detname]
+            v = detectors.get('fluid', 'Velocity', detname)
         else:
-            v = column_stack((v,detectors['fluid']['Velocity'][detname]))
+            v = column_stack((v,detectors.get('fluid', 'Velocity', detname)))
   else:
     # Get velocity
-    detectors = fluidity_tools.stat_parser(detfilename)
-    v = detectors['fluid']['Velocity'][detname]
+    detectors = get_stat_file(detfilename)
+    v = detectors.get('fluid', 'Velocity', detname).copy()
   return v
 
 # Get SolidVolumeFraction from detector with name 'detname':
@@ -1023,12 +959,12 @@ def read_solid_volumefraction_from_detector(detfilename, detname):
     f.close()
     for filename in detfiles:
         filename = filename[0:len(filename)-1]
-        detectors = fluidity_tools.stat_parser(filename)
-        alpha.extend(detectors['fluid']['SolidConcentration'][detname])
+        detectors = get_stat_file(filename)
+        alpha.extend(detectors.get('fluid', 'SolidConcentration', detname))
   else:
     # Get volume fraction:
-    detectors = fluidity_tools.stat_parser(detfilename)
-    alpha = detectors["fluid"]["SolidConcentration"][detname]
+    detectors = get_stat_file(detfilename)
+    alpha = detectors.get('fluid', 'SolidConcentration', detname).copy()
   return alpha
 
 
@@ -1040,22 +976,9 @@ def read_fsi_model_solidvolume_from_stat(statfilename, solidmeshname):
      an one-dimensional array 'solidvolume'
      input: is a file containing a list of .stat files
      in the directory 'statfiles/'
+     output: numpy array (not a list), which may be changed
   """
-  #Initialising solidvolume as an empty array:
-  solidvolume = []
-  # Get string-array with stat filenames:
-  if (statfilename.startswith('statfiles/list_')):
-    f = open(statfilename)
-    statfiles = f.readlines()
-    f.close()
-    for filename in statfiles:
-        filename = filename[0:len(filename)-1]
-        stat = fluidity_tools.stat_parser(filename)
-        solidvolume.extend(stat['VolumeOfSolid_'+str(solidmeshname)]['Value'])
-  else:
-    stat = fluidity_tools.stat_parser(statfilename)
-    solidvolume.extend(stat['VolumeOfSolid_'+str(solidmeshname)]['Value'])
-  return solidvolume
+  return read_column_from_stat(statfilename, 'VolumeOfSolid_'+str(solidmeshname), 'Value')
 
 
 ######################
@@ -0,0 +1,208 @@
+import os
+import json
+import threading
+
+
+
+class StateJournal:
+  """ A class for storing the state of all simulations crash-safely, such
+      that the monitoring can be continued where it stopped. Every change
+      of the state of a simulation is recorded as one line of JSON
+      (a state transition, holding only the properties that changed) in
+      an append-only journal file. The records are collected in memory and
+      written to the journal in one go with 'flush', which is done once
+      per round of monitoring and flushed to disk (fsync) only once.
+      Once the journal holds 'compact_after' records, the full state of
+      all simulations is written to a snapshot file and the journal starts
+      anew. Both files are JSON:
+       snapshot: {"seq": <last record>, "states": {dir: {property: value}}}
+       journal: {"seq": <record>, "dir": dir, "properties": {property: value}}
+      On restart, 'replay' loads the snapshot and applies the records of the
+      journal that came after it. An incomplete last line of the journal
+      (the program was killed while writing it) is ignored and removed.
+  """
+  def __init__(self, journal_dir='logfiles', compact_after=1000):
+    """
+        Constructor with 2 optional input arguments:
+        Input:
+         journal_dir: String of the directory of the journal and snapshot
+           files (Default: 'logfiles')
+         compact_after: Integer of the number of records in the journal,
+           after which it is compacted into the snapshot (Default: 1000)
+    """
+    self.journal_filename = os.path.join(journal_dir, 'state_journal.jsonl')
+    self.snapshot_filename = os.path.join(journal_dir, 'state_snapshot.json')
+    self.compact_after = compact_after
+    # Latest recorded state of every simulation, dir : {property : value}:
+    self.states = {}
+    # Records not written to the journal yet:
+    self.pending = []
+    # Number of the last record, and number of records in the journal file:
+    self.seq = 0
+    self.nrecords = 0
+    # Whether the journal file was checked for an incomplete last line:
+    self.repaired = False
+    self.lock = threading.Lock()
+
+
+  def exists(self):
+    """ Returns True if there is a journal or snapshot of a previous run.
+    """
+    return os.path.isfile(self.journal_filename) or os.path.isfile(self.snapshot_filename)
+
+
+  def has(self, dir):
+    """ Returns True if the state of the simulation in 'dir' was recorded.
+    """
+    with self.lock:
+      return dir in self.states
+
+
+  def record(self, dir, properties):
+    """ This method records the state of a simulation, only the properties
+        that changed since the last record of this simulation make it into
+        the journal. The record is written with the next 'flush'.
+        Input:
+         dir: String of the directory name the simulation sits in
+         properties: Dictionary of all properties of the simulation
+    """
+    with self.lock:
+      state = self.states.setdefault(dir, {})
+      changes = dict([(name, value) for (name, value) in properties.items() if (not (name in state) or state[name] != value)])
+      if (not changes):
+        return
+      state.update(changes)
+      self.seq = self.seq + 1
+      self.pending.append({'seq' : self.seq, 'dir' : dir, 'properties' : changes})
+
+
+  def flush(self):
+    """ This method appends all pending records to the journal file and
+        flushes it to disk, and compacts the journal into the snapshot if
+        it holds 'compact_after' records.
+    """
+    with self.lock:
+      if (not self.repaired):
+        self.repair()
+      if (self.pending):
+        lines = ''.join([json.dumps(record)+'\n' for record in self.pending])
+        f = open(self.journal_filename, 'ab')
+        try:
+          f.write(lines)
+          f.flush()
+          os.fsync(f.fileno())
+        finally:
+          f.close()
+        self.nrecords = self.nrecords + len(self.pending)
+        self.pending = []
+      if (self.nrecords >= self.compact_after):
+        self.compact()
+
+
+  def compact(self):
+    """ This method writes the current state of all simulations to the
+        snapshot file and empties the journal. It must be called with
+        'self.lock' held, and without pending records.
+        As the snapshot knows the number of the last record it contains,
+        the state is correct even if the program stops between writing the
+        snapshot and emptying the journal.
+    """
+    tmp_filename = self.snapshot_filename+'.tmp'
+    f = open(tmp_filename, 'wb')
+    try:
+      f.write(json.dumps({'seq' : self.seq, 'states' : self.states}))
+      f.flush()
+      os.fsync(f.fileno())
+    finally:
+      f.close()
+    os.rename(tmp_filename, self.snapshot_filename)
+    f = open(self.journal_filename, 'wb')
+    try:
+      os.fsync(f.fileno())
+    finally:
+      f.close()
+    self.nrecords = 0
+
+
+  def repair(self):
+    """ This method removes an incomplete last line from the journal file,
+        such that new records start on a line of their own. It must be
+        called with 'self.lock' held.
+    """
+    self.repaired = True
+    if (not os.path.isfile(self.journal_filename)):
+      return
+    f = open(self.journal_filename, 'r+b')
+    try:
+      size = os.fstat(f.fileno()).st_size
+      # Find the end of the last complete line:
+      end = size
+      while (end > 0):
+        f.seek(max(0, end-4096))
+        data = f.read(end-max(0, end-4096))
+        index = data.rfind('\n')
+        if (index >= 0):
+          end = max(0, end-4096)+index+1
+          break
+        end = max(0, end-4096)
+      if (end < size):
+        f.truncate(end)
+        f.flush()
+        os.fsync(f.fileno())
+    finally:
+      f.close()
+
+
+  def replay(self):
+    """ This method reads in the state of all simulations from the snapshot
+        and the journal.
+        Output:
+         states: Dictionary of dir : {property : value} of all simulations
+           whose state was recorded
+    """
+    with self.lock:
+      self.states = {}
+      self.seq = 0
+      self.nrecords = 0
+      if (os.path.isfile(self.snapshot_filename)):
+        f = open(self.snapshot_filename, 'rb')
+        try:
+          snapshot = json.load(f)
+        finally:
+          f.close()
+        self.seq = snapshot['seq']
+        for (dir, state) in snapshot['states'].items():
+          self.states[str(dir)] = decode_properties(state)
+      if (os.path.isfile(self.journal_filename)):
+        f = open(self.journal_filename, 'rb')
+        try:
+          for line in f:
+            try:
+              record = json.loads(line)
+            except ValueError:
+              break # incomplete last line
+            self.nrecords = self.nrecords + 1
+            if (record['seq'] <= self.seq):
+              continue # already in the snapshot
+            self.seq = record['seq']
+            self.states.setdefault(str(record['dir']), {}).update(decode_properties(record['properties']))
+        finally:
+          f.close()
+      return dict([(dir, dict(state)) for (dir, state) in self.states.items()])
+
+
+
+def decode_properties(properties):
+  """ Returns the properties read in from JSON with strings instead of
+      unicode strings, as they were recorded.
+      Input:
+       properties: Dictionary of property : value
+      Output:
+       properties: Dictionary of property : value
+  """
+  decoded = {}
+  for (name, value) in properties.items():
+    if (isinstance(value, unicode)):
+      value = value.encode('utf-8')
+    decoded[str(name)] = value
+  return decoded
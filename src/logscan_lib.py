@@ -0,0 +1,421 @@
+import os
+import re
+import glob
+import json
+import zlib
+
+
+# Default signatures of the log files of a simulation, in the order of their
+# priority, thus the first signature found determines the verdict.
+# Every signature is a dictionary with the keys:
+#  name: String identifying the signature
+#  pattern: String which is searched for in every line of the files
+#  regex: Boolean, True if 'pattern' is a regular expression, False if it
+#    is a plain string (Default: False)
+#  files: List of filenames/glob patterns (relative to the simulation's
+#    directory) which are searched for 'pattern'
+#  action: String of what a match means: 'error' (simulation crashed),
+#    'diskquota' (disk quota on the cluster exceeded), 'suspect' (the
+#    simulation might have crashed without an error message), or 'finished'
+#  clusters: List of substrings of cluster names the signature applies to,
+#    None for all clusters (Default: None)
+#  required: Boolean, if True the signature triggers if 'pattern' is NOT
+#    found in any of the files (Default: False)
+#  message: String of the message in case the signature triggered, which
+#    can contain '%(file)s' and '%(line)d'
+default_log_signatures = [
+  {'name' : 'collective_abort', 'pattern' : 'caused collective abort', 'files' : ['stdout'], 'action' : 'error',
+   'message' : "ERROR: 'Collective abort' found in file: %(file)s, line %(line)d"},
+  {'name' : 'stderr_error', 'pattern' : '*** ERROR ***', 'files' : ['stderr'], 'action' : 'error',
+   'message' : "ERROR: '*** ERROR ***' found in file: %(file)s, line %(line)d"},
+  {'name' : 'fluidity_error', 'pattern' : '*** ERROR ***', 'files' : ['fluidity.err-*'], 'action' : 'error',
+   'message' : "ERROR: '*** ERROR ***' found in file: %(file)s, line %(line)d"},
+  {'name' : 'fluidity_error_lowercase', 'pattern' : 'error', 'files' : ['fluidity.err-*'], 'action' : 'error',
+   'message' : "ERROR: 'error' found in file: %(file)s, line %(line)d"},
+  {'name' : 'stderr_error_colon', 'pattern' : 'ERROR:', 'files' : ['stderr'], 'action' : 'error',
+   'message' : "ERROR: 'ERROR:' found in file: %(file)s, line %(line)d"},
+  {'name' : 'executable_not_run', 'pattern' : 'cannot be run.', 'files' : ['stdout'], 'action' : 'error',
+   'message' : "ERROR: 'Executable could not be run' found in file: %(file)s, line %(line)d"},
+  {'name' : 'memory_exceeded', 'pattern' : 'PBS: job killed: mem.*exceeded limit', 'regex' : True, 'files' : ['stderr'], 'action' : 'error',
+   'message' : "ERROR: Memory limit was exceeded."},
+  {'name' : 'disk_quota', 'pattern' : 'Disk quota exceeded:', 'files' : ['stdout', 'stderr'], 'action' : 'diskquota',
+   'message' : "Disk quota exceeded, found in file: %(file)s, line %(line)d"},
+  {'name' : 'not_terminated_normally', 'pattern' : 'Job terminated normally', 'files' : ['stdout'], 'action' : 'suspect', 'clusters' : ['cx1'], 'required' : True,
+   'message' : "'Job terminated normally' not found in file: %(file)s"},
+  {'name' : 'aborting_job', 'pattern' : 'aborting job', 'files' : ['stdout'], 'action' : 'suspect', 'clusters' : ['cx2'],
+   'message' : "'aborting job' found in file: %(file)s, line %(line)d"},
+  {'name' : 'job_terminated', 'pattern' : 'terminated', 'files' : ['stdout'], 'action' : 'suspect', 'clusters' : ['cx2'],
+   'message' : "'terminated' found in file: %(file)s, line %(line)d"},
+  {'name' : 'job_killed', 'pattern' : 'Killed', 'files' : ['stdout'], 'action' : 'suspect', 'clusters' : ['cx2'],
+   'message' : "'Killed' found in file: %(file)s, line %(line)d"},
+  {'name' : 'steady_state', 'pattern' : 'Steady state has been attained, exiting the timestep loop', 'files' : ['fluidity.err-*'], 'action' : 'finished',
+   'message' : "Steady state has been attained, found in file: %(file)s, line %(line)d"}
+]
+
+
+
+class LogScanner:
+  """ A class for scanning the log files of a simulation (stdout, stderr,
+      fluidity.err-*, ...) for a table of signatures, e.g. error messages.
+      Every file is read only once, in chunks, and all signatures that
+      apply to that file are matched at once with a single compiled
+      alternation of their patterns. Lines matching that alternation are
+      then assigned to the individual signatures. The result is a verdict,
+      a dictionary holding the signature with the highest priority that
+      triggered, together with the file and line it was found in.
+      The scanner remembers up to which byte each file was scanned and
+      what was found there, thus log files that keep growing over the
+      monitoring rounds are only scanned for their new lines.
+  """
+  def __init__(self, signatures=None, chunksize=1048576, state_dir=None, fingerprintsize=4096):
+    """
+        Constructor with 4 optional input arguments:
+        Input:
+         signatures: List of signature dictionaries, see
+           default_log_signatures (Default: default_log_signatures)
+         chunksize: Integer of bytes read from a file at once
+           (Default: 1 MiB)
+         state_dir: String of the directory the scan states (offsets) of
+           the log files are stored in, such that they survive a restart,
+           None to keep them in memory only (Default: None)
+         fingerprintsize: Integer of bytes at the start of a file and before
+           its offset which are compared to recognise an appended file
+           (Default: 4096)
+    """
+    if (signatures is None):
+      signatures = default_log_signatures
+    self.chunksize = chunksize
+    self.state_dir = state_dir
+    self.fingerprintsize = fingerprintsize
+    # Scan states per log file, see 'get_file_state':
+    self.states = {}
+    # Directories of which the states were loaded from file:
+    self.loaded_dirs = set()
+    self.set_signatures(signatures)
+
+
+  def set_signatures(self, signatures):
+    """ Sets the table of signatures and compiles their patterns.
+        Input:
+         signatures: List of signature dictionaries, see
+           default_log_signatures
+    """
+    self.signatures = []
+    for signature in signatures:
+      signature = dict(signature)
+      signature.setdefault('regex', False)
+      signature.setdefault('clusters', None)
+      signature.setdefault('required', False)
+      signature.setdefault('message', signature['name']+' found in file: %(file)s, line %(line)d')
+      if (signature['regex']):
+        signature['expression'] = signature['pattern']
+      else:
+        signature['expression'] = re.escape(signature['pattern'])
+      signature['compiled'] = re.compile(signature['expression'])
+      self.signatures.append(signature)
+    # Compiled alternations per combination of signatures:
+    self.alternations = {}
+
+
+  def get_signatures(self, cluster_name=None, actions=None):
+    """ Returns the signatures that apply to the given cluster.
+        Input:
+         cluster_name: String of the name/address of the cluster, if None
+           the signatures of all clusters are returned
+         actions: List of actions of the signatures to return, if None
+           the signatures of all actions are returned
+        Output:
+         signatures: List of signature dictionaries
+    """
+    signatures = []
+    for signature in self.signatures:
+      if (not (actions is None) and not (signature['action'] in actions)):
+        continue
+      if (not (cluster_name is None) and not (signature['clusters'] is None)):
+        if (not any([cluster in cluster_name for cluster in signature['clusters']])):
+          continue
+      signatures.append(signature)
+    return signatures
+
+
+  def get_alternation(self, indices):
+    """ Returns the compiled alternation of the patterns of the signatures
+        with the given indices, with one named group per signature.
+        Input:
+         indices: Tuple of indices in self.signatures
+        Output:
+         alternation: Compiled regular expression
+    """
+    if (not (indices in self.alternations)):
+      expression = '|'.join(['(?P<s'+str(i)+'>'+self.signatures[i]['expression']+')' for i in indices])
+      self.alternations.update({indices : re.compile(expression)})
+    return self.alternations[indices]
+
+
+  def scan(self, dir, cluster_name=None, actions=None):
+    """ Scans the log files in 'dir' for all signatures that apply to the
+        given cluster, and returns a verdict. Files that were scanned
+        before are only scanned from where the previous scan stopped,
+        see 'get_file_state'.
+        Input:
+         dir: String of the directory the log files are in
+         cluster_name: String of the name/address of the cluster the
+           simulation ran on
+         actions: List of actions of the signatures to scan for, if None
+           all signatures are scanned for
+        Output:
+         verdict: Dictionary with the keys 'action', 'name', 'pattern',
+           'file', 'line', 'text' and 'message' of the signature with the
+           highest priority that triggered ('action' is None if none
+           triggered), and 'matches', a dictionary of signature name :
+           (file, line, text) of the first match of every signature found.
+    """
+    signatures = self.get_signatures(cluster_name=cluster_name, actions=actions)
+    # Find out which signatures apply to which file, such that every file
+    # is read only once. All signatures are matched, regardless of 'actions'
+    # and 'cluster_name', such that the offsets stay valid for all of them:
+    files = {}
+    for (index, signature) in enumerate(self.signatures):
+      for pattern in signature['files']:
+        for filename in sorted(glob.glob(os.path.join(dir, pattern))):
+          files.setdefault(filename, [])
+          if (not (index in files[filename])):
+            files[filename].append(index)
+    self.load_states(dir)
+    matches = {}
+    for filename in sorted(files.keys()):
+      filematches = self.scan_file(filename, tuple(sorted(files[filename])))
+      for (name, (lineno, text)) in filematches.items():
+        if (not (name in matches)):
+          matches.update({name : (filename, lineno, text)})
+    self.save_states(dir)
+    # Only report the signatures that were asked for:
+    names = [signature['name'] for signature in signatures]
+    matches = dict([(name, match) for (name, match) in matches.items() if name in names])
+    return self.get_verdict(dir, signatures, matches)
+
+
+  def scan_file(self, filename, indices):
+    """ Reads the file 'filename' in chunks, starting at the offset where
+        the previous scan of this file stopped, and records the first match
+        of every signature with the given indices.
+        Input:
+         filename: String of the file to scan
+         indices: Tuple of indices in self.signatures
+        Output:
+         matches: Dictionary of signature name : (line, text) of all
+           matches in this file, including the ones of previous scans
+    """
+    try:
+      logfile = open(filename, 'rb')
+    except IOError:
+      return {}
+    try:
+      state = self.get_file_state(filename, logfile)
+      matches = state['matches']
+      # Signatures that still have to be found in this file:
+      pending = [i for i in indices if not (self.signatures[i]['name'] in matches)]
+      if (pending):
+        alternation = self.get_alternation(tuple(pending))
+        logfile.seek(state['offset'])
+        lineno = state['lineno']; remainder = ''
+      while (pending):
+        chunk = logfile.read(self.chunksize)
+        if (not chunk):
+          # Last line without a trailing newline (yet), which is scanned
+          # again in the next scan:
+          if (remainder):
+            self.match_line(remainder, lineno, pending, matches)
+          break
+        # Only scan complete lines, the rest is prepended to the next chunk:
+        chunk = remainder+chunk
+        end = chunk.rfind('\n')+1
+        remainder = chunk[end:]
+        chunk = chunk[:end]
+        position = 0
+        while (pending):
+          match = alternation.search(chunk, position)
+          if (match is None):
+            break
+          linestart = chunk.rfind('\n', 0, match.start())+1
+          lineend = chunk.find('\n', match.start())
+          lineno = lineno+chunk.count('\n', position, linestart)
+          if (self.match_line(chunk[linestart:lineend], lineno, pending, matches) and pending):
+            # From now on, only search for the signatures not found yet:
+            alternation = self.get_alternation(tuple(pending))
+          # Continue with the next line:
+          lineno = lineno+1
+          position = lineend+1
+        # Complete lines up to here have been scanned:
+        lineno = lineno+chunk.count('\n', position)
+        state['offset'] = state['offset']+end
+        state['lineno'] = lineno
+      self.set_fingerprints(state, logfile)
+    finally:
+      logfile.close()
+    return matches
+
+
+  def get_file_state(self, filename, logfile):
+    """ Returns the scan state of the given file, meaning the offset of
+        the first byte which was not scanned yet, the number of the line
+        starting there, and the matches found before that offset. The
+        state is kept if the file was only appended to since the last
+        scan, which is assumed if its size did not shrink and either its
+        inode is the same, or (as rsync replaces files by new ones) the
+        checksums of its first bytes and of the bytes before the offset
+        did not change. Otherwise the file was truncated or replaced,
+        and the state is reset, such that the file is scanned from its
+        beginning.
+        Input:
+         filename: String of the file
+         logfile: File object of the file opened for reading
+        Output:
+         state: Dictionary with the keys 'offset', 'lineno', 'inode',
+           'head', 'tail' and 'matches'
+    """
+    stat = os.fstat(logfile.fileno())
+    state = self.states.get(filename)
+    if (not (state is None)):
+      if (stat.st_size < state['offset']):
+        state = None # truncated
+      elif (stat.st_ino != state['inode']):
+        if ((state['head'], state['tail']) != self.get_fingerprints(logfile, state['offset'])):
+          state = None # replaced by a different file
+    if (state is None):
+      state = {'offset' : 0, 'lineno' : 1, 'head' : 0, 'tail' : 0, 'matches' : {}}
+      self.states.update({filename : state})
+    state['inode'] = stat.st_ino
+    return state
+
+
+  def get_fingerprints(self, logfile, offset):
+    """ Returns the checksums of the first bytes of the file, and of the
+        bytes right before 'offset'.
+        Input:
+         logfile: File object of the file opened for reading
+         offset: Integer of the offset in the file
+        Output:
+         head: Integer of the crc32 of the first bytes
+         tail: Integer of the crc32 of the bytes before 'offset'
+    """
+    logfile.seek(0)
+    head = zlib.crc32(logfile.read(min(offset, self.fingerprintsize)))
+    start = max(0, offset-self.fingerprintsize)
+    logfile.seek(start)
+    tail = zlib.crc32(logfile.read(offset-start))
+    return head, tail
+
+
+  def set_fingerprints(self, state, logfile):
+    """ Updates the checksums of the scan state of a file, see
+        'get_file_state'.
+    """
+    (state['head'], state['tail']) = self.get_fingerprints(logfile, state['offset'])
+
+
+  def get_state_filename(self, dir):
+    """ Returns the filename the scan states of the log files in 'dir'
+        are stored in, None if the states are not stored.
+    """
+    if (self.state_dir is None):
+      return None
+    return os.path.join(self.state_dir, 'logscan_'+dir.strip('/').replace('/', '_'))
+
+
+  def load_states(self, dir):
+    """ Loads the scan states of the log files in 'dir' from file, once
+        per directory, such that scans continue after a restart.
+    """
+    statefilename = self.get_state_filename(dir)
+    if (statefilename is None or dir in self.loaded_dirs):
+      return
+    self.loaded_dirs.add(dir)
+    try:
+      statefile = open(statefilename, 'r')
+      try:
+        states = json.load(statefile)
+      finally:
+        statefile.close()
+    except (IOError, ValueError):
+      return # no states stored yet, or the file is corrupted
+    for (filename, state) in states.items():
+      state['matches'] = dict([(name, tuple(match)) for (name, match) in state['matches'].items()])
+      self.states.update({str(filename) : state})
+
+
+  def save_states(self, dir):
+    """ Stores the scan states of the log files in 'dir' to file.
+    """
+    statefilename = self.get_state_filename(dir)
+    if (statefilename is None):
+      return
+    prefix = os.path.join(dir, '')
+    states = dict([(filename, state) for (filename, state) in self.states.items() if filename.startswith(prefix)])
+    try:
+      statefile = open(statefilename+'.tmp', 'w')
+      try:
+        json.dump(states, statefile)
+      finally:
+        statefile.close()
+      os.rename(statefilename+'.tmp', statefilename)
+    except (IOError, OSError):
+      pass # the states are only an optimisation, scan from scratch next time
+
+
+  def forget(self, dir):
+    """ Resets the scan states of the log files in 'dir', e.g. when the
+        simulation is started again and writes new log files.
+        Input:
+         dir: String of the directory the log files are in
+    """
+    prefix = os.path.join(dir, '')
+    for filename in self.states.keys():
+      if (filename.startswith(prefix)):
+        del self.states[filename]
+    statefilename = self.get_state_filename(dir)
+    if (not (statefilename is None)):
+      try:
+        os.remove(statefilename)
+      except OSError:
+        pass
+
+
+  def match_line(self, line, lineno, pending, matches):
+    """ Records the signatures in 'pending' that match the given line.
+        Input:
+         line: String of the line
+         lineno: Integer of the line number
+         pending: List of indices of signatures not found yet, the found
+           signatures are removed
+         matches: Dictionary of signature name : (line, text)
+        Output:
+         found: Boolean which is True if any signature matched the line
+    """
+    found = False
+    for i in list(pending):
+      if (self.signatures[i]['compiled'].search(line)):
+        matches.update({self.signatures[i]['name'] : (lineno, line.strip())})
+        pending.remove(i)
+        found = True
+    return found
+
+
+  def get_verdict(self, dir, signatures, matches):
+    """ Assembles the verdict from the matches of the signatures, see
+        'scan'.
+    """
+    verdict = {'action' : None, 'name' : None, 'pattern' : None, 'file' : None, 'line' : None, 'text' : None, 'message' : None, 'matches' : matches}
+    for signature in signatures:
+      found = signature['name'] in matches
+      if (found == signature['required']):
+        continue
+      if (found):
+        (filename, lineno, text) = matches[signature['name']]
+      else:
+        # Required pattern is missing, refer to the first file:
+        filename = os.path.join(dir, signature['files'][0]); lineno = 0; text = ''
+      verdict.update({'action' : signature['action'], 'name' : signature['name'], 'pattern' : signature['pattern'], 'file' : filename, 'line' : lineno, 'text' : text})
+      verdict['message'] = signature['message'] % {'file' : filename, 'line' : lineno}
+      break
+    return verdict
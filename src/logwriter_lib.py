@@ -0,0 +1,137 @@
+import os
+import errno
+import time
+import gzip
+import shutil
+import threading
+from collections import OrderedDict
+
+
+
+class LogWriter:
+  """ A class for appending messages to log files, e.g. the log/error
+      files of the simulations in 'logfiles'. The files are kept open and
+      written through buffered streams, which are flushed to the files
+      every 'flush_interval' seconds and with 'flush'. At most 'maxfiles'
+      files are kept open, the least recently used file is closed if
+      another one is opened.
+      If 'max_bytes' is given, a log file which is larger is rotated:
+      it is renamed to '<file>.1' (compressed to '<file>.1.gz' if
+      'compress' is True), older segments are renamed to '<file>.2' and so
+      on, and only 'backups' segments are kept.
+      The log writer can be used from several threads.
+  """
+  def __init__(self, maxfiles=64, flush_interval=5.0, max_bytes=None, backups=5, compress=True):
+    """
+        Constructor with 5 optional input arguments:
+        Input:
+         maxfiles: Integer of the maximum number of open files (Default: 64)
+         flush_interval: Float of seconds after which written messages are
+           flushed to the files (Default: 5.0)
+         max_bytes: Integer of the size in bytes above which a log file is
+           rotated, or None for no rotation (Default: None)
+         backups: Integer of the number of rotated segments that are kept
+           (Default: 5)
+         compress: Boolean if rotated segments are compressed with gzip
+           (Default: True)
+    """
+    self.maxfiles = max(1, maxfiles)
+    self.flush_interval = flush_interval
+    self.max_bytes = max_bytes
+    self.backups = max(1, backups)
+    self.compress = compress
+    # Open files, path : [file object, size], in the order of their last use:
+    self.files = OrderedDict()
+    self.last_flush = time.time()
+    self.lock = threading.Lock()
+
+
+  def write(self, filename, msg):
+    """ This method appends the message as one line to a log file.
+        Input:
+         filename: String of the log filename
+         msg: String of the message
+    """
+    path = os.path.abspath(filename)
+    with self.lock:
+      entry = self.files.pop(path, None)
+      if (entry is None):
+        if (len(self.files) >= self.maxfiles):
+          (oldpath, oldentry) = self.files.popitem(last=False)
+          oldentry[0].close()
+        # The directory might not exist yet, e.g. 'logfiles' at startup:
+        try:
+          os.makedirs(os.path.dirname(path))
+        except OSError as e:
+          if (e.errno != errno.EEXIST):
+            raise
+        f = open(path, 'ab')
+        entry = [f, os.fstat(f.fileno()).st_size]
+      self.files[path] = entry
+      data = msg+'\n'
+      entry[0].write(data)
+      entry[1] = entry[1] + len(data)
+      if (not (self.max_bytes is None) and entry[1] >= self.max_bytes):
+        self.rotate(path)
+      if (time.time()-self.last_flush >= self.flush_interval):
+        self.flush_files()
+
+
+  def rotate(self, path):
+    """ This method rotates a log file, which is closed. It must be called
+        with 'self.lock' held.
+        Input:
+         path: String of the absolute path of the log file
+    """
+    entry = self.files.pop(path, None)
+    if (not (entry is None)):
+      entry[0].close()
+    if (self.compress):
+      suffix = '.gz'
+    else:
+      suffix = ''
+    # Shift older segments, the oldest is removed:
+    oldest = path+'.'+str(self.backups)+suffix
+    if (os.path.exists(oldest)):
+      os.remove(oldest)
+    for i in range(self.backups-1, 0, -1):
+      segment = path+'.'+str(i)+suffix
+      if (os.path.exists(segment)):
+        os.rename(segment, path+'.'+str(i+1)+suffix)
+    os.rename(path, path+'.1')
+    if (self.compress):
+      source = open(path+'.1', 'rb')
+      try:
+        target = gzip.open(path+'.1.gz.tmp', 'wb')
+        try:
+          shutil.copyfileobj(source, target)
+        finally:
+          target.close()
+      finally:
+        source.close()
+      os.rename(path+'.1.gz.tmp', path+'.1.gz')
+      os.remove(path+'.1')
+
+
+  def flush_files(self):
+    """ Flushes all open files. It must be called with 'self.lock' held.
+    """
+    for (f, size) in self.files.values():
+      f.flush()
+    self.last_flush = time.time()
+
+
+  def flush(self):
+    """ Flushes all messages to the files.
+    """
+    with self.lock:
+      self.flush_files()
+
+
+  def close(self):
+    """ Flushes all messages and closes all files.
+    """
+    with self.lock:
+      for (f, size) in self.files.values():
+        f.close()
+      self.files.clear()
@@ -2,12 +2,17 @@ import os
 import commands
 import sys
 import time
+import shutil
+import tempfile
+import threading
 sys.path.append("/data/fmilthaler/fluidity-trunk/python/")
 sys.path.append("/data/fmilthaler/Projects-Code/scripting-library/python/")
 #from numpy import *
 from io_routines import *
 from pgf_io_routines import *
 from myexception import *
+from notification_lib import *
+from logwriter_lib import *
 
 
 
@@ -16,9 +21,9 @@ class Messaging:
       crucial reports via email, and using the notify-send, a popup with short text,
       to let the user know about the certain events.
   """
-  def __init__(self, verbosity, emailaddress=None, sendemail=True, popupmsg=True):
+  def __init__(self, verbosity, emailaddress=None, sendemail=True, popupmsg=True, notification_workers=1, digest=False, digest_window=None, log_max_bytes=None):
     """
-        Constructor with 4 input arguments:
+        Constructor with 8 input arguments:
         Input: 
          verbosity: Integer which determines the wanted verbosity level, incoming
            messages with a verbosity above the verbosity level given here, are 
@@ -28,12 +33,36 @@ class Messaging:
          sendemail: Boolean if emails are wanted or not (Default: True)
          popupmsg: Boolean if popup messages of reports are wanted or not 
            (Default: True)
+         notification_workers: Integer of the number of threads sending
+           emails and popups in the background (Default: 1)
+         digest: Boolean if emails are collected and sent as one summary
+           email with 'flush_digest', instead of one email per message
+           (Default: False)
+         digest_window: Float of the minimum number of seconds between two
+           summary emails, or None to send one per round of monitoring
+           (Default: None)
+         log_max_bytes: Integer of the size in bytes above which the
+           log/error files are rotated and compressed, or None for no
+           rotation (Default: None)
     """
     # Constructor
     self.verbosity = verbosity
     self.emailaddress = emailaddress
     self.sendemail = sendemail
     self.popupmsg = popupmsg
+    # Optional log of all messages, an object with the method
+    # record_message(dir, msgtype, subject, message), e.g. a SQLiteStateStore:
+    self.message_log = None
+    # Writer of the log/error files, which are kept open:
+    self.log_writer = LogWriter(max_bytes=log_max_bytes)
+    # Emails and popups are sent in the background:
+    self.notifications = NotificationQueue(nworkers=notification_workers)
+    # Messages collected for the next summary email in digest mode,
+    # [(time, dir, subject, message, attachment), ...]:
+    self.digest = digest
+    self.digest_window = digest_window
+    self.digest_messages = []
+    self.digest_lock = threading.Lock()
     # Check if given arguments are valid:
     (self.sendemail, self.emailaddress) = self.check_email_setup(emailaddress, sendemail)
 
@@ -215,12 +244,116 @@ class Messaging:
       printc(message, color, highlight); print
       # Write to log/err files (independant of verbosity level):
       self.write_to_log_err_file(dir, message, msgtype)
-      # Send email:
+      if (not (self.message_log is None)):
+        self.message_log.record_message(dir, msgtype, subject, message)
+      # Send email in the background, or collect it for the summary email:
       if (self.sendemail and verbosity<=self.verbosity and sendemail):
-        self.send_email(dir, self.emailaddress, message, attachment=attachment, subject=subject)
-      # Popup message:
+        if (self.digest):
+          with self.digest_lock:
+            self.digest_messages.append((time.time(), dir, subject, message, attachment))
+        else:
+          self.queue_email(dir, message, attachment, subject)
+      # Popup message in the background, which is not tried again:
       if (self.popupmsg and verbosity<=self.verbosity):
-        self.notify_popup(subject, message)
+        self.notifications.put(self.notify_popup, (subject, message), retries=0)
+
+
+  def digest_due(self):
+    """ Returns True if messages were collected for the summary email, and
+        the first of them is at least 'digest_window' seconds old.
+    """
+    with self.digest_lock:
+      if (not self.digest_messages):
+        return False
+      if (self.digest_window is None):
+        return True
+      return time.time()-self.digest_messages[0][0] >= self.digest_window
+
+
+  def flush_digest(self, attachment=None, force=False):
+    """ This method sends the messages collected in digest mode as one
+        summary email, in which they are grouped by their subject and
+        directory. The attachments of the messages are not attached, but
+        listed in the email.
+        Input:
+         attachment: String of the file to attach to the summary email,
+           e.g. the status table (Default: None)
+         force: Boolean, if True, the email is sent even if 'digest_window'
+           has not passed yet (Default: False)
+        Output:
+         sent: Boolean which is True if a summary email was sent
+    """
+    if (not force and not self.digest_due()):
+      return False
+    with self.digest_lock:
+      messages = self.digest_messages
+      self.digest_messages = []
+    if (not messages):
+      return False
+    # Group the messages by subject and directory:
+    groups = {}
+    for (msgtime, dir, subject, message, msgattachment) in messages:
+      if (subject is None):
+        subject = 'Other'
+      groups.setdefault(subject, {}).setdefault(dir, []).append((msgtime, message, msgattachment))
+    counts = [group+': '+str(sum([len(entries) for entries in groups[group].values()])) for group in sorted(groups.keys())]
+    digest_subject = 'Digest of '+str(len(messages))+' reports ('+', '.join(counts)+')'
+    body = 'Summary of '+str(len(messages))+' reports of '+str(len(set([entry[1] for entry in messages])))+' simulations:\n'
+    for subject in sorted(groups.keys()):
+      header = '# '+subject+' #'
+      body = body+'\n'+'#'*len(header)+'\n'+header+'\n'+'#'*len(header)+'\n'
+      for dir in sorted(groups[subject].keys()):
+        for (msgtime, message, msgattachment) in groups[subject][dir]:
+          body = body+'\n'+time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(msgtime))+' '+dir+':\n'+message+'\n'
+          if (not (msgattachment is None)):
+            body = body+'(Files: '+msgattachment+')\n'
+    self.queue_email('.', body, attachment, digest_subject)
+    return True
+
+
+  def queue_email(self, dir, message, attachment=None, subject=None):
+    """ This method queues an email, which is sent in the background. The
+        files to attach are copied to a temporary directory right away,
+        as they might be rewritten before the email is sent, e.g. the
+        status table. The copies are removed after the email was sent.
+        Input:
+         dir: String of the directory name of the simulation
+         message: String of the message to be sent in the email
+         attachment: String of the file(s) to attach, separated by
+           blanks (Default: None)
+         subject: String of the email's subject (Default: None)
+    """
+    done = None
+    if (not (attachment is None)):
+      tmpdir = tempfile.mkdtemp(prefix='autoemailattachment')
+      copies = []
+      for (i, filename) in enumerate(attachment.split()):
+        # One subdirectory per file, which keeps the name of the file:
+        copy = os.path.join(tmpdir, str(i), os.path.basename(filename))
+        try:
+          os.mkdir(os.path.dirname(copy))
+          shutil.copy2(filename, copy)
+        except (IOError, OSError):
+          # File does not exist, which is reported by send_email:
+          copy = filename
+        copies.append(copy)
+      attachment = ' '.join(copies)
+      done = (shutil.rmtree, (tmpdir, True))
+    self.notifications.put(self.send_email, (dir, self.emailaddress, message, attachment, subject), done=done)
+
+
+  def drain_notifications(self, timeout=None):
+    """ This method waits until all emails and popups were sent, it
+        should be called before the program exits.
+        Input:
+         timeout: Float of the maximum number of seconds to wait, or None
+           to wait until all were sent (Default: None)
+    """
+    unsent = self.notifications.drain(timeout)
+    if (unsent > 0):
+      printc('Warning: '+str(unsent)+' email/popup reports could not be sent before exiting.', 'red', False); print
+    if (self.notifications.nfailed > 0):
+      printc('Warning: '+str(self.notifications.nfailed)+' email/popup reports failed to be sent.', 'red', False); print
 
 
   def write_to_log_err_file(self, dir, msg, msgtype='log'):
@@ -242,12 +375,22 @@ class Messaging:
       status = 1
     # Append to log/err file:
     if (status == 0):
-      string_append_to_file(msg, logfile, append=True)
+      self.log_writer.write(logfile, msg)
     if (msgtype == 'err'):
-      string_append_to_file(msg, 'logfiles/'+dir+'.log', append=True)
+      self.log_writer.write('logfiles/'+dir+'.log', msg)
     # End of write_to_log_err_file!
 
 
+  def flush_logs(self, close=False):
+    """ Flushes the messages to the log/err files, which are closed if
+        'close' is True, e.g. before the program exits.
+    """
+    if (close):
+      self.log_writer.close()
+    else:
+      self.log_writer.flush()
+
+
   def send_email(self, dir=None, recipient=None, message='', attachment=None, subject=None):
     """ This subroutine sends an automated email. Input arguments are
         the recipients email address, the email's subject and 
@@ -258,6 +401,8 @@ class Messaging:
          message: String of the message to be sent in the email
          attachmet (optional): String of a file that should be 
            attached to the email.
+        Output:
+         status: Integer which is 0 if the email was sent
     """
     # Initialization:
     if (dir is None):
@@ -278,7 +423,7 @@ class Messaging:
           attach_error_message = 'This email was flagged to attach the following file:\n     '+attachment+'.\nThis file does not exist/could not be found and therefore could not be attached to this email.\n'
 
       # Get absolute current path:
-      pwd = commands.getoutput('cd '+dir+'; pwd')
+      pwd = os.path.abspath(dir)
 
       # Make header for email body:
       hashes = ''
@@ -342,24 +487,28 @@ class Messaging:
       if (not (attachment is None) and not attach_file):
         emailbody = emailbody+attach_error_message
 
-      # Write the text of the email body to a file which is required for mutt:
-      cmd = 'echo "'+emailbody+'" > '+pwd+'/autoemailbody'
-      out = commands.getoutput(cmd)
+      # Write the text of the email body to a file which is required for mutt,
+      # one file per email, as several emails might be sent at the same time:
+      (fd, bodyfilename) = tempfile.mkstemp(prefix='autoemailbody', dir=pwd)
+      bodyfile = os.fdopen(fd, 'w')
+      bodyfile.write(emailbody+'\n')
+      bodyfile.close()
 
       # Prepare string for the mutt command, send one email per given email address:
       cmd = 'mutt -s "'+subject+'" '
       for email in recipient:
         cmd = cmd + email + ' '
-      cmd = cmd + '< '+pwd+'/autoemailbody'
+      cmd = cmd + '< '+bodyfilename
       if (attach_file):
         cmd = cmd+' -a '+attachment
       # Everything is done, now send it:
-      out = commands.getoutput(cmd)
+      (status, out) = commands.getstatusoutput(cmd)
 
       # Now remove the file that we created:
-      out = commands.getoutput('rm '+pwd+'/autoemailbody')
+      os.remove(bodyfilename)
       # Now delete the sent file, this prevends it from becoming to big and compiz wasting cpu usage
-      out = commands.getoutput('rm ~/sent')
+      out = commands.getoutput('rm -f ~/sent')
+    return status
 
 
 
@@ -395,7 +544,8 @@ class Messaging:
     subject = subject.strip().strip('#').strip().strip('#').strip().strip('#')
     message = message.strip().strip('#').strip().strip('#').strip().strip('#')
     cmd = 'notify-send "'+subject+'" "'+message+'" --urgency='+urgency
-    out = commands.getoutput(cmd)
+    (status, out) = commands.getstatusoutput(cmd)
+    return status
 
 
 
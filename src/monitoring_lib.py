@@ -2,13 +2,31 @@ import os
 import commands
 import sys
 import time
+import copy
+import threading
+import Queue
+import glob
 sys.path.append("/data/fmilthaler/fluidity-trunk/python/")
 sys.path.append("/data/fmilthaler/Projects-Code/scripting-library/python/")
 # Import other self written modules:
 from io_routines import *
 from pgf_io_routines import *
+from html_io_routines import *
 from messaging_lib import *
 from myexception import *
+from ssh_lib import *
+from simulation_lib import *
+from logscan_lib import *
+from stat_lib import *
+from flml_lib import *
+from journal_lib import *
+from statestore_lib import *
+from pbs_lib import *
+from table_lib import *
+from transfer_lib import *
+from archive_lib import *
+from backup_lib import *
+from tail_lib import *
 ## Requires libspud to be installed:
 import libspud
 
@@ -42,47 +60,82 @@ class Monitoring:
          works out the status of each simulation, and continues from that point onwards.
        * Bkup files of the most recent checkpoint files as well as result files
          (stat/detectors/detectors.dat) can be found in a subdirectory 'bkup'.
+         The result and checkpoint files of the last 'bkup_keep' checkpoints are
+         kept in the deduplicated store 'bkup/store', see BackupStore.restore.
   """
-  def __init__(self, dirbasename, username, cluster_name, cluster_dir, cluster_fluidity_dir='', dir='', simname='', jobid='', simulation_running=False, simulation_crashed=False, simulation_finished=False, ncpus='---', nnopercpu=15000, errmaxcnt=100, errwaittime=0.01, query_waittime=60, verbosity=3, emailaddress=None, sendemail=True, popupmsg=False):
+  def __init__(self, dirbasename, username, cluster_name, cluster_dir, cluster_fluidity_dir='', dir='', simname='', jobid='', simulation_running=False, simulation_crashed=False, simulation_finished=False, ncpus='---', nnopercpu=15000, errmaxcnt=100, errwaittime=0.01, query_waittime=60, verbosity=3, emailaddress=None, sendemail=True, popupmsg=False, ssh_control_dir=None, ssh_persist=600, nworkers=1, log_signatures=None, stat_sidecars=False, state_store='journal', startup_nworkers=8, table_interval=60, email_digest=False, digest_window=None, log_max_bytes=None, transfer_window=1.0, transfer_lanes=2, transfer_bwlimit=None, archive_push=False, bkup_keep=10, tail_pulls=True, notify_timeout=300.0):
     # Constructor
     self._dirbasename = dirbasename
 
-    self.dir = dir
-    self.simname = simname
-    self.jobid = jobid
-    self.cluster_status = 'Q'
-    self.cluster_walltime = '---'
-    self.sim_time = 0.0
-    self.simulation_running = simulation_running
-    self.simulation_crashed = simulation_crashed
-    self.simulation_finished = simulation_finished
-    self.pbs_walltime = '72:00:00' # default value
-    self.nmachines = '---' # if not set by user, it'll read it in from preset pbs.sh
-    self.ncpus = ncpus
-    self.memory = '---' # if not set by user, it'll read it in from preset pbs.sh
-    self.total_ncpus = ncpus # default value
-    self.infiniband = '---' # default value
-    self.queue = None # if not set by user, it'll read it in from preset pbs.sh
-    self.mpiprocs = ncpus # default value, only for cx2
-    self.ompthreads = 1 # default value, only for cx2
-    self.nnopercpu = nnopercpu
+    # Default properties of the simulations, until they are read in from
+    # the pbs-scripts/dict_status_* files:
+    self.defaults = SimulationState('', simname=simname, jobid=jobid, simulation_running=simulation_running, simulation_crashed=simulation_crashed, simulation_finished=simulation_finished, ncpus=ncpus, total_ncpus=ncpus, mpiprocs=ncpus, nnopercpu=nnopercpu, cluster_name=cluster_name, cluster_dir=cluster_dir, cluster_fluidity_dir=cluster_fluidity_dir)
     # Variables for error handling:
     self.errmaxcnt = errmaxcnt
     self.errwaittime = errwaittime
     # Wait time between two rounds of checking all simulations:
     self.query_waittime = query_waittime
-    # Variable for location of error:
-    self.error_status = 0
-    self.sim_clean_exit = False
     # Cluster variables:
     self.cluster_name = cluster_name
     self.cluster_dir = cluster_dir
     self.cluster_fluidity_dir = cluster_fluidity_dir
     self.username = username
+    # Snapshots of "qstat -a" per (username, cluster_name) of the current round:
+    self.qstat_snapshots = {}
+    # Persistent, multiplexed ssh connections per (username, cluster_name):
+    self.ssh_pool = SSHConnectionPool(control_dir=ssh_control_dir, persist=ssh_persist)
+    # Number of simulations that are processed at the same time:
+    self.nworkers = max(1, nworkers)
+    # Directories of the simulations that are currently being processed:
+    self.active_dirs = set()
+    # Whether the simulation files are sent to the cluster by streaming the
+    # compressed checkpoint archive through ssh, rather than by rsync:
+    self.archive_push = archive_push
+    # Number of checkpoints, whose result and checkpoint files are kept in
+    # the backup store 'bkup/store' of a simulation:
+    self.bkup_keep = bkup_keep
+    # rsync transfers of the simulations that are processed at the same time
+    # are combined into one rsync per cluster directory, which run in
+    # 'transfer_lanes' lanes per cluster (smallest first), with a total
+    # bandwidth of 'transfer_bwlimit' KB/s per cluster:
+    self.transfers = TransferBatcher(self.ssh_pool, window=transfer_window, get_nactive=lambda: len(self.active_dirs), lanes=transfer_lanes, bwlimit=transfer_bwlimit, report=self.report_transfer)
+    # Result files growing while a simulation is running are pulled by
+    # appending their new end, if 'tail_pulls' is True:
+    self.tail_pulls = tail_pulls
+    self.tail_puller = TailPuller(self.ssh_pool)
+    # Maximum number of seconds to wait for the remaining emails/popups to
+    # be sent before exiting, the ones still queued then are reported:
+    self.notify_timeout = notify_timeout
+    # Locks for the state shared by the workers processing the simulations:
+    self.dict_lock = threading.RLock()
+    self.qstat_lock = threading.Lock()
+    self.html_lock = threading.Lock()
+    # libspud holds one global option tree, thus only one flml at a time:
+    self.libspud_lock = libspud_lock
+    # Options of the flml files, every file is loaded only once:
+    self.flml_options = FlmlOptionsCache()
+    # Scanner for signs of errors in the log files of the simulations, it
+    # keeps the offsets up to which the log files were scanned in 'logfiles':
+    self.logscanner = LogScanner(signatures=log_signatures, state_dir='logfiles')
+    # Binary sidecar files of the .stat/.detectors files, kept up to date
+    # when results are appended:
+    self.stat_sidecars = stat_sidecars
+    set_stat_sidecars(stat_sidecars)
+    # Number of threads parsing the pbs scripts at startup, and the parsed
+    # pbs scripts of previous runs:
+    self.startup_nworkers = max(1, startup_nworkers)
+    self.pbs_cache = PbsScriptCache(filename='logfiles/pbs_cache.json')
+    # Renders the status table in the background, at most once per
+    # 'table_interval' seconds:
+    self.table_renderer = TableRenderer(self.render_dict_status_pgftable, interval=table_interval)
+    # Seconds spent in the stages of the startup, [(stage, seconds), ...]:
+    self.startup_timings = []
 
     # Create an object for writing/sending reports:
     try:
-      self.messaging = Messaging(verbosity, emailaddress=emailaddress, sendemail=sendemail, popupmsg=popupmsg)
+      # In digest mode, emails are collected and sent as one summary email
+      # per round (or per 'digest_window' seconds):
+      self.messaging = Messaging(verbosity, emailaddress=emailaddress, sendemail=sendemail, popupmsg=popupmsg, digest=email_digest, digest_window=digest_window, log_max_bytes=log_max_bytes)
       self.set_report_props(verbosity=verbosity, emailaddress=emailaddress, sendemail=sendemail, popupmsg=popupmsg)
     except Email_Report_Exception:
       #errmsg = "Caught Email_Report_Exception"
@@ -91,28 +144,43 @@ class Monitoring:
       # e.g. sendemail==True, but email given is invalid!
       raise SystemExit
 
-    # Set up dictionary:
-    self.dict = self.construct_sim_dict(dirbasename)
+    # Set up the registry of simulations, dir : SimulationState:
+    self.simulations = self.construct_simulations(dirbasename)
+    starttime = time.time()
+    # Store of the state of the simulations, for continuing the monitoring
+    # later, either an append-only journal or a SQLite database:
+    if (state_store == 'sqlite'):
+      self.state_store = SQLiteStateStore(filename='logfiles/state.sqlite')
+      # Record the messages as well:
+      self.messaging.message_log = self.state_store
+    else:
+      self.state_store = StateJournal(journal_dir='logfiles')
     # Set up folders:
     # only do this IFF no log/error files are in the logfiles directory,
     # this means, that the simulations have not previously run
     continue_monitoring = self.check_if_previously_ran()
     if (continue_monitoring):
-      # If simulations ran before, then get data either from dict_status_*
-      # or log files:
+      # If simulations ran before, then get data either from the state
+      # store or dict_status_* files:
       self.set_dict_from_dict_status()
+      self.startup_timings.append(('state replay', time.time()-starttime))
     else:
       self.set_up_initial_subdirs(dirbasename)
+      self.startup_timings.append(('subdirectories', time.time()-starttime))
+    self.print_startup_timings()
 
     # Define columns of the dictionary to print in the pgf table which
     # gives an overview of all simulations:
     self.table_header = ['dirname', 'jobid', 'status', 'walltime', 'sim_time', 'nmachines', 'ncpus', 'mpiprocs', 'total_ncpus', 'memory', 'infiniband', 'error_status', 'sim_clean_exit']
+    # Names of the columns as they are printed in the table (only if they change):
+    self.table_colnames = {'nmachines' : 'nodes', 'ncpus' : 'cpus', 'total_ncpus' : 'ncpus', 'memory' : 'mem', 'infiniband' : 'icib', 'sim_time' : 'time', 'error_status' : 'error', 'walltime' : 'wt', 'mpiprocs' : 'mpi'}
 
   def set_cluster_props(self, username, cluster_name, cluster_dir, cluster_fluidity_dir):
     self.cluster_name = cluster_name
     self.cluster_dir = cluster_dir
     self.cluster_fluidity_dir = cluster_fluidity_dir
     self.username = username
+    self.defaults.update(cluster_name=cluster_name, cluster_dir=cluster_dir, cluster_fluidity_dir=cluster_fluidity_dir)
 
   def set_report_props(self, verbosity=3, emailaddress=None, sendemail=True, popupmsg=True):
     """
@@ -170,199 +238,130 @@ class Monitoring:
     out = commands.getoutput('mkdir logfiles')
 
 
-  def construct_sim_dict(self, dirbasename=None):
+  def construct_simulations(self, dirbasename=None):
+    """ This method sets up the registry of all simulations, meaning one
+        SimulationState object per directory that matches 'dirbasename',
+        with its properties read in from the preset pbs-script.
+        The pbs scripts are parsed in a pool of 'self.startup_nworkers'
+        threads, unless they did not change since they were parsed
+        before (see PbsScriptCache).
+        Input:
+         dirbasename: The common name of directories the
+           script should monitor/maintain
+        Output:
+         simulations: Dictionary of dir : SimulationState
+    """
     if (dirbasename is None):
-      dirbasename = self.dirbasename
+      dirbasename = self._dirbasename
+    starttime = time.time()
     (dirnames, status) = find_dir_names('./', dirbasename+'* -maxdepth 0')
     if (status != 0):
       raise SystemExit("Could not find any directories nor symlinks that match the searchstring '"+dirbasename+"'.")
-    dict = {}
-    for dir in sort_string_list(dirnames):
-      # This gets pbs parameters from preset pbs.sh scripts, which can be overwritten by calling the function
-      # 'update_sim_properties'
-      (pbs_simname, pbs_walltime, nmachines, ncpus, memory, total_ncpus, mpiprocs, ompthreads, queue, status) = self.get_simname_walltime_ncpus_pbs(dir, pbs_filename='pbs.sh')
-      # Set up dictionary:
-      dict.update({dir : {'simname' : '---', 'jobid' : '---', 'status' : '', 'walltime' : '---', 'sim_time' : '---', 'simulation_running' : False, 'simulation_crashed' : False, 'simulation_finished' : False, 'pbs_walltime' : pbs_walltime, 'nmachines' : nmachines, 'ncpus' : ncpus, 'memory' : memory, 'total_ncpus' : total_ncpus, 'mpiprocs' : mpiprocs, 'ompthreads' : ompthreads, 'nnopercpu' : self.nnopercpu, 'infiniband' : False, 'queue' : queue, 'error_status' : 0, 'cluster_name' : self.cluster_name, 'cluster_fluidity_dir' : self.cluster_fluidity_dir, 'cluster_dir' : self.cluster_dir, 'sim_clean_exit' : False}})
-    return dict
-
-
-  def set_sim_properties_from_dict(self, dir):
-    self.dir = dir
-    self.simname = self.dict[dir]['simname']
-    self.jobid = self.dict[dir]['jobid']
-    self.cluster_status = self.dict[dir]['status']
-    self.cluster_walltime = self.dict[dir]['walltime']
-    self.sim_time = self.dict[dir]['sim_time']
-    self.simulation_running = self.dict[dir]['simulation_running']
-    self.simulation_crashed = self.dict[dir]['simulation_crashed']
-    self.simulation_finished = self.dict[dir]['simulation_finished']
-    self.pbs_walltime = self.dict[dir]['pbs_walltime']
-    self.nmachines = self.dict[dir]['nmachines']
-    self.ncpus = self.dict[dir]['ncpus']
-    self.memory = self.dict[dir]['memory']
-    self.total_ncpus = self.dict[dir]['total_ncpus']
-    self.mpiprocs = self.dict[dir]['mpiprocs']
-    self.ompthreads = self.dict[dir]['ompthreads']
-    self.nnopercpu = self.dict[dir]['nnopercpu']
-    self.infiniband = self.dict[dir]['infiniband']
-    self.queue = self.dict[dir]['queue']
-    self.cluster_name = self.dict[dir]['cluster_name']
-    self.cluster_dir = self.dict[dir]['cluster_dir']
-    self.cluster_fluidity_dir = self.dict[dir]['cluster_fluidity_dir']
-    self.error_status = self.dict[dir]['error_status']
-    self.sim_clean_exit = self.dict[dir]['sim_clean_exit']
-
-
-  def update_sim_properties(self, dir, simname=None, jobid=None, simulation_running=None, simulation_crashed=None, simulation_finished=None, pbs_walltime=None, nmachines=None, ncpus=None, memory=None, total_ncpus=None, mpiprocs=None, ompthreads=None, nnopercpu=None, infiniband=None, queue=None, sim_time=None, cluster_status=None, cluster_walltime=None, cluster_name=None, cluster_dir=None, cluster_fluidity_dir=None, error_status=None, sim_clean_exit=None):
-    # Then, reset variables based on given variables:
-    if (not (simname is None)):
-      self.simname = simname
-      self.dict[dir].update({'simname' : simname})
-    if (not (jobid is None)):
-      self.jobid = jobid
-      self.dict[dir].update({'jobid' : jobid})
-    if (not (cluster_status is None)):
-      self.cluster_status = cluster_status
-      self.dict[dir].update({'status' : cluster_status})
-    if (not (cluster_walltime is None)):
-      self.cluster_walltime = cluster_walltime
-      self.dict[dir].update({'walltime' : cluster_walltime})
-    if (not (sim_time is None)):
-      self.sim_time = sim_time
-      self.dict[dir].update({'sim_time' : sim_time})
-    if (not (simulation_running is None)):
-      self.simulation_running = simulation_running
-      self.dict[dir].update({'simulation_running' : simulation_running})
-    if (not (simulation_crashed is None)):
-      self.simulation_crashed = simulation_crashed
-      self.dict[dir].update({'simulation_crashed' : simulation_crashed})
-    if (not (simulation_finished is None)):
-      self.simulation_finished = simulation_finished
-      self.dict[dir].update({'simulation_finished' : simulation_finished})
-    if (not (pbs_walltime is None)):
-      self.pbs_walltime = pbs_walltime
-      self.dict[dir].update({'pbs_walltime' : pbs_walltime})
-    if (not (nmachines is None)):
-      self.nmachines = nmachines
-      self.dict[dir].update({'nmachines' : nmachines})
-    if (not (ncpus is None)):
-      self.ncpus = ncpus
-      self.dict[dir].update({'ncpus' : ncpus})
-    if (not (memory is None)):
-      self.memory = memory
-      self.dict[dir].update({'memory' : memory})
-    if (not (total_ncpus is None)):
-      self.total_ncpus = total_ncpus
-      self.dict[dir].update({'total_ncpus' : total_ncpus})
-    if (not (mpiprocs is None)):
-      self.mpiprocs = mpiprocs
-      self.dict[dir].update({'mpiprocs' : mpiprocs})
-    if (not (ompthreads is None)):
-      self.ompthreads = ompthreads
-      self.dict[dir].update({'ompthreads' : ompthreads})
-    if (not (nnopercpu is None)):
-      self.nnopercpu = nnopercpu
-      self.dict[dir].update({'nnopercpu' : nnopercpu})
-    if (not (infiniband is None)):
-      self.infiniband = infiniband
-      self.dict[dir].update({'infiniband' : infiniband})
-    if (not (queue is None)):
-      self.queue = queue
-      self.dict[dir].update({'queue' : queue})
-    if (not (cluster_name is None)):
-      self.cluster_name = cluster_name
-      self.dict[dir].update({'cluster_name' : cluster_name})
-    if (not (cluster_dir is None)):
-      self.cluster_dir = cluster_dir
-      self.dict[dir].update({'cluster_dir' : cluster_dir})
-    if (not (cluster_fluidity_dir is None)):
-      self.cluster_fluidity_dir = cluster_fluidity_dir
-      self.dict[dir].update({'cluster_fluidity_dir' : cluster_fluidity_dir})
-    if (not (error_status is None)):
-      self.error_status = error_status
-      self.dict[dir].update({'error_status' : error_status})
-    if (not (sim_clean_exit is None)):
-      self.sim_clean_exit = sim_clean_exit
-      self.dict[dir].update({'sim_clean_exit' : sim_clean_exit})
-
-
-  def update_dict(self, dir, simname=None, jobid=None, cluster_status=None, cluster_walltime=None, sim_time=None, simulation_running=None, simulation_crashed=None, simulation_finished=None, pbs_walltime=None, nmachines=None, ncpus=None, memory=None, total_ncpus=None, mpiprocs=None, ompthreads=None, nnopercpu=None, infiniband=None, queue=None, cluster_name=None, cluster_dir=None, cluster_fluidity_dir=None, error_status=None, sim_clean_exit=None):
-    if (simname is None):
-      simname = self.simname
-    if (jobid is None):
-      jobid = self.jobid
-    if (cluster_status is None):
-      cluster_status = self.cluster_status
-    if (cluster_walltime is None):
-      cluster_walltime = self.cluster_walltime
-    if (sim_time is None):
-      sim_time = self.sim_time
-    if (simulation_running is None):
-      simulation_running = self.simulation_running
-    if (simulation_crashed is None):
-      simulation_crashed = self.simulation_crashed
-    if (simulation_finished is None):
-      simulation_finished = self.simulation_finished
-    if (pbs_walltime is None):
-      pbs_walltime = self.pbs_walltime
-    if (nmachines is None):
-      nmachines = self.nmachines
-    if (ncpus is None):
-      ncpus = self.ncpus
-    if (memory is None):
-      memory = self.memory
-    if (total_ncpus is None):
-      total_ncpus = self.total_ncpus
-    if (mpiprocs is None):
-      mpiprocs = self.mpiprocs
-    if (ompthreads is None):
-      ompthreads = self.ompthreads
-    if (nnopercpu is None):
-      nnopercpu = self.nnopercpu
-    if (infiniband is None):
-      infiniband = self.infiniband
-    if (queue is None):
-      queue = self.queue
-    if (cluster_name is None):
-      cluster_name = self.cluster_name
-    if (cluster_dir is None):
-      cluster_dir = self.cluster_dir
-    if (cluster_fluidity_dir is None):
-      cluster_fluidity_dir = self.cluster_fluidity_dir
-    if (error_status is None):
-      error_status = self.error_status
-    if (sim_clean_exit is None):
-      sim_clean_exit = self.sim_clean_exit
-    self.dict[dir].update({'simname' : simname})
-    self.dict[dir].update({'jobid' : jobid})
-    self.dict[dir].update({'status' : cluster_status})
-    self.dict[dir].update({'walltime' : cluster_walltime})
-    self.dict[dir].update({'sim_time' : sim_time})
-    self.dict[dir].update({'simulation_running' : simulation_running})
-    self.dict[dir].update({'simulation_crashed' : simulation_crashed})
-    self.dict[dir].update({'simulation_finished' : simulation_finished})
-    self.dict[dir].update({'pbs_walltime' : pbs_walltime})
-    self.dict[dir].update({'nmachines' : nmachines})
-    self.dict[dir].update({'ncpus' : ncpus})
-    self.dict[dir].update({'memory' : memory})
-    self.dict[dir].update({'total_ncpus' : total_ncpus})
-    self.dict[dir].update({'mpiprocs' : mpiprocs})
-    self.dict[dir].update({'ompthreads' : ompthreads})
-    self.dict[dir].update({'nnopercpu' : nnopercpu})
-    self.dict[dir].update({'infiniband' : infiniband})
-    self.dict[dir].update({'queue' : queue})
-    self.dict[dir].update({'cluster_name' : cluster_name})
-    self.dict[dir].update({'cluster_dir' : cluster_dir})
-    self.dict[dir].update({'cluster_fluidity_dir' : cluster_fluidity_dir})
-    self.dict[dir].update({'error_status' : error_status})
-    self.dict[dir].update({'sim_clean_exit' : sim_clean_exit})
-
-
-
-  def get_sim_properties(self, dir):
-    """ Returns all simulation properties according to 'dir'.
+    dirnames = sort_string_list(dirnames)
+    self.startup_timings.append(('directory discovery', time.time()-starttime))
+    starttime = time.time()
+    simulations = {}
+    for dir in dirnames:
+      simulations.update({dir : self.defaults.copy(dir=dir)})
+    tasks = Queue.Queue()
+    for dir in dirnames:
+      tasks.put(dir)
+    # Exceptions raised in the workers:
+    failures = []
+
+    def worker():
+      while (not failures):
+        try:
+          dir = tasks.get_nowait()
+        except Queue.Empty:
+          break
+        try:
+          # This gets pbs parameters from preset pbs.sh scripts, which can be overwritten by calling the function
+          # 'update_sim_properties'
+          self.read_pbs_properties(simulations[dir], pbs_filename='pbs.sh')
+        except BaseException:
+          failures.append(sys.exc_info())
+
+    threads = []
+    for i in range(min(self.startup_nworkers, len(dirnames))):
+      thread = threading.Thread(target=worker, name='startup-worker-'+str(i))
+      thread.daemon = True
+      thread.start()
+      threads.append(thread)
+    try:
+      for thread in threads:
+        # join with a timeout, otherwise KeyboardInterrupt is not received:
+        while (thread.is_alive()):
+          thread.join(1.0)
+    except BaseException:
+      failures.append(sys.exc_info())
+      raise
+    if (failures):
+      # Raise the first exception again in the main thread:
+      (exc_type, exc_value, exc_traceback) = failures[0]
+      raise exc_type, exc_value, exc_traceback
+    self.pbs_cache.save()
+    self.startup_timings.append(('pbs scripts', time.time()-starttime))
+    return simulations
+
+
+  def read_pbs_properties(self, sim, pbs_filename='pbs.sh'):
+    """ This method sets the properties of a simulation that are given in
+        its pbs script, which is only parsed if it changed since it was
+        parsed with the same defaults (see PbsScriptCache).
+        Input:
+         sim: SimulationState object of the simulation
+         pbs_filename(optional): Filename of the pbs script (Default: 'pbs.sh')
+    """
+    filename = sim.dir+'/'+pbs_filename
+    defaults = dict([(name, getattr(sim, name)) for name in ['cluster_name', 'nmachines', 'ncpus', 'memory', 'mpiprocs', 'ompthreads', 'queue']])
+    properties = self.pbs_cache.get(filename, defaults)
+    if (properties is None):
+      (pbs_simname, pbs_walltime, nmachines, ncpus, memory, total_ncpus, mpiprocs, ompthreads, queue, status) = self.get_simname_walltime_ncpus_pbs(sim, pbs_filename=pbs_filename)
+      properties = dict(pbs_walltime=pbs_walltime, nmachines=nmachines, ncpus=ncpus, memory=memory, total_ncpus=total_ncpus, mpiprocs=mpiprocs, ompthreads=ompthreads, queue=queue)
+      # Only successfully parsed scripts are kept, errors are reported again:
+      if (status == 0):
+        self.pbs_cache.put(filename, defaults, properties)
+    sim.update(**properties)
+
+
+  def print_startup_timings(self):
+    """ Prints how many seconds the stages of the startup took.
+    """
+    if (self.verbosity < 2):
+      return
+    total = sum([seconds for (stage, seconds) in self.startup_timings])
+    printc(' Startup of the monitoring of '+str(len(self.simulations))+' simulations took '+'%.2f' % total+' seconds:', 'blue', False); print
+    for (stage, seconds) in self.startup_timings:
+      printc('  '+stage.ljust(20)+'%8.2f' % seconds+' s', 'blue', False); print
+
+
+  def get_simulation(self, dir):
+    """ Returns the state of the simulation in 'dir'.
+        Input:
+         dir: String of the directory name the simulation sits in
+        Output:
+         sim: SimulationState object of this simulation
+    """
+    return self.simulations[dir]
+
+
+  def update_sim_properties(self, dir, **properties):
+    """ Updates the properties of the simulation in 'dir', properties
+        which are None are ignored.
+        Input:
+         dir: String of the directory name the simulation sits in
+         properties: Keyword arguments of the simulation properties,
+           e.g. jobid='123', see SimulationState
+    """
+    with self.dict_lock:
+      self.simulations[dir].update(**properties)
+
+
+  def get_sim_properties(self, sim):
+    """ Returns all simulation properties of the given simulation.
         Input:
-         dir: Current directory name
+         sim: SimulationState object of the simulation
         Output:
          simname: Current simulation name
          jobid: Current jobid
@@ -386,9 +385,10 @@ class Monitoring:
          cluster_dir: Directory on the cluster where the simulation dir is stored
          cluster_fluidity_dir: Directory of the Fluidity branch on the cluster
          error_status: Integer indicating where in the main loop it had an error
-         sim_clean_exit: False if the program exited unsafely during self.dir, True otherwise
+         sim_clean_exit: False if the program exited unsafely during this simulation, True otherwise
     """
-    return self.simname, self.jobid, self.cluster_status, self.cluster_walltime, self.sim_time, self.simulation_running, self.simulation_crashed, self.simulation_finished, self.pbs_walltime, self.nmachines, self.ncpus, self.memory, self.total_ncpus, self.mpiprocs, self.ompthreads, self.nnopercpu, self.infiniband, self.queue, self.cluster_name, self.cluster_dir, self.cluster_fluidity_dir, self.error_status, self.sim_clean_exit
+    with self.dict_lock:
+      return sim.simname, sim.jobid, sim.cluster_status, sim.cluster_walltime, sim.sim_time, sim.simulation_running, sim.simulation_crashed, sim.simulation_finished, sim.pbs_walltime, sim.nmachines, sim.ncpus, sim.memory, sim.total_ncpus, sim.mpiprocs, sim.ompthreads, sim.nnopercpu, sim.infiniband, sim.queue, sim.cluster_name, sim.cluster_dir, sim.cluster_fluidity_dir, sim.error_status, sim.sim_clean_exit
 
 
   def get_dict(self, dir=None):
@@ -397,23 +397,26 @@ class Monitoring:
         all the properties corresponding to that particular simulation are returned,
         else a 2 dimensional dictionary is return which holds all properties
         for all simulations which are monitored/maintained by this class.
+        The dictionaries are assembled from the registry of simulations, thus
+        changing them does not change the state of the simulations.
         Input:
          dir: String of a directory name in which one particular simulation sits in.
         Output:
-         self.dict/self.dict[dir]: A dictionary (1D/2D) holding crucial monitoring
-           properties.
+         dict: A dictionary (1D/2D) holding crucial monitoring properties.
     """
-    if (not (dir is None)):
-      return self.dict[dir]
-    else:
-      return self.dict
+    with self.dict_lock:
+      if (not (dir is None)):
+        return self.simulations[dir].get_dict()
+      else:
+        return dict([(name, sim.get_dict()) for (name, sim) in self.simulations.items()])
     
 
 
   def check_if_previously_ran(self, dir=None):
-    """ This method checks if there are dictionary log files
-        in the default directory 'logfiles'. If there are,
-        then a boolean True is returned, and False otherwise
+    """ This method checks if the state of the simulations was recorded
+        in the state store, or if there are dictionary log files
+        (of older versions) in the default directory 'logfiles'.
+        If there are, then a boolean True is returned, and False otherwise
         Input:
          dir: String of the corresponding simulation directory
            for which the dictionary log file is searched for.
@@ -425,6 +428,8 @@ class Monitoring:
            and False otherwise.
     """
     if (dir is None): # dir was not given
+      if (self.state_store.exists()):
+        return True
       # Check for any dictionary status files:
       (statusfiles, status) = find_file_names('logfiles', 'dict_status_* -maxdepth 0 -not -name "dict_status_table*"')
       if (status == 0):
@@ -432,6 +437,8 @@ class Monitoring:
       else:
         continue_monitoring = False
     else: # specific dir was given:
+      if (self.state_store.has(dir)):
+        return True
       # Check for 'dir' specific dictionary status file:
       (statusfiles, status) = find_file_names('logfiles', 'dict_status_'+dir+' -maxdepth 0 -not -name "dict_status_table*"')
       if (status == 0):
@@ -442,18 +449,22 @@ class Monitoring:
 
 
   def set_dict_from_dict_status(self):
-    """ This method sets the dictionary for all simulations based on the
-        dict_status_* files, that are dumped when the program exits safely.
+    """ This method sets the state of all simulations based on the state
+        store (journal or database), which is replayed. Simulations which
+        are not in the state store are set from their dict_status_* files, as they were dumped
+        by older versions.
     """
-    for dir in self.dict.keys():
+    states = self.state_store.replay()
+    for dir in self.simulations.keys():
+      if (dir in states):
+        self.update_sim_properties(dir, **states[dir])
+        continue
       # Get latest recorded information from dict_status_* files:
       (jobid, simulation_running, simulation_crashed, simulation_finished, simname, sim_time, pbs_walltime, nmachines, ncpus, memory, total_ncpus, mpiprocs, ompthreads, nnopercpu, infiniband, queue, cluster_status, cluster_walltime, cluster_name, cluster_dir, cluster_fluidity_dir, error_status, sim_clean_exit) = self.get_status_from_dict_status(dir)
 
       # Update variables:
       self.update_sim_properties(dir, simname=simname, jobid=jobid, cluster_status=cluster_status, cluster_walltime=cluster_walltime, sim_time=sim_time, simulation_running=simulation_running, simulation_crashed=simulation_crashed, simulation_finished=simulation_finished, pbs_walltime=pbs_walltime, nmachines=nmachines, ncpus=ncpus, memory=memory, total_ncpus=total_ncpus, mpiprocs=mpiprocs, ompthreads=ompthreads, nnopercpu=nnopercpu, infiniband=infiniband, queue=queue, cluster_name=cluster_name, cluster_dir=cluster_dir, cluster_fluidity_dir=cluster_fluidity_dir, error_status=error_status, sim_clean_exit=sim_clean_exit)
 
-      # Update dictionary:
-      self.update_dict(dir, simname=simname, jobid=jobid, cluster_status=cluster_status, cluster_walltime=cluster_walltime, sim_time=sim_time, simulation_running=simulation_running, simulation_crashed=simulation_crashed, simulation_finished=simulation_finished, pbs_walltime=pbs_walltime, nmachines=nmachines, ncpus=ncpus, memory=memory, total_ncpus=total_ncpus, mpiprocs=mpiprocs, ompthreads=ompthreads, nnopercpu=nnopercpu, infiniband=infiniband, queue=queue, cluster_name=cluster_name, cluster_dir=cluster_dir, cluster_fluidity_dir=cluster_fluidity_dir, error_status=error_status, sim_clean_exit=sim_clean_exit)
 
 
   def get_status_from_dict_status(self, dir):
@@ -501,29 +512,30 @@ class Monitoring:
     (files, status) = find_file_names('logfiles', statusfilename+' -maxdepth 0 -not -name "dict_status_table*"')
     # if file was does not exist, use initial values for parameters:
     if (not status == 0):
-      simname = self.dict[dir]['simname']
-      jobid = self.dict[dir]['jobid']
-      status = self.dict[dir]['status']
-      walltime = self.dict[dir]['walltime']
-      sim_time = self.dict[dir]['sim_time']
-      simulation_running = self.dict[dir]['simulation_running']
-      simulation_crashed = self.dict[dir]['simulation_crashed']
-      simulation_finished = self.dict[dir]['simulation_finished']
-      pbs_walltime = self.dict[dir]['pbs_walltime']
-      nmachines = self.dict[dir]['nmachines']
-      ncpus = self.dict[dir]['ncpus']
-      memory = self.dict[dir]['memory']
-      total_ncpus = self.dict[dir]['total_ncpus']
-      mpiprocs = self.dict[dir]['mpiprocs']
-      ompthreads = self.dict[dir]['ompthreads']
-      nnopercpu = self.dict[dir]['nnopercpu']
-      infiniband = self.dict[dir]['infiniband']
-      queue = self.dict[dir]['queue']
-      cluster_name = self.dict[dir]['cluster_name']
-      cluster_dir = self.dict[dir]['cluster_dir']
-      cluster_fluidity_dir = self.dict[dir]['cluster_fluidity_dir']
-      error_status = self.dict[dir]['error_status']
-      sim_clean_exit = self.dict[dir]['sim_clean_exit']
+      sim = self.simulations[dir]
+      simname = sim.simname
+      jobid = sim.jobid
+      status = sim.cluster_status
+      walltime = sim.cluster_walltime
+      sim_time = sim.sim_time
+      simulation_running = sim.simulation_running
+      simulation_crashed = sim.simulation_crashed
+      simulation_finished = sim.simulation_finished
+      pbs_walltime = sim.pbs_walltime
+      nmachines = sim.nmachines
+      ncpus = sim.ncpus
+      memory = sim.memory
+      total_ncpus = sim.total_ncpus
+      mpiprocs = sim.mpiprocs
+      ompthreads = sim.ompthreads
+      nnopercpu = sim.nnopercpu
+      infiniband = sim.infiniband
+      queue = sim.queue
+      cluster_name = sim.cluster_name
+      cluster_dir = sim.cluster_dir
+      cluster_fluidity_dir = sim.cluster_fluidity_dir
+      error_status = sim.error_status
+      sim_clean_exit = sim.sim_clean_exit
       # And create bkup directory for this simulation, as we have to assume this is new:
       out = commands.getoutput('cd '+dir+'/; mkdir bkup')
     else: # if the corresponding dictionary log file exists, extract data from it:
@@ -662,21 +674,37 @@ class Monitoring:
       msgtype='log'
     # In any case, do:
     finally:
-      # Get current dictionary:
-      mydict = self.get_dict()
-      # Setting the status clean_exit of all other simulations to 'True':
-      for dir in mydict.keys():
-        if (not (dir == self.dir)):
-          self.update_sim_properties(dir=dir, sim_clean_exit=True)
-          # And update dict-file of that directory/simulation:
-          self.write_simulation_status_to_file(dir=dir)
-      # Update local dictionary:
-      mydict = self.get_dict()
-      # Also, update the pgf table:
-      self.write_dict_status_pgftable(mydict, printcols=self.table_header, pdflatex=True, pdfcrop=True)
-      attachment = 'logfiles/cropped_dict_status_table.pdf'
-      # Distribute the error assembled message:
-      self.messaging.message_handling(self.dir, msg, 0, msgtype=msgtype, subject=subject, attachment=attachment)
+      try:
+        # Setting the status clean_exit of all other simulations to 'True',
+        # apart from the ones that were interrupted while being processed:
+        for dir in self.simulations.keys():
+          if (not (dir in self.active_dirs)):
+            self.update_sim_properties(dir=dir, sim_clean_exit=True)
+            # And update dict-file of that directory/simulation:
+            self.write_simulation_status_to_file(dir=dir)
+        # Write all (also the interrupted simulations') state transitions to disk:
+        self.state_store.flush()
+        # Update local dictionary:
+        mydict = self.get_dict()
+        # Also, update the html and pgf table, and wait for it before exiting:
+        self.write_dict_status_html(mydict)
+        self.write_dict_status_pgftable(mydict, printcols=self.table_header, pdflatex=True, pdfcrop=True, wait=True)
+        attachment = 'logfiles/cropped_dict_status_table.pdf'
+        # Distribute the error assembled message, to the log files of an
+        # interrupted simulation if there is one:
+        if (self.active_dirs): msgdir = sorted(self.active_dirs)[0]
+        else: msgdir = '.'
+        self.messaging.message_handling(msgdir, msg, 0, msgtype=msgtype, subject=subject, attachment=attachment)
+        # Send the remaining emails of digest mode:
+        self.messaging.flush_digest(attachment=attachment, force=True)
+        # Wait until all emails/popups were sent, but not forever, as a
+        # hanging mutt/notify-send must not keep the program from exiting:
+        self.messaging.drain_notifications(timeout=self.notify_timeout)
+        self.messaging.flush_logs(close=True)
+      finally:
+        # Finally, close all master connections to the cluster(s), even if
+        # one of the steps above failed:
+        self.ssh_pool.close_all()
 
 
 
@@ -706,257 +734,35 @@ class Monitoring:
     #first_run = not ran_previously
     first_run = True
 
-    # Get dictionary:
-    mydict = self.get_dict()
-
     # Loop until all simulation in all subdirectories have finished:
     while (not all_simulation_finished):
+      # Every round starts with a fresh job table from the cluster(s),
+      # and fresh listings of the directories:
+      self.invalidate_qstat_snapshots()
+      directory_cache.clear()
       # Loop over all directories in the current directory:
-      for dir in sort_string_list(mydict.keys()):
-
-        # set first_run boolean, to check if this simulation has run before:
-        if (first_iteration):
-          first_run = not self.check_if_previously_ran(dir)
-
-        # Update the current simulation properties, and dictionary
-        self.set_sim_properties_from_dict(dir)
-        # Get paramerters of the current simulation:
-        (simname, jobid, cluster_status, cluster_walltime, time,
-              simulation_running, simulation_crashed, simulation_finished,
-              pbs_walltime, nmachines, ncpus, memory, total_ncpus, mpiprocs,
-              ompthread, nnopercpu, infiniband, queue, cluster_name, cluster_dir,
-              cluster_fluidity_dir, error_status, sim_clean_exit) = self.get_sim_properties(dir)
-
-
-        # If the simulation has been flagged as finished, continue:
-        if (simulation_finished):
-          continue
-
-        # Now set the sim_clean_exit status for this simulation to False:
-        if (not first_iteration):
-          sim_clean_exit = False
-          self.update_sim_properties(dir=dir, sim_clean_exit=sim_clean_exit)
-          self.write_simulation_status_to_file(dir=dir) # And write this to file!
-
-        # Get "qstat -a" from cluster to check which simulations are running:
-        # simulation_running = True/False
-        if (error_status in [0, 1]):
-          try:
-            (simulation_running, status) = self.check_cluster_for_simulation_running()
-          except SSHConnectionException:
-            # This exception means that the service is currently either not available,
-            # or hammered and thus is too busy to respond in time, so set 
-            # error_status accordingly and skip next steps in the monitoring:
-            error_status = 1
-            # And skip the rest of routine calls:
-            continue
-          except SSHQstatException:
-            # This exception was thrown because the output from "qstat -a" did not 
-            # contain excepted substrings, thus something went wrong, and we should
-            # check again later...
-            error_status = 1
-            # And skip the rest of routine calls:
-            continue
-          except SSHCrucialConnectionException:
-            # This exception indicates that there is sth seriously wrong, e.g.
-            # username, clustername, etc.
-            # Thus in such an event, quit the program and give the user an appropriate
-            # error message:
-            error_status = 1; sim_clean_exit = True
-            # Raise the exception that will be caught in the main loop:
-            raise CheckClusterForSimulationRunningException
-          except:
-            # Unexpected exception caught, set variables and throw exception for this operation:
-            error_status = 1; sim_clean_exit = True
-            raise CheckClusterForSimulationRunningException
-          else: # If no exception was caught:
-            if (status != 0): error_status = 1
-            else: error_status = 0
-            sim_clean_exit = True
-          finally: # In any case, update error_status and sim_clean_exit:
-            # Update error status and sim_clean_exit status in Monitoring class
-            self.update_sim_properties(dir, simulation_running=simulation_running, error_status=error_status, sim_clean_exit=sim_clean_exit)
-            # Write status to file:
-            self.write_simulation_status_to_file(dir=dir)
-          # skip to next simulation if this simulation is marked as "running":
-          if (simulation_running):
-            sim_clean_exit = True
-            # skip next steps only if running on cx1:
-            if ('cx1' in cluster_name.lower()):
-              continue
-
-        # Print directory that is being processed in the terminal:
-        print "\n\n"
-        terminalmsg = "| Processing dir = %s |" % dir
-        terminaloutline = self.get_ascii_string(terminalmsg, character='=')
-        print terminaloutline+'\n'+terminalmsg+'\n'+terminaloutline
-
-        # If simulation is not running, scp data/results to local machine
-        if (not simulation_crashed and not first_run and error_status in [0, 2]):
-          try:
-            status = self.scp_data_from_cluster(cluster_name, self.cluster_dir, dir, simname, running=simulation_running)
-          except (SSHConnectionException, SCPException, LocalOperationException, TarCrucialException):
-            # These exceptions are just an indicator for the cluster not responding,
-            # or that the just scp'ed file was not found on the local machine
-            # so set error_status and skip following task, until the next iteration 
-            # when this process will be repeated:
-            error_status = 2
-            # And skip the rest of routine calls:
-            continue
-          except (SSHCrucialConnectionException, SCPCrucialException, DiskQuotaException):
-            # These exceptions indicate that the setup/permissions must be wrong, or the
-            # disk quota on the cluster is exceeded, or an unknown error was found
-            # during the operation.
-            # This can only be fixed by the user/through debugging:
-            error_status = 2; sim_clean_exit = True
-            # Exit program:
-            raise SCPDataFromClusterException
-          except:
-            # Any other exception/error that occured during that operation:
-            error_status = 2; sim_clean_exit = True
-            raise SCPDataFromClusterException
-          else: # If no exception was caught:
-            if (status != 0): error_status = 2
-            else: error_status = 0
-          finally: # In any case, update error_status and sim_clean_exit:
-            # Update error status and sim_clean_exit status in Monitoring class
-            self.update_sim_properties(dir, error_status=error_status, sim_clean_exit=sim_clean_exit)
-            # Write status to file:
-            self.write_simulation_status_to_file(dir=dir)
-            # skip to next simulation if this simulation is still "running":
-          if (simulation_running):
-            sim_clean_exit = True
-            continue
-
-
-        # Check for simulation failure:
-        if (not simulation_crashed and not first_run and error_status in [0, 3]):
-          # Check for simulation crash:
-          try:
-            simulation_crashed = self.check_for_simulation_error(dir)
-            # If simulation_crashed is true, raise exception:
-            if (simulation_crashed):
-              raise SimulationError
-          except SimulationError:
-            # Set error_status to 3:
-            error_status = 3
-            # And if an error was found, set simulation_crashed to True,
-            # plus skip/continue to the next iteration, as the simulation must be fixed manually!
-            simulation_crashed = True
-            continue
-          except:
-            # Either any exception was caught, or disk quota was exceeded:
-            error_status = 3; sim_clean_exit = True
-            raise CheckForSimulationErrorException # Program will end!
-          else:
-            error_status = 0
-          finally: # In any case, update error_status and sim_clean_exit:
-            # Update error status and sim_clean_exit status in Monitoring class
-            self.update_sim_properties(dir, error_status=error_status, sim_clean_exit=sim_clean_exit)
-            # Write status to file:
-            self.write_simulation_status_to_file(dir=dir)
-        # If simulation has been flagged as crashed previously, check if it has been taken care of manually:
-        elif (simulation_crashed and error_status in [0, 3, 4, 6]): 
-          simulation_crashed = self.check_fixed_sim(dir)
-          if (simulation_crashed): error_status = 3 # sim is still flagged as crashed
-          else:
-            error_status = 0 # sim was manually fixed!
-            # Update simulation_crashed and error_status in Monitoring class:
-            self.update_sim_properties(dir, error_status=error_status, simulation_crashed=simulation_crashed)
-            # Write status to file:
-            self.write_simulation_status_to_file(dir=dir)
-            # Also, remove fluidity output files from 'dir' that belong the previous run (the one that crashed!):
-            self.remove_previous_fluidity_output_files(dir=dir)
-
-##########################################
-# Continue here!                         #
-##########################################
-        # Append data from stat/detector files to previous files:
-        if (not simulation_crashed and not first_run):
-          if (error_status in [0, 4]):
-            simulation_crashed = self.append_resfiles(dir, simname)
-            if (simulation_crashed): error_status = 4
-    #          errormsg = 'Error: An error occured during the attempt to append results from stat/detector files.'
-    #          subject = 'Error'
-    #          monitor.send_email(dir, email, errormsg='err', subject=subject)
-    #          monitor.notify_popup(subject, errormsg)
-            else: error_status = 0
-            # Update error status in Monitoring class
-            self.update_sim_properties(dir, error_status=error_status)
-          if (error_status in [0, 5]):
-            # Rename checkpoint:
-            status = self.renaming_checkpoint(dir, simname, ncpus)
-            if (status != 0): error_status = 5
-            else: error_status = 0
-            # Update error status in Monitoring class
-            self.update_sim_properties(dir, error_status=error_status)
-
-        # Check if the simulation has finished finished, plus get latest checkpoint flml filename:
-        if (not simulation_crashed and error_status in [0, 6]):
-          # Make some required changes, e.g. change flml in pbs-script, append stat-file to previous-statfile,
-          # change simulation name in checkpointed flml-file, rename vtu files such that they are 
-          # corresponding to the previous run, copy bkup files to ./dir/bkup/ ...:
-          try:
-            (simulation_finished, tar_filename) = self.postprocess_simulation(dir, cluster_name=cluster_name)
-          except SSHConnectionException:
-            error_status = 6
-            continue
-          except SSHCrucialConnectionException:
-            error_status = 6; sim_clean_exit = True
-            raise CleanClusterDirException
-          except:
-            # Unexpected exception caught, set variables and throw exception for this operation:
-            error_status = 6; sim_clean_exit = True
-            raise CleanClusterDirException
-          else: # If no exception was caught:
-            error_status = 0
-          finally: # In any case, update error_status and sim_clean_exit:
-            # Update error status and sim_clean_exit and status in Monitoring class
-            self.update_sim_properties(dir, error_status=error_status, sim_clean_exit=sim_clean_exit)
-            # Write status to file:
-            self.write_simulation_status_to_file(dir=dir)
-
-        # Send the tar file to cluster and submit job to the queue:
-        if (not simulation_crashed and not simulation_finished and error_status in [0, 7]):
-          # If error_status is 7, make sure the tar_filename is set correctly (otherwise it would crash when restarting the script with error status being 7)
-          if (error_status == 7):
-            tar_filename = dir+'.tar' # default value of tar_filename
-          try:
-            (jobid, simulation_crashed, status) = self.submit_on_cluster(cluster_name, self.cluster_dir, dir, tar_filename)
-          except DiskQuotaException:
-            print 'Exiting program. Fix disk quota on cluster '+cluster_name
-            exit()
-          except:
-            print 'Error: Unknown error found during submit_on_cluster'
-            exit()
-          if (status != 0): error_status = 7
-          else: error_status = 0
-          # Update error status in Monitoring class
-          self.update_sim_properties(dir, error_status=error_status)
-          if (error_status == 0):
-            simulation_running = True
-            # Clean up the directory on local machine, and make copy of tarfile and stat/detectors* files in ./dir/bkup/:
-            self.clean_and_bkup_local_dir(dir, tar_filename)
-          else:
-            simulation_running = False
-        elif (simulation_finished and error_status == 0):
-          # Final clean up of local directory:
-          self.clean_and_bkup_local_dir(dir, tar_filename)
-
-        # If it reaches here, the current simulation finished its iteration without exceptions/error:
-        # Setting sim_clean_exit variable for this simulation to True:
-        self.update_sim_properties(dir=dir, sim_clean_exit=True)
-        # End of for loop: Store values in dictionary:
-#        self.update_dict(dir=dir, jobid=jobid, simulation_running=simulation_running, simulation_crashed=simulation_crashed, simulation_finished=simulation_finished)
-        # Update this directory:
-        mydict = self.get_dict()
-
-        # Write status to file:
-        self.write_simulation_status_to_file(dir=dir)
-
-
-      # Update table for overall status/overview:
+      dirs = sort_string_list(self.simulations.keys())
+      if (self.nworkers > 1):
+        # Process many simulations at once:
+        self.run_simulation_pool(dirs, first_iteration)
+      else:
+        for dir in dirs:
+          self.active_dirs.add(dir)
+          self.process_simulation(self.get_simulation(dir), first_iteration)
+          self.active_dirs.discard(dir)
+
+      # Write the state transitions and log messages of this round to disk at once:
+      self.state_store.flush()
+      self.messaging.flush_logs()
+      # Get current dictionary:
+      mydict = self.get_dict()
+      # Update table for overall status/overview. The pdf table is rendered
+      # in the background, at most every 'table_interval' seconds and only
+      # if the table changed:
+      self.write_dict_status_html(mydict)
       self.write_dict_status_pgftable(mydict, printcols=self.table_header, pdflatex=True, pdfcrop=True)
+      # Send the emails of this round as one summary email:
+      self.flush_digest(mydict)
 
 
       # Loop over all entries in the dictionary and find out if all simulations
@@ -986,7 +792,7 @@ class Monitoring:
           # in case sth goes wrong, the status file is already in place
           # self.write_dict_status_to_file()
           # Assemble report:
-          message = '# Clean exit: Status files of simulations have been dumped to ./logfiles/dict_status_* #'
+          message = '# Clean exit: Status of simulations has been dumped to ./logfiles #'
           hashes = self.get_hashes(message)
           message = hashes+'\n'+message+'\n'+hashes
           self.messaging.message_handling('.', message, 0, msgtype='log', subject='Clean exit')
@@ -1004,15 +810,328 @@ class Monitoring:
   # End of main monitoring loop
 
 
-  def get_simname_walltime_ncpus_pbs(self, dir=None, pbs_filename='pbs.sh'):
+  def process_simulation(self, sim, first_iteration=False):
+    """ This method runs one simulation through all stages of the monitoring,
+        meaning checking the queue on the cluster (error_status 1), syncing the
+        results from the cluster (2), checking for simulation errors (3),
+        appending results (4), renaming checkpoints (5), postprocessing (6),
+        and submitting the simulation to the cluster again (7). Exceptions
+        that can only be fixed by the user are raised again, and are caught
+        in 'run_monitoring'.
+        Input:
+         sim: SimulationState object of the simulation
+         first_iteration: Boolean which is True during the first round of
+           the monitoring
+    """
+    dir = sim.dir
+    # set first_run boolean, to check if this simulation has run before:
+    first_run = False
+    if (first_iteration):
+      first_run = not self.check_if_previously_ran(dir)
+
+    # Get paramerters of the current simulation:
+    (simname, jobid, cluster_status, cluster_walltime, time,
+          simulation_running, simulation_crashed, simulation_finished,
+          pbs_walltime, nmachines, ncpus, memory, total_ncpus, mpiprocs,
+          ompthread, nnopercpu, infiniband, queue, cluster_name, cluster_dir,
+          cluster_fluidity_dir, error_status, sim_clean_exit) = self.get_sim_properties(sim)
+
+
+    # If the simulation has been flagged as finished, skip it:
+    if (simulation_finished):
+      return
+
+    # Now set the sim_clean_exit status for this simulation to False:
+    if (not first_iteration):
+      sim_clean_exit = False
+      self.update_sim_properties(dir=dir, sim_clean_exit=sim_clean_exit)
+      self.write_simulation_status_to_file(dir=dir) # And write this to file!
+
+    # Get "qstat -a" from cluster to check which simulations are running:
+    # simulation_running = True/False
+    if (error_status in [0, 1]):
+      try:
+        (simulation_running, status) = self.check_cluster_for_simulation_running(sim)
+      except SSHConnectionException:
+        # This exception means that the service is currently either not available,
+        # or hammered and thus is too busy to respond in time, so set 
+        # error_status accordingly and skip next steps in the monitoring:
+        error_status = 1
+        # And skip the rest of routine calls:
+        return
+      except SSHQstatException:
+        # This exception was thrown because the output from "qstat -a" did not 
+        # contain excepted substrings, thus something went wrong, and we should
+        # check again later...
+        error_status = 1
+        # And skip the rest of routine calls:
+        return
+      except SSHCrucialConnectionException:
+        # This exception indicates that there is sth seriously wrong, e.g.
+        # username, clustername, etc.
+        # Thus in such an event, quit the program and give the user an appropriate
+        # error message:
+        error_status = 1; sim_clean_exit = True
+        # Raise the exception that will be caught in the main loop:
+        raise CheckClusterForSimulationRunningException
+      except:
+        # Unexpected exception caught, set variables and throw exception for this operation:
+        error_status = 1; sim_clean_exit = True
+        raise CheckClusterForSimulationRunningException
+      else: # If no exception was caught:
+        if (status != 0): error_status = 1
+        else: error_status = 0
+        sim_clean_exit = True
+      finally: # In any case, update error_status and sim_clean_exit:
+        # Update error status and sim_clean_exit status in Monitoring class
+        self.update_sim_properties(dir, simulation_running=simulation_running, error_status=error_status, sim_clean_exit=sim_clean_exit)
+        # Write status to file:
+        self.write_simulation_status_to_file(dir=dir)
+      # skip to next simulation if this simulation is marked as "running":
+      if (simulation_running):
+        sim_clean_exit = True
+        # skip next steps only if running on cx1:
+        if ('cx1' in cluster_name.lower()):
+          return
+
+    # Print directory that is being processed in the terminal:
+    print "\n\n"
+    terminalmsg = "| Processing dir = %s |" % dir
+    terminaloutline = self.get_ascii_string(terminalmsg, character='=')
+    print terminaloutline+'\n'+terminalmsg+'\n'+terminaloutline
+
+    # If simulation is not running, scp data/results to local machine
+    if (not simulation_crashed and not first_run and error_status in [0, 2]):
+      try:
+        status = self.scp_data_from_cluster(sim, cluster_name, cluster_dir, simname, running=simulation_running)
+      except (SSHConnectionException, SCPException, LocalOperationException, TarCrucialException):
+        # These exceptions are just an indicator for the cluster not responding,
+        # or that the just scp'ed file was not found on the local machine
+        # so set error_status and skip following task, until the next iteration 
+        # when this process will be repeated:
+        error_status = 2
+        # And skip the rest of routine calls:
+        return
+      except (SSHCrucialConnectionException, SCPCrucialException, DiskQuotaException):
+        # These exceptions indicate that the setup/permissions must be wrong, or the
+        # disk quota on the cluster is exceeded, or an unknown error was found
+        # during the operation.
+        # This can only be fixed by the user/through debugging:
+        error_status = 2; sim_clean_exit = True
+        # Exit program:
+        raise SCPDataFromClusterException
+      except:
+        # Any other exception/error that occured during that operation:
+        error_status = 2; sim_clean_exit = True
+        raise SCPDataFromClusterException
+      else: # If no exception was caught:
+        if (status != 0): error_status = 2
+        else: error_status = 0
+      finally: # In any case, update error_status and sim_clean_exit:
+        # Update error status and sim_clean_exit status in Monitoring class
+        self.update_sim_properties(dir, error_status=error_status, sim_clean_exit=sim_clean_exit)
+        # Write status to file:
+        self.write_simulation_status_to_file(dir=dir)
+        # skip to next simulation if this simulation is still "running":
+      if (simulation_running):
+        sim_clean_exit = True
+        return
+
+
+    # Check for simulation failure:
+    if (not simulation_crashed and not first_run and error_status in [0, 3]):
+      # Check for simulation crash:
+      try:
+        simulation_crashed = self.check_for_simulation_error(sim)
+        # If simulation_crashed is true, raise exception:
+        if (simulation_crashed):
+          raise SimulationError
+      except SimulationError:
+        # Set error_status to 3:
+        error_status = 3
+        # And if an error was found, set simulation_crashed to True,
+        # plus skip/continue to the next iteration, as the simulation must be fixed manually!
+        simulation_crashed = True
+        return
+      except:
+        # Either any exception was caught, or disk quota was exceeded:
+        error_status = 3; sim_clean_exit = True
+        raise CheckForSimulationErrorException # Program will end!
+      else:
+        error_status = 0
+      finally: # In any case, update error_status and sim_clean_exit:
+        # Update error status and sim_clean_exit status in Monitoring class
+        self.update_sim_properties(dir, error_status=error_status, sim_clean_exit=sim_clean_exit)
+        # Write status to file:
+        self.write_simulation_status_to_file(dir=dir)
+    # If simulation has been flagged as crashed previously, check if it has been taken care of manually:
+    elif (simulation_crashed and error_status in [0, 3, 4, 6]): 
+      simulation_crashed = self.check_fixed_sim(dir)
+      if (simulation_crashed): error_status = 3 # sim is still flagged as crashed
+      else:
+        error_status = 0 # sim was manually fixed!
+        # Update simulation_crashed and error_status in Monitoring class:
+        self.update_sim_properties(dir, error_status=error_status, simulation_crashed=simulation_crashed)
+        # Write status to file:
+        self.write_simulation_status_to_file(dir=dir)
+        # Also, remove fluidity output files from 'dir' that belong the previous run (the one that crashed!):
+        self.remove_previous_fluidity_output_files(dir=dir)
+        self.logscanner.forget(dir)
+
+##########################################
+# Continue here!                         #
+##########################################
+    # Append data from stat/detector files to previous files:
+    if (not simulation_crashed and not first_run):
+      if (error_status in [0, 4]):
+        simulation_crashed = self.append_resfiles(dir, simname)
+        if (simulation_crashed): error_status = 4
+#          errormsg = 'Error: An error occured during the attempt to append results from stat/detector files.'
+#          subject = 'Error'
+#          monitor.send_email(dir, email, errormsg='err', subject=subject)
+#          monitor.notify_popup(subject, errormsg)
+        else: error_status = 0
+        # Update error status in Monitoring class
+        self.update_sim_properties(dir, error_status=error_status)
+      if (error_status in [0, 5]):
+        # Rename checkpoint:
+        status = self.renaming_checkpoint(dir, simname, ncpus)
+        if (status != 0): error_status = 5
+        else: error_status = 0
+        # Update error status in Monitoring class
+        self.update_sim_properties(dir, error_status=error_status)
+
+    # Check if the simulation has finished finished, plus get latest checkpoint flml filename:
+    if (not simulation_crashed and error_status in [0, 6]):
+      # Make some required changes, e.g. change flml in pbs-script, append stat-file to previous-statfile,
+      # change simulation name in checkpointed flml-file, rename vtu files such that they are 
+      # corresponding to the previous run, copy bkup files to ./dir/bkup/ ...:
+      try:
+        (simulation_finished, tar_filename) = self.postprocess_simulation(sim, cluster_name=cluster_name)
+      except SSHConnectionException:
+        error_status = 6
+        return
+      except SSHCrucialConnectionException:
+        error_status = 6; sim_clean_exit = True
+        raise CleanClusterDirException
+      except:
+        # Unexpected exception caught, set variables and throw exception for this operation:
+        error_status = 6; sim_clean_exit = True
+        raise CleanClusterDirException
+      else: # If no exception was caught:
+        error_status = 0
+      finally: # In any case, update error_status and sim_clean_exit:
+        # Update error status and sim_clean_exit and status in Monitoring class
+        self.update_sim_properties(dir, error_status=error_status, sim_clean_exit=sim_clean_exit)
+        # Write status to file:
+        self.write_simulation_status_to_file(dir=dir)
+
+    # Send the tar file to cluster and submit job to the queue:
+    if (not simulation_crashed and not simulation_finished and error_status in [0, 7]):
+      # If error_status is 7, make sure the tar_filename is set correctly (otherwise it would crash when restarting the script with error status being 7)
+      if (error_status == 7):
+        tar_filename = self.get_archive_filename(dir) # default value of tar_filename
+      try:
+        (jobid, simulation_crashed, status) = self.submit_on_cluster(sim, cluster_name, cluster_dir, tar_filename)
+      except DiskQuotaException:
+        print 'Exiting program. Fix disk quota on cluster '+cluster_name
+        exit()
+      except:
+        print 'Error: Unknown error found during submit_on_cluster'
+        exit()
+      if (status != 0): error_status = 7
+      else: error_status = 0
+      # Update error status in Monitoring class
+      self.update_sim_properties(dir, error_status=error_status)
+      if (error_status == 0):
+        simulation_running = True
+        # The new run writes new log files:
+        self.logscanner.forget(dir)
+        # Clean up the directory on local machine, and make copy of tarfile and stat/detectors* files in ./dir/bkup/:
+        self.clean_and_bkup_local_dir(sim, tar_filename)
+      else:
+        simulation_running = False
+    elif (simulation_finished and error_status == 0):
+      # Final clean up of local directory:
+      self.clean_and_bkup_local_dir(sim, tar_filename)
+
+    # If it reaches here, the current simulation finished its iteration without exceptions/error:
+    # Setting sim_clean_exit variable for this simulation to True:
+    self.update_sim_properties(dir=dir, sim_clean_exit=True)
+    # End of for loop: Store values in dictionary:
+#        self.update_dict(dir=dir, jobid=jobid, simulation_running=simulation_running, simulation_crashed=simulation_crashed, simulation_finished=simulation_finished)
+
+    # Write status to file:
+    self.write_simulation_status_to_file(dir=dir)
+
+
+  def run_simulation_pool(self, dirs, first_iteration=False):
+    """ This method processes the simulations in 'dirs' concurrently in a
+        pool of 'self.nworkers' worker threads. Every worker handles one
+        simulation at a time, and passes its SimulationState object through
+        all stages of the monitoring. If an exception is raised
+        while processing a simulation, no further simulations are started,
+        and the exception is raised again once all workers have stopped,
+        such that 'run_monitoring' handles it as usual.
+        Input:
+         dirs: List of directory names of the simulations to process
+         first_iteration: Boolean which is True during the first round of
+           the monitoring
+    """
+    tasks = Queue.Queue()
+    for dir in dirs:
+      tasks.put(dir)
+    # Exceptions raised in the workers:
+    failures = []
+
+    def worker():
+      while (not failures):
+        try:
+          dir = tasks.get_nowait()
+        except Queue.Empty:
+          break
+        with self.dict_lock:
+          self.active_dirs.add(dir)
+        try:
+          self.process_simulation(self.get_simulation(dir), first_iteration)
+        except BaseException:
+          failures.append(sys.exc_info())
+        else:
+          with self.dict_lock:
+            self.active_dirs.discard(dir)
+
+    threads = []
+    for i in range(min(self.nworkers, len(dirs))):
+      thread = threading.Thread(target=worker, name='monitoring-worker-'+str(i))
+      thread.daemon = True
+      thread.start()
+      threads.append(thread)
+    try:
+      for thread in threads:
+        # join with a timeout, otherwise KeyboardInterrupt is not received:
+        while (thread.is_alive()):
+          thread.join(1.0)
+    except BaseException:
+      # Do not start any other simulation:
+      failures.append(sys.exc_info())
+      raise
+    if (failures):
+      # Raise the first exception again in the main thread:
+      (exc_type, exc_value, exc_traceback) = failures[0]
+      raise exc_type, exc_value, exc_traceback
+
+
+
+  def get_simname_walltime_ncpus_pbs(self, sim, pbs_filename='pbs.sh'):
     """ Parses a given pbs-script to find the pbs-simname, 
         and the specified number of cpus, and returns the
         both, simname and total number of processes the
         simulation in running on, which is number of 
         machines * number of cpus (per machine)
         Input:
-         dir: String of the directory name where the pbs
-           script is in.
+         sim: SimulationState object of the simulation, whose
+           properties are the defaults for the values not set
+           in the pbs script.
          pbs_filename(optional): overwrites the default value
            'pbs.sh' in case the filename of the pbs script
            is not 'pbs.sh'.
@@ -1031,19 +1150,18 @@ class Monitoring:
          status: Integer which is 0, if the simname and ncpus 
            were successfully extracted from the pbs-script.
     """
-    if (dir is None):
-      dir = self.dir
+    dir = sim.dir
     # Check if this is for cx1/2 or hector:
-    if ('cx1' in self.cluster_name or 'cx2' in self.cluster_name):
+    if ('cx1' in sim.cluster_name or 'cx2' in sim.cluster_name):
       ict = True; hector = False
-    elif ('hector' in self.cluster_name):
+    elif ('hector' in sim.cluster_name):
       ict = False; hector = True
     else:
-      raise SystemExit("In 'get_simname_walltime_ncpus_pbs', could not recognize value of 'cluster_name': "+str(self.cluster_name))
+      raise SystemExit("In 'get_simname_walltime_ncpus_pbs', could not recognize value of 'cluster_name': "+str(sim.cluster_name))
     # Start processing:
     # Initializing some job specific variables in case they are not read from the pbs file:
-    nmachines=self.nmachines; ncpus=self.ncpus; memory=self.memory
-    mpiprocs=self.mpiprocs; ompthreads=self.ompthreads
+    nmachines=sim.nmachines; ncpus=sim.ncpus; memory=sim.memory
+    mpiprocs=sim.mpiprocs; ompthreads=sim.ompthreads
     # status variable and initializing total number of cores used:
     status = 1; total_ncpus = -1
     searchstring_simname = '#PBS -N' # search for pbs simname
@@ -1078,9 +1196,9 @@ class Monitoring:
         # Setting specific pbs queue:
         if (line.startswith(searchstring_queue)):
           queue_string_found = True
-          if (str(self.queue) == 'None'):
+          if (str(sim.queue) == 'None'):
             queue = line.split(searchstring_queue)[-1].split('#')[0]
-          else: queue = str(self.queue)
+          else: queue = str(sim.queue)
       elif ((ict and searchstring_ncpus in line) or (hector and searchstring_ncpupn in line or hector and searchstring_nprocs in line)):
         # first, check for ICT clusters:
         if (ict):
@@ -1134,99 +1252,48 @@ class Monitoring:
               errormsg = 'Error: Could not converts nmachines, ncpus found in pbs script to integers!'
               self.messaging.write_to_log_err_file(dir, errormsg, msgtype='err')
     if (not queue_string_found):
-      queue = str(self.queue)
+      queue = str(sim.queue)
     return pbs_simname, pbs_walltime, nmachines, ncpus, memory, total_ncpus, mpiprocs, ompthreads, queue, status
 
 
-  def check_for_simulation_error(self, dir=None):
+  def check_for_simulation_error(self, sim):
     """ This subroutines parses the stdout and stderr
         files for distinctive strings that indicate
         a simulation crash
         Input:
-         dir: String of the directory to check for 
-           stdout and stderr files
+         sim: SimulationState object of the simulation, whose
+           directory is checked for stdout and stderr files
         Output:
          simulation_crashed: Logical which is True if an error
            occured.
     """
-    if (dir is None):
-      dir = self.dir
+    dir = sim.dir
     # Logical for errors, true if sign of error was found:
     error_found = False
     # First check if stdout and stderr are present:
-    (filenames, status) = find_file_names(dir, 'stdout stderr')
-    if (status != 0):
+    if (not (os.path.isfile(dir+'/stdout') and os.path.isfile(dir+'/stderr'))):
       error_found = True
       errormsg = "ERROR: Files 'stdout/stderr' were not found!"
-    # Now check stdout/stderr for distinctive strings indicating errors:
-    if (not error_found):
-      cmd = 'fgrep "caused collective abort" '+dir+'/stdout'
-      shellout = commands.getoutput(cmd)
-      if (shellout != '' and shellout.rfind("No such file or directory") == -1):
-        error_found = True
-        errormsg = "ERROR: 'Collective abort' found in file: "+dir+"/stdout"
-    # Second check the stderr file for any signs of errors
-    if (not error_found):
-      cmd = 'fgrep "*** ERROR ***" '+dir+'/stderr'
-      shellout = commands.getoutput(cmd)
-      if (shellout != '' and shellout.rfind("No such file or directory") == -1):
-        error_found = True
-        errormsg = "ERROR: '*** ERROR ***' found in file: "+dir+"/stderr"
-    # Also the fluidity error file of course
-    if (not error_found):
-      cmd = 'fgrep "*** ERROR ***" '+dir+'/fluidity.err-*'
-      shellout = commands.getoutput(cmd)
-      if (shellout != '' and shellout.rfind("No such file or directory") == -1):
-        error_found = True
-        errormsg = "ERROR: '*** ERROR ***' found in file: "+dir+"/fluidity.err-*"
-    if (not error_found):
-      cmd = 'fgrep "error" '+dir+'/fluidity.err-*'
-      shellout = commands.getoutput(cmd)
-      if (shellout != '' and shellout.rfind("No such file or directory") == -1):
-        error_found = True
-        errormsg = "ERROR: 'error' found in file: "+dir+"/fluidity.err-*"
-    # different kinds of errors we can expect:
-    if (not error_found):
-      cmd = 'fgrep "ERROR:" '+dir+'/stderr'
-      shellout = commands.getoutput(cmd)
-      if (shellout != '' and shellout.rfind("No such file or directory") == -1):
-        error_found = True
-        errormsg = "ERROR: 'ERROR:' found in file: "+dir+"/stderr"
-    # Checking if executable could not be run:
-    if (not error_found):
-      cmd = 'fgrep "cannot be run." '+dir+'/stdout'
-      shellout = commands.getoutput(cmd)
-      if (shellout != '' and shellout.find("No such file or directory") == -1):
-        error_found = True
-        errormsg = "ERROR: 'Executable could not be run' found in file: "+dir+"/stdout"
-#    # And checking, if PBS allocated nodes for the job, if not, it didn't run at all:
-#    if (not error_found):
-#      cmd = 'fgrep "PBS has allocated the following nodes:" '+dir+'/stdout'
-#      shellout = commands.getoutput(cmd)
-#      if (shellout == '' or shellout.find("PBS has allocated the following nodes:") == -1):
-#        error_found = True
-#        errormsg = "ERROR: 'PBS did not allocate any nodes; file: "+dir+"/stdout"
-    # And finally, check for exceeded disk quota error:
-    # Also check the stderr for an error message indicating the memory limit was exceeded:
+    # Now check stdout/stderr/fluidity.err-* for distinctive strings indicating errors,
+    # all log files are scanned at once for all signatures (see logscan_lib.py):
     if (not error_found):
-      cmd = 'fgrep "PBS: job killed: mem" '+dir+'/stderr | grep "exceeded limit"'
-      shellout = commands.getoutput(cmd)
-      if ('PBS: job killed: mem' in shellout):
+      verdict = self.logscanner.scan(dir, cluster_name=sim.cluster_name, actions=['error', 'diskquota', 'suspect'])
+      if (verdict['action'] == 'error'):
         error_found = True
-        errormsg = "ERROR: Memory limit was exceeded."
-    if (not error_found):
-      cmd = 'fgrep "Disk quota exceeded" '+dir+'/stdout '+dir+'/stderr'
-      shellout = commands.getoutput(cmd)
-      if (shellout != '' and shellout.find("Disk quota exceeded:")>=0):
+        errormsg = verdict['message']
+      elif (verdict['action'] == 'diskquota'):
         # Update simulation properties:
-        self.update_sim_properties(dir, jobid='---', cluster_status='E', simulation_crashed=simulation_crashed)
+        self.update_sim_properties(dir, jobid='---', cluster_status='E', simulation_crashed=True)
         # Give an appropriate error message:
         # Disk quota on cluster exceeded, so raise exception and quit program as this needs to be solved manually
-        errormsg = 'Error: Disk quota on '+cluster_name+' was exceeded. Clean up your space.'
+        errormsg = 'Error: Disk quota on '+sim.cluster_name+' was exceeded. Clean up your space.\n'+verdict['message']
         # Get current dictionary:
         mydict = self.get_dict()
-        # Also, update the pgf table:
-        self.write_dict_status_pgftable(mydict, printcols=self.table_header, pdflatex=True, pdfcrop=True)
+        # Also, update the html table, and the pgf table if it is attached to an email
+        # (in digest mode only to the summary email):
+        self.write_dict_status_html(mydict)
+        if (self.sendemail and not self.messaging.digest):
+          self.write_dict_status_pgftable(mydict, printcols=self.table_header, pdflatex=True, pdfcrop=True, wait=True)
         attachment = 'logfiles/cropped_dict_status_table.pdf'
         self.messaging.message_handling(dir, errormsg, 0, msgtype='err', subject='DiskQuotaException caught', attachment=attachment)
         # This is the most crucial case, as if this occurs, the program should stop,
@@ -1234,21 +1301,10 @@ class Monitoring:
         # Thus raise an appropriate exception which will be dealt with in the main loop:
         raise DiskQuotaException
 
-    # Check if the string "Job terminated normally" can be found in stdout:
+    # Check if the simulation ended as expected, e.g. "Job terminated normally" in stdout on cx1:
     if (not error_found):
-      if ('cx1' in self.cluster_name):
-        searchstring = "Job terminated normally"
-        cmd = 'fgrep "'+searchstring+'" '+dir+'/stdout'
-        shellout = commands.getoutput(cmd)
-        if (shellout == ''):
-          error_found = True
-      elif ('cx2' in self.cluster_name):
-        searchstrings = ["aborting job", "terminated", "Killed"]
-        for ss in searchstrings:
-          cmd = 'fgrep "'+ss+'" '+dir+'/stdout'
-          shellout = commands.getoutput(cmd)
-          if (shellout != ''):
-            error_found = True
+      if (verdict['action'] == 'suspect'):
+        error_found = True
       if (error_found): # If error was found based on stdout/log, find out if it might be due to memory issues:
         # So in this case, check for the following:
         # If at this point, no error was detected from the stdout/stderr files, let's dig a bit deeper, 
@@ -1261,15 +1317,15 @@ class Monitoring:
         # Now compare those to get an idea if the simulation crashed without error message:
         # converting current walltime to seconds:
         try:
-          current_walltime_h = float(self.cluster_walltime.split(':')[0])
-          current_walltime_min = float(self.cluster_walltime.split(':')[-1])
+          current_walltime_h = float(sim.cluster_walltime.split(':')[0])
+          current_walltime_min = float(sim.cluster_walltime.split(':')[-1])
           current_walltime = current_walltime_h*3600.0 + current_walltime_min*60.0
           # Since we only the simulations every once in a while, take that into accout:
           current_walltime = current_walltime + float(self.query_waittime)
           # Now the same for the pbs_walltime
-          pbs_walltime_h = float(self.pbs_walltime.split(':')[0])
-          pbs_walltime_min = float(self.pbs_walltime.split(':')[1])
-          pbs_walltime_s = float(self.pbs_walltime.split(':')[-1])
+          pbs_walltime_h = float(sim.pbs_walltime.split(':')[0])
+          pbs_walltime_min = float(sim.pbs_walltime.split(':')[1])
+          pbs_walltime_s = float(sim.pbs_walltime.split(':')[-1])
           pbs_walltime = pbs_walltime_h*3600.0 + pbs_walltime_min*60.0 + pbs_walltime_s
           # For the pbs_walltime, we allow 15min grace, since that is an option in the pbs-script:
           pbs_walltime = pbs_walltime - 15*60.0
@@ -1312,8 +1368,11 @@ class Monitoring:
       errormsg = '***Error: Simulation in '+dir+' CRASHED\n***Has to be fixed manually!\nError: This Simulation has been flagged as crashed and has to be taken care of manually!\nThe following error was found:\n'+errormsg
       # Get current dictionary:
       mydict = self.get_dict()
-      # Also, update the pgf table:
-      self.write_dict_status_pgftable(mydict, printcols=self.table_header, pdflatex=True, pdfcrop=True)
+      # Also, update the html table, and the pgf table if it is attached to an email
+      # (in digest mode only to the summary email):
+      self.write_dict_status_html(mydict)
+      if (self.sendemail and not self.messaging.digest):
+        self.write_dict_status_pgftable(mydict, printcols=self.table_header, pdflatex=True, pdfcrop=True, wait=True)
       pdftable = 'logfiles/cropped_dict_status_table.pdf'
       self.messaging.message_handling(dir, errormsg, 0, msgtype='err', attachment=dir+'/stdout '+dir+'/stderr '+pdftable, subject='Error')
       # Now raise an exception which indicates that an error was found during the process of checking the 
@@ -1330,7 +1389,7 @@ class Monitoring:
     return simulation_crashed
 
 
-  def get_res_file_extension(self, dir=None):
+  def get_res_file_extension(self, dir):
     """ This subroutines looks for possible files with data
         in the given directory 'dir' and passes back a list
         of the found file extensions that are present in the
@@ -1341,8 +1400,6 @@ class Monitoring:
          extensions: List of the found file extensions in 
            the directory 'dir'
     """
-    if (dir is None):
-      dir = self.dir
     status = 0
     extensions = []
     (statfiles, status) = get_file_names(dir+'/*stat')
@@ -1357,7 +1414,7 @@ class Monitoring:
     return extensions
 
 
-  def parse_flml_files(self, dir=None):
+  def parse_flml_files(self, dir):
     """ This subroutines finds and parses all
         flml files in the input argument and
         identifies and returns the filename of
@@ -1369,8 +1426,6 @@ class Monitoring:
          checkpoint_flml: String of the flml-filename
            with the largest current_time.
     """
-    if (dir is None):
-      dir = self.dir
     highest_current_time = -1.0
     (flml_files, status) = get_file_names(dir+'/*flml')
     if (status == 0):
@@ -1423,7 +1478,7 @@ class Monitoring:
       # obtaining current time from the corresponding flml file (last checkpoint):
       current_time = self.get_current_time_from_flml(dir, flml_filename)
     # Set the time for the dictionary:
-    self.sim_time = current_time
+    self.update_sim_properties(dir, sim_time=current_time)
     # ... and finish time
     finish_time = self.get_finish_time_from_flml(dir, flml_filename)
     if (float(current_time) >= float(finish_time)):
@@ -1432,10 +1487,8 @@ class Monitoring:
       msg = 'Simulation in '+dir+' has reached its final time: FINISHED'
     # Also:
     # Check if steady state has been reached:
-    steadystatestr = "Steady state has been attained, exiting the timestep loop"
-    cmd = 'fgrep "'+steadystatestr+'" '+dir+'/fluidity.err-*'
-    shellout = commands.getoutput(cmd)
-    if (steadystatestr in shellout):
+    verdict = self.logscanner.scan(dir, actions=['finished'])
+    if (verdict['action'] == 'finished'):
       sim_finished = True
       # Message handling:
       msg = 'Simulation in '+dir+' has reached steady state: FINISHED'
@@ -1447,8 +1500,11 @@ class Monitoring:
       subject = 'Simulation finished'
       # Get current dictionary:
       mydict = self.get_dict()
-      # Also, update the pgf table:
-      self.write_dict_status_pgftable(mydict, printcols=self.table_header, pdflatex=True, pdfcrop=True)
+      # Also, update the html table, and the pgf table if it is attached to an email
+      # (in digest mode only to the summary email):
+      self.write_dict_status_html(mydict)
+      if (self.sendemail and not self.messaging.digest):
+        self.write_dict_status_pgftable(mydict, printcols=self.table_header, pdflatex=True, pdfcrop=True, wait=True)
       attachment = 'logfiles/cropped_dict_status_table.pdf'
       self.messaging.message_handling(dir, msg, 0, msgtype='log', subject=subject, attachment=attachment)
     # Return value:
@@ -1550,29 +1606,7 @@ class Monitoring:
         Output:
          option_value: String of value of the requested option
     """
-    try:
-      libspud.clear_options()
-      libspud.load_options(dir +'/' + flml_filename)
-    except:
-      errormsg = "ERROR: Flml file "+dir+"/"+flml_filename+" could not be loaded. Trying again..."
-      print errormsg
-      raise Exception('Exception caught in "get_option_from_flml": '+errormsg)
-    try:
-      if (option_string == '/embedded_models/fsi_model'):
-        option_value = libspud.have_option(option_string)
-      else:
-        if (libspud.have_option(option_string)):
-          option_value = libspud.get_option(option_string)
-        else:
-          option_value = False
-    except:
-      errormsg = 'ERROR: '+option_string+' of flml "'+dir+'/'+flml_filename+'" could not be read in!'
-      if (option_string == 'embedded_models/fsi_model'):
-        option_value = False
-      else:
-        option_value = errormsg
-      print errormsg
-      raise Exception('Exception caught in "get_option_from_flml": '+errormsg)
+    option_value = self.flml_options.get(dir+'/'+flml_filename).get_option(option_string)
     return option_value
   
   
@@ -1604,6 +1638,20 @@ class Monitoring:
     return current_time, status
 
 
+  def get_archive_filename(self, dir, previous=False):
+    """ Returns the filename of the archive of the most recent (or the
+        previous) checkpoint of the simulation in 'dir'.
+        Input:
+         dir: String of the directory name of the simulation
+         previous: Boolean, True for the previous checkpoint (Default: False)
+        Output:
+         tar_filename: String of the filename of the archive
+    """
+    if (previous):
+      return dir+'/bkup/previous_checkpoint.tar.gz'
+    return dir+'/bkup/most_recent_checkpoint.tar.gz'
+
+
   def archive_simulation(self, dir, flml_filename):
     """ This subroutines creates an archive of 
         the necessary files in order to start the
@@ -1611,6 +1659,11 @@ class Monitoring:
         the flml-file, either all files are archived
         (if current_time == 0.0) or only the checkpoint
         files are archived (if current_time > 0.0).
+        The archive is compressed while it is written
+        into the bkup directory. Once it is complete, it
+        becomes 'dir/bkup/most_recent_checkpoint.tar.gz',
+        and the archive that was there before becomes
+        'dir/bkup/previous_checkpoint.tar.gz'.
         Input:
          dir: name of the directory where the flml
            file is in
@@ -1619,142 +1672,206 @@ class Monitoring:
          tar_filename: String of the tar_filename which 
            contains all the neccessary files to run
            the simulation, except for the fluidity
-           binary.
+           binary, or '' if no archive was written.
     """
     # Return string:
-    tar_filename = dir+'.tar'
+    tar_filename = self.get_archive_filename(dir)
     # Get current_time of input flml file:
     current_time = self.get_current_time_from_flml(dir, flml_filename)
-#    # And the checkpoint simulation name from flml:
-#    checkpoint_simname = self.get_sim_name_from_flml(dir, flml_filename)
     # If current_time == 0.0, we assume this is the initial run:
     if (current_time == 0.0):
-      cmd = "tar --exclude '"+dir+"/bkup' -cvf "+tar_filename+" "+dir+"/"
-      out = commands.getoutput(cmd)
+      patterns = [dir+'/']
     elif (current_time > 0.0):
       # Get strings for simulation-basename and ending to create archive:
       checkpoint_name = flml_filename.split('.flml')[0]
       checkpoint_number = checkpoint_name.split('_checkpoint')[0].split('_')[-1]
       checkpoint_basename = checkpoint_name.split('_'+checkpoint_number+'_checkpoint')[0]
       # Make tar-archive of complete directory for checkpointed setup:
-      cmd = "tar --exclude '"+dir+"/bkup' -cvf "+tar_filename+" "+dir+"/"+checkpoint_basename+"*"+checkpoint_number+"_checkpoint*"+" "+dir+"/pbs.sh "+dir+"/Makefile"
-      out = commands.getoutput(cmd)
+      patterns = [dir+'/'+checkpoint_basename+'*'+checkpoint_number+'_checkpoint*', dir+'/pbs.sh', dir+'/Makefile']
     else:
       errormsg = 'ERROR: Flml file "'+dir+'/'+flml_filename+'" has a current_time < 0'
       print errormsg
+      # The archive in bkup is of an older checkpoint, it must not be used:
+      return ''
+    members = get_archive_members(patterns, excludes=[dir+'/bkup'])
+    if (not os.path.isdir(dir+'/bkup')):
+      os.makedirs(dir+'/bkup')
+    # Write the new archive next to the one of the most recent checkpoint,
+    # which is kept if the new one cannot be written:
+    status = write_archive(tar_filename+'.new', members, excludes=[dir+'/bkup'])
+    if (status != 0):
+      errormsg = 'Error: The archive '+tar_filename+' could not be written.'
+      self.messaging.message_handling(dir, errormsg, 1, msgtype='err', subject='Error: archive')
+      return ''
+    # Keep the archive of the previous checkpoint:
+    if (os.path.isfile(tar_filename)):
+      os.rename(tar_filename, self.get_archive_filename(dir, previous=True))
+    os.rename(tar_filename+'.new', tar_filename)
     return tar_filename
 
 
-  def check_cluster_for_simulation_running(self, cluster_name=None, myusername=None, jobid=None):
-    """ This subroutines logs onto the cluster which name is given as
-        an input argument, and checks if the given jobid is still running
+  def invalidate_qstat_snapshots(self):
+    """ This method discards all snapshots of "qstat -a" that were taken
+        during the previous monitoring round, such that the next call of
+        'get_qstat_snapshot' queries the cluster(s) again.
+    """
+    self.qstat_snapshots = {}
+
+
+  def get_qstat_snapshot(self, cluster_name=None, myusername=None):
+    """ This method returns the snapshot of "qstat -a" of the current
+        monitoring round, see 'fetch_qstat_snapshot'. Concurrent workers
+        wait for the one worker that queries the cluster, such that
+        "qstat -a" still runs only once per cluster and round.
+    """
+    with self.qstat_lock:
+      snapshot = self.fetch_qstat_snapshot(cluster_name=cluster_name, myusername=myusername)
+    return snapshot
+
+
+  def fetch_qstat_snapshot(self, cluster_name=None, myusername=None):
+    """ This subroutine logs onto the cluster which name is given as
+        an input argument, runs "qstat -a" once per monitoring round,
+        and parses its output into an index of the user's jobs keyed by
+        the jobid. Subsequent calls during the same round (e.g. for all
+        other simulations running on the same cluster) are answered
+        from that index, until 'invalidate_qstat_snapshots' is called
+        at the start of the next monitoring round.
         Input:
          cluster_name: String of address of the cluster, e.g. 
            cx1.hpc.ic.ac.uk
-         user: String of the user's username
-         jobid: String of the Job ID of the simulation
-           running in 'cluster_dir/dir'
+         myusername: String of the user's username
         Output:
-         sim_running: Logical which is true, if the given jobid
-           is still active on the cluster
-         status: 0 if no error was encountered, 1 otherwise
+         snapshot: Dictionary with the keys 'jobs', a dictionary of
+           jobid : {'status' : ..., 'walltime' : ...}, 'empty', which is
+           True if "qstat -a" returned nothing at all, and 'status',
+           which is 0 if no error was encountered, 1 otherwise.
     """
     # Optional arguments:
     if (cluster_name is None):
       cluster_name = self.cluster_name
     if (myusername is None):
       myusername = self.username
-    if (jobid is None):
-      jobid = self.jobid
-
-    # Initialization:
-    # Set to previous value, and later to true/false based on what is found:
-    sim_running = self.simulation_running
-
+    key = (myusername, cluster_name)
+    # Answer from the snapshot of this round, if there is one:
+    if (key in self.qstat_snapshots):
+      snapshot = self.qstat_snapshots[key]
+      # Querying the cluster failed earlier in this round, raise the same
+      # exception again rather than hammering the cluster once per simulation:
+      if (not (snapshot['exception'] is None)):
+        raise snapshot['exception']
+      return snapshot
+
+    snapshot = {'jobs' : {}, 'empty' : True, 'status' : 1, 'exception' : None}
     error = True; cnt = 0
-    # we'll use this ls command as a trial if we get an answer from the cluster:
-    trial_ls_cmd = 'ssh '+myusername+'@'+cluster_name+' "ls .bashrc"'
-    qstat_cluster_cmd = 'ssh '+myusername+'@'+cluster_name+' "qstat -a"'
     while (cnt < self.errmaxcnt and error):
-      trial_cluster_out = commands.getoutput(trial_ls_cmd)
+      # we'll use this ls command as a trial if we get an answer from the cluster:
+      trial_cluster_out = self.ssh_pool.run(myusername, cluster_name, 'ls .bashrc')
       # only execute the qstat query if the ls command gives us the .bashrc file:
       if (trial_cluster_out.strip() == '.bashrc'):
-        cluster_qstat = commands.getoutput(qstat_cluster_cmd)
+        cluster_qstat = self.ssh_pool.run(myusername, cluster_name, 'qstat -a')
         try:
           self.check_for_ssh_errors(cluster_qstat, calling_fun='check_cluster_for_simulation_running')
-          self.check_for_ssh_qstat_error(cluster_qstat)
-        except SSHQstatException:
-          # the expected output from "qstat -a" was not found:
+          self.check_for_ssh_qstat_error(cluster_qstat, cluster_name=cluster_name)
+        except (SSHQstatException, SSHConnectionException, SSHCrucialConnectionException) as e:
+          # Remember the exception for the rest of this round, and
           # raise the same exception again and handle it later:
-          raise SSHQstatException
-        except SSHConnectionException:
-          # Connection is currently not available, raise exception again:
-          raise SSHConnectionException
-        except SSHCrucialConnectionException:
-          # Crucial error appeared, quit the program as this exception deals
-          # with error such as wrong username, wrong cluster name, Permission
-          # issues etc. This has to be fixed by the user:
-          # Thus raise the same exception again.
-          raise SSHCrucialConnectionException
+          snapshot['exception'] = e.__class__
+          self.qstat_snapshots[key] = snapshot
+          raise snapshot['exception']
         else:
           error = False # ssh operation was successful
           break
       # Increase counter of trials and wait a tiny bit until the next query:
       cnt = cnt+1
-      if (cnt > self.errmaxcnt):
-        raise SSHConnectionException
       if (error):
         time.sleep(self.errwaittime)
-    # No error/exception occured, analyse cluster_qstat:
+    # No error/exception occured, parse cluster_qstat once for all simulations:
     if (not error):
+      snapshot['status'] = 0
+      snapshot['empty'] = not cluster_qstat
       # First of all, let's remove unneccessary lines from qstat's output:
-      qstat_lines = self.strip_qstat_output(cluster_qstat)
+      for qstat_line in self.strip_qstat_output(cluster_qstat, myusername=myusername):
+        # Seperate line of info into a list filled with elements
+        qstat_linesplit = qstat_line.split(None)
+        # Now check if listed job is your own (username), 
+        # e.g. required for cx2 (not cx1 though):
+        if (len(qstat_linesplit) < 11 or not myusername == qstat_linesplit[1]):
+          continue
+        # setting cluster walltime to zero, if it's queueing, which prevents a conversion exception for runs 
+        # that finish/crash within the time of the query_time:
+        cluster_walltime = qstat_linesplit[10]
+        if (cluster_walltime == '--'): cluster_walltime = '00:00'
+        snapshot['jobs'].update({qstat_linesplit[0] : {'status' : qstat_linesplit[9], 'walltime' : cluster_walltime}})
+    # Store the snapshot for the remainder of this round (also if it failed,
+    # in which case status is 1 for all simulations on this cluster):
+    self.qstat_snapshots[key] = snapshot
+    return snapshot
+
+
+  def check_cluster_for_simulation_running(self, sim, cluster_name=None, myusername=None, jobid=None):
+    """ This subroutines checks if the given jobid is still running on
+        the cluster which name is given as an input argument. The lookup
+        is done in the snapshot of "qstat -a" of the current monitoring
+        round, see 'get_qstat_snapshot'.
+        Input:
+         sim: SimulationState object of the simulation
+         cluster_name: String of address of the cluster, e.g. 
+           cx1.hpc.ic.ac.uk
+         user: String of the user's username
+         jobid: String of the Job ID of the simulation
+           running in 'cluster_dir/dir'
+        Output:
+         sim_running: Logical which is true, if the given jobid
+           is still active on the cluster
+         status: 0 if no error was encountered, 1 otherwise
+    """
+    # Optional arguments:
+    if (cluster_name is None):
+      cluster_name = sim.cluster_name
+    if (myusername is None):
+      myusername = self.username
+    if (jobid is None):
+      jobid = sim.jobid
+
+    # Initialization:
+    # Set to previous value, and later to true/false based on what is found:
+    sim_running = sim.simulation_running
+
+    # Get the job table of this round (exceptions are passed on to the caller):
+    snapshot = self.get_qstat_snapshot(cluster_name=cluster_name, myusername=myusername)
+    status = snapshot['status']
+    # No error/exception occured, look up the jobid:
+    if (status == 0):
       # qstat was performed with success, thus set
       # sim_running to false, and true if jobid was found:
-      sim_running = False
-      # Then if output was not empty:
-      if (cluster_qstat):
-        for qstat_line in qstat_lines:
-          # Seperate line of info into a list filled with elements
-          qstat_linesplit = qstat_line.split(None)
-          # Now check if listed job is your own (username), 
-          # e.g. required for cx2 (not cx1 though):
-          if (not myusername == qstat_linesplit[1]):
-            continue
-          # get jobid:
-          cluster_qstat_jobid = qstat_linesplit[0]
-          if (cluster_qstat_jobid == jobid):
-            sim_running = True
-            # Set cluster status and elapsed time on cluster:
-            cluster_status=qstat_linesplit[9]
-            cluster_walltime=qstat_linesplit[10]
-            # setting cluster walltime to zero, if it's queueing, which prevents a conversion exception for runs 
-            # that finish/crash within the time of the query_time:
-            if (cluster_walltime == '--'): cluster_walltime = '00:00'
-            self.update_sim_properties(self.dir, cluster_status=cluster_status, cluster_walltime=cluster_walltime)
-            break
+      sim_running = jobid in snapshot['jobs']
+      if (sim_running):
+        # Set cluster status and elapsed time on cluster:
+        job = snapshot['jobs'][jobid]
+        self.update_sim_properties(sim.dir, cluster_status=job['status'], cluster_walltime=job['walltime'])
+      elif (not snapshot['empty']):
         # If simulation is not running anymore, reset cluster jobid and status :
-        if (not sim_running):
-          self.update_sim_properties(self.dir, jobid='---', cluster_status='---')
+        self.update_sim_properties(sim.dir, jobid='---', cluster_status='---')
       # Update status simulation_running of Monitoring class:
-      self.update_sim_properties(self.dir, simulation_running=sim_running)
-    # Set status to 1, if an error occured:
-    if (error): status = 1
-    else: status = 0
+      self.update_sim_properties(sim.dir, simulation_running=sim_running)
     return sim_running, status
 
 
-  def strip_qstat_output(self, qstat_output):
+  def strip_qstat_output(self, qstat_output, myusername=None):
     """ This subroutine removes irrelevant lines from the output 
         from "qstat -a"
         Input:
          qstat_output: String of the output from "qstat -a"
+         myusername: String of the user's username
         Output:
          rel_output: Output of "qstat -a" without irrelevant lines         
     """
+    if (myusername is None):
+      myusername = self.username
     rel_output = []
     for line in qstat_output.split('\n'):
-      if (self.username in line):
+      if (myusername in line):
         rel_output.append(line)
     return rel_output
 
@@ -1789,7 +1906,14 @@ class Monitoring:
     return (include, exclude)
 
 
-  def submit_on_cluster(self, cluster_name=None, cluster_dir=None, dir=None, tar_filename=None):
+  def report_transfer(self, dir, msg):
+    """ Writes the bytes and throughput of a transfer (see TransferBatcher)
+        to the log file of the simulation in 'dir'.
+    """
+    self.messaging.write_to_log_err_file(dir, msg, msgtype='log')
+
+
+  def submit_on_cluster(self, sim, cluster_name=None, cluster_dir=None, tar_filename=None):
     """ This subroutines cleans up the given directory on the cluster,
         meaning the directory 'dir' (if present) is deleted in the
         first place. Secondly relevant files are synced between the local
@@ -1797,14 +1921,15 @@ class Monitoring:
         submitted to the queue. Return value is a string with the
         Job ID on the cluster.
         Input:
+         sim: SimulationState object of the simulation, its directory
+           'dir' is the one where the simulation files are in
          cluster_name: Address of the cluster, e.g. 
            cx1.hpc.ic.ac.uk
          cluster_dir: Parent directory on the cluster where the 
            convergence analysis is carried out
-         dir: Name of the directory where the simulation files
-           are in
          tar_filename: String of the filename of the archive 
-           to be sent to the cluster
+           to be sent to the cluster, or '' if there is none,
+           then the files are synced by rsync
         Output:
          jobid: String of the Job ID of the simulation
            running in 'cluster_dir/dir'
@@ -1815,15 +1940,14 @@ class Monitoring:
     """
     # Set simulation_crashed to False, only setting it to True in some rare cases:
     simulation_crashed = False
+    dir = sim.dir
     # Define values for optional arguments:
     if (cluster_name is None):
-      cluster_name = self.cluster_name
+      cluster_name = sim.cluster_name
     if (cluster_dir is None):
-      cluster_dir = self.cluster_dir
-    if (dir is None):
-      dir = self.dir
+      cluster_dir = sim.cluster_dir
     if (tar_filename is None):
-      tar_filename = self.dir+'.tar'
+      tar_filename = self.get_archive_filename(dir)
     
     # Start processing directories on the cluster:
 
@@ -1834,8 +1958,7 @@ class Monitoring:
     error = True; cnt = 0
     # Remove corresponding directory on cluster:
     while (cnt < self.errmaxcnt and error):
-      cmd = 'ssh '+self.username+'@'+cluster_name+' "rm -rf '+cluster_dir+'/'+dir+'"'
-      out = commands.getoutput(cmd)
+      out = self.ssh_pool.run(self.username, cluster_name, 'rm -rf '+cluster_dir+'/'+dir)
       print out
       if (out.find("Connection closed by") == -1 and out.find("lost connection") == -1 and out.find("ssh_exchange_identification") == -1 and out.find("Connection timed out")==-1 and out.find("Name or service not known")==-1):
         error = False # ssh operation was successful
@@ -1845,11 +1968,11 @@ class Monitoring:
         break
       cnt = cnt+1
       if (cnt >= self.errmaxcnt):
-        errormsg = "Error: "+out+". Tried "+str(errmaxcnt)+" times to connect to "+cluster_name+":"+cluster_dir+" via ssh, but could not establish connection!"
+        errormsg = "Error: "+out+". Tried "+str(self.errmaxcnt)+" times to connect to "+cluster_name+":"+cluster_dir+" via ssh, but could not establish connection!"
         subject = 'Error: SSH'
         self.messaging.message_handling(dir, errormsg, 2, msgtype='err', subject=subject)
       if (error):
-        time.sleep(waittime)
+        time.sleep(self.errwaittime)
 
 
     #############
@@ -1858,21 +1981,18 @@ class Monitoring:
     if (not error):
       # First, determine which file basenames we want to include/exclude from the syncing process:
       (files_include, files_exclude) = self.get_inexclude_lists(dir)
-      # Add those lists to a dictionary for in-/exclude file-basenames:
-      rsync_files = {'include' : files_include, 'exclude' : files_exclude}
-      # Now construct the string for executing rsync (breaking it down into substrings):
-      inclstr = '--include='; exclstr = '--exclude=';
-      rsync_includes = ' '.join([inclstr+'"'+i+'"' for i in rsync_files['include']])
-      rsync_excludes = ' '.join([exclstr+'"'+i+'"' for i in rsync_files['exclude']])
-      # Assembling the full rsync command:
-      rsync_cmd = 'rsync -e ssh -arvq '+rsync_includes+' '+rsync_excludes+' '+dir+'/ '+self.username+'@'+cluster_name+':'+cluster_dir+'/'+dir+'/'
-      # Now start the rsync process to the cluster:"+self.username+"@"+cluster_name+":"+cluster_dir+"/"
+      # Now start the rsync process to the cluster, together with other
+      # simulations that are pushed at the same time (see TransferBatcher):
       error = True; cnt = 0
       while (cnt < self.errmaxcnt and error):
         # the following lines are commented out as they refer to the old method, using scp:
         #cmd = "scp "+tar_filename+" "+self.username+"@"+cluster_name+":"+cluster_dir+"/"
         #if (out.find("Connection closed by") == -1 and out.find("No such file or directory") == -1 and out.find("Connection timed out")==-1 and out.find("Name or service not known")==-1 and out.rfind("Disk quota exceeded")==-1):
-        out = commands.getoutput(rsync_cmd)
+        if (self.archive_push and os.path.isfile(tar_filename)):
+          # Unpack the archive on the cluster while it is sent:
+          out = self.ssh_pool.run_local(self.username, cluster_name, self.ssh_pool.get_ssh_cmd(self.username, cluster_name)+' "mkdir -p '+cluster_dir+' && tar -xzf - -C '+cluster_dir+'" < '+tar_filename)
+        else:
+          out = self.transfers.push(self.username, cluster_name, cluster_dir, dir, files_include, files_exclude)
         if (out == ''):
         #if (out.find("Connection closed by") == -1 and out.find("No such file or directory") == -1 and out.find("Connection timed out")==-1 and out.find("Name or service not known")==-1 and out.rfind("Disk quota exceeded")==-1):
           #self.notify_popup('SCP successful', 'SCP simulation to cluster into directory '+dir)
@@ -1934,8 +2054,7 @@ class Monitoring:
       error = True; cnt = 0
       while (cnt < self.errmaxcnt and error):
         # Copy fluidity binary into simulation directory:
-        cmd = 'ssh '+self.username+'@'+cluster_name+' "cp '+self.cluster_fluidity_dir+'/bin/fluidity '+cluster_dir+'/'+dir+'/ "'
-        out = commands.getoutput(cmd)
+        out = self.ssh_pool.run(self.username, cluster_name, 'cp '+sim.cluster_fluidity_dir+'/bin/fluidity '+cluster_dir+'/'+dir+'/ ')
 
         if (out.find("Connection closed by") == -1 and out.find("lost connection") == -1 and out.find("ssh_exchange_identification") == -1 and out.find("Connection timed out")==-1 and out.find("Name or service not known")==-1 and out.find("No such file or directory") == -1 and out.find("cannot remove") == -1 and out.find("Cannot open") == -1):
           error = False # ssh operation was successful
@@ -1962,8 +2081,7 @@ class Monitoring:
       # Now submit the job t  o cluster:
       error = True; cnt = 0
       while (cnt < self.errmaxcnt and error):
-        cmd = 'ssh '+self.username+'@'+cluster_name+' "cd '+cluster_dir+'/'+dir+'; qsub pbs.sh"'
-        jobid = commands.getoutput(cmd)
+        jobid = self.ssh_pool.run(self.username, cluster_name, 'cd '+cluster_dir+'/'+dir+'; qsub pbs.sh')
 
         if ((not jobid == '' and not jobid == ' ' and not jobid == ('qsub: Access to queue is denied') and jobid.find("No such file or directory") == -1 and jobid.find("Connection closed by") == -1 and jobid.find("lost connection") == -1 and jobid.find("ssh_exchange_identification") == -1 and out.find("Connection timed out")==-1 and out.find("Name or service not known")==-1)):
           error = False # successfully submitted the job to the queue
@@ -2023,18 +2141,18 @@ class Monitoring:
     return jobid, simulation_crashed, status
 
 
-  def scp_data_from_cluster(self, cluster_name=None, cluster_dir=None, dir=None, simname=None, running=False):
+  def scp_data_from_cluster(self, sim, cluster_name=None, cluster_dir=None, simname=None, running=False):
     """ This subroutines packages the relevant data on the cluster,
         and sends it back into the corresponding directory on the
         local machine, where the archive is unpacked and ready for 
         inspection.
         Input:
+         sim: SimulationState object of the simulation, its directory
+           'dir' is the one where the simulation files are in
          cluster_name: Address of the cluster, e.g. 
            cx1.hpc.ic.ac.uk
          cluster_dir: Parent directory on the cluster where the 
            convergence analysis is carried out
-         dir: Name of the directory where the simulation files
-           are in
          simname: String of the simulation name set in the flml
            file
          running: Boolean indicating if the simulation is still
@@ -2042,14 +2160,13 @@ class Monitoring:
         Output:
           status: 0 if no error occured, 1 otherwise
     """
+    dir = sim.dir
     if (cluster_name is None):
-      cluster_name = self.cluster_name
+      cluster_name = sim.cluster_name
     if (cluster_dir is None):
-      cluster_dir = self.cluster_dir
-    if (dir is None):
-      dir = self.dir
+      cluster_dir = sim.cluster_dir
     if (simname is None):
-      simname = self.simname
+      simname = sim.simname
 
     #################
     # rsync results #
@@ -2060,18 +2177,18 @@ class Monitoring:
       if (running): files_include = [simname+'*', 'first_timestep_adapted_mesh*', 'pbs.sh']
       else: files_include = [simname+'*', 'stdout', 'stderr', 'fluidity.*', 'first_timestep_adapted_mesh*', 'pbs.sh']
       files_exclude = ['*'] # exlude everything else!
-      # Add those lists to a dictionary for in-/exclude file-basenames:
-      rsync_files = {'include' : files_include, 'exclude' : files_exclude}
-      # Now construct the string for executing rsync (breaking it down into substrings):
-      inclstr = '--include='; exclstr = '--exclude=';
-      rsync_includes = ' '.join([inclstr+'"'+i+'"' for i in rsync_files['include']])
-      rsync_excludes = ' '.join([exclstr+'"'+i+'"' for i in rsync_files['exclude']])
-      # Assembling the full rsync command:
-      rsync_cmd = 'rsync -e ssh -arvq '+rsync_includes+' '+rsync_excludes+' '+self.username+'@'+cluster_name+':'+cluster_dir+'/'+dir+'/'+' '+dir+'/'
-      # Syncing results from cluster with corresponding directory on local machine:
+      # While running, only the appended end of the growing result files is
+      # pulled, which are then not synced by rsync:
+      tail_patterns = [simname+'*.stat', simname+'*.detectors', simname+'*.detectors.dat']
+      if (running and self.tail_pulls):
+        files_exclude = self.tail_puller.pull(self.username, cluster_name, cluster_dir, dir, tail_patterns)+files_exclude
+      else:
+        self.tail_puller.forget(dir)
+      # Syncing results from cluster with corresponding directory on local machine,
+      # together with other simulations that are synced at the same time (see TransferBatcher):
       error = True; cnt = 0
       while (cnt < self.errmaxcnt and error):
-        out = commands.getoutput(rsync_cmd)
+        out = self.transfers.pull(self.username, cluster_name, cluster_dir, dir, files_include, files_exclude)
         try:
           self.check_for_scp_errors(out, dir=dir, calling_fun='scp_data_from_cluster')
         except SCPException:
@@ -2084,6 +2201,8 @@ class Monitoring:
           # Checking if the output from command line is an empty string (as it should be):
           if (out == ''):
             error = False # syncing operation was successful
+            if (running and self.tail_pulls):
+              self.tail_puller.record(dir, tail_patterns)
             msg = 'Synced results from cluster into directory '+dir
             self.messaging.message_handling(dir, msg, 2, msgtype='log', subject='SCP successful')
             break
@@ -2111,7 +2230,7 @@ class Monitoring:
     return status
 
 
-  def postprocess_simulation(self, dir, cluster_name=None):
+  def postprocess_simulation(self, sim, cluster_name=None):
     """ Once the results are copied from the cluster, the results
         are postprocessed in this method. Here the simulation
         name in the flml file is slightly modified, the pbs-script
@@ -2122,27 +2241,28 @@ class Monitoring:
         previous run, redundant checkpoint files are removed, 
         and it is also checked if the simulation has finished.
         Input:
-         dir: Name of the directory where the results are to be
-           postprocessed
+         sim: SimulationState object of the simulation, whose
+           directory holds the results to be postprocessed
          cluster_name: String of the name/address of the cluster.
         Output:
          simulation_finished: Boolean, True if simulation is finished.
          tar_filename: String of the archive's filename.
     """
+    dir = sim.dir
     if (cluster_name is None):
-      cluster_name = self.cluster_name
+      cluster_name = sim.cluster_name
     # Make some required changes, e.g. change flml in pbs-script, append stat-file to previous-statfile,
     # change simulation name in checkpointed flml-file, rename vtu files such that they are 
     # corresponding to the previous run ...:
 
     # Get the latest (checkpoint) flml filename:
     checkpoint_flml_filename = self.parse_flml_files(dir)
-    # After finding the checkpoint_flml, set self.sim_time:
+    # After finding the checkpoint_flml, set sim_time of the simulation:
     current_time = self.get_current_time_from_flml(dir, checkpoint_flml_filename)
     self.update_sim_properties(dir, sim_time=current_time)
 
     # Setup up pbs-script and simname in flml for next run:
-    self.setup_pbs_script(dir, checkpoint_flml_filename)
+    self.setup_pbs_script(sim, checkpoint_flml_filename)
     # Method below modifies simname if '_checkpoint' is in simname:
     self.change_simname_in_flml(dir, checkpoint_flml_filename)
     # Remove "adapt_at_first_timestep" if it is in the checkpointed flml:
@@ -2152,7 +2272,7 @@ class Monitoring:
     simulation_finished = self.check_simulation_finished(dir, checkpoint_flml_filename)
     # If simulation is flagged as finished, remove the directory on the cluster:
     if (simulation_finished):
-      self.clean_cluster_dir(dir, cluster_name=cluster_name)
+      self.clean_cluster_dir(sim, cluster_name=cluster_name)
       # Create tarfile of neccessary files to restart/continue the simulation/and/or to backup:
     tar_filename = self.archive_simulation(dir, checkpoint_flml_filename)
 
@@ -2168,14 +2288,17 @@ class Monitoring:
          flml_filename: Most recent simulation name that ran of this
            particular simulation (in directory 'dir')
     """
-    if (libspud.have_option('/mesh_adaptivity/hr_adaptivity/adapt_at_first_timestep')):
+    with self.libspud_lock:
+      load_flml_options(dir+'/'+flml_filename)
+      if (libspud.have_option('/mesh_adaptivity/hr_adaptivity/adapt_at_first_timestep')):
         libspud.delete_option('/mesh_adaptivity/hr_adaptivity/adapt_at_first_timestep')
         libspud.write_options(dir+'/'+flml_filename)
-        libspud.clear_options()
+        self.flml_options.forget(dir+'/'+flml_filename)
+      libspud.clear_options()
     # End of remove_adapt_first_timestep_in_flml
 
 
-  def renaming_checkpoint(self, dir=None, simname=None, ncpus=None):
+  def renaming_checkpoint(self, dir, simname, ncpus):
     """ Renaming checkpointed fluid and solid vtu files.
         Input:
          dir: String of the name of the directory where
@@ -2187,12 +2310,6 @@ class Monitoring:
         Output:
          status: 0 if no error occured, 1 otherwise
     """
-    if (dir is None):
-      dir = self.dir
-    if (simname is None):
-      simname = self.simname
-    if (ncpus is None):
-      ncpus = self.ncpus
     status = 0
     rename_checkpoint = False
     # First of all, check if we have to run rename_checkpoint at all:
@@ -2390,7 +2507,7 @@ class Monitoring:
     return status
 
 
-  def append_resfiles(self, dir=None, simname=None):
+  def append_resfiles(self, dir, simname):
     """ This subroutine appends results from the file
         'simname'.'ext' to the previous file with the
         same file extension in the directory 'dir'.
@@ -2402,10 +2519,6 @@ class Monitoring:
          simulation_crashed: Boolean, True if error occured,
            False otherwise
     """
-    if (dir is None):
-      dir = self.dir
-    if (simname is None):
-      simname = self.simname
     # If statfile: search for data in newfile, and append only data to oldfile
     # If detectors, and no detectors.dat file present, do same as for statfile
     # If detectors, and detectors.dat present: cat newfile >> oldfile for detectors.dat files!
@@ -2441,25 +2554,22 @@ class Monitoring:
               oldfilename = file
         # The following only applies to stat and ASCII detector files:
         if (ext == 'stat' or ext == 'detectors'): 
-          # Open newfile and remove the header from the file:
-          if (append_file):
-            newf = open(dir+'/'+newfilename, 'r')
-          # Parse the data in the new/most recent statfile and
-          # create list containing only the data:
-          newdata = []
-          for line in newf: # more memory efficient than newf.readlines()
-            if (line.find("<") >=0):
-              # this line belongs to the header, so skip it
-              continue
-            newdata.append(line)
-          # newdata has been assembled, now close the new file:
-          newf.close()
-          # Append to previous statfile:
-          python_append_to_file(dir+'/'+oldfilename, newdata)
+          # Append the data of the new file without its header to the previous file:
+          status = stream_append_to_file(dir+'/'+oldfilename, dir+'/'+newfilename, skip_header=True)
+          if (status != 0):
+            error = True
+            break
+          if (self.stat_sidecars):
+            # Only the appended rows are converted, if the sidecar fails
+            # it is created anew when the file is read the next time:
+            update_stat_sidecar(dir+'/'+oldfilename)
         # Finished appending to stat and detector files
         # Now append binary detectors.dat files
         elif (ext == 'detectors.dat'):
-          status = file_append_to_file(dir+'/'+oldfilename, dir+'/'+newfilename)
+          status = stream_append_to_file(dir+'/'+oldfilename, dir+'/'+newfilename)
+          if (status != 0):
+            error = True
+            break
         else:
           error = True
           print "Error: Should never get here."
@@ -2477,28 +2587,30 @@ class Monitoring:
     return simulation_crashed
 
 
-  def setup_pbs_script(self, dir, flml_filename):
+  def setup_pbs_script(self, sim, flml_filename):
     """ This subroutine simple makes use of sed to udpate the
         pbs-script with the new flml filename.
         Input:
-         dir: Name of the directory where the pbs-script is in
+         sim: SimulationState object of the simulation, whose
+           directory 'dir' holds the pbs-script
          flml_filename: Most recent simulation name that ran of this
            particular simulation (in directory 'dir')
     """
+    dir = sim.dir
     # In pbs-script, replacing line where PROJECT is defined, with new flml-filename:
     cmd = 'cd '+dir+'; sed -i "/PROJECT=/c\PROJECT='+flml_filename+'" pbs.sh'
     out = commands.getoutput(cmd)
     # Also replace the Fluidity dir:
-    cmd = 'cd '+dir+'; sed -i "/FLUIDITY_DIR=/c\export FLUIDITY_DIR='+self.cluster_fluidity_dir+'" pbs.sh'
+    cmd = 'cd '+dir+'; sed -i "/FLUIDITY_DIR=/c\export FLUIDITY_DIR='+sim.cluster_fluidity_dir+'" pbs.sh'
     out = commands.getoutput(cmd)
 
     # Check if this is for cx1/2 or hector:
-    if ('cx1' in self.cluster_name or 'cx2' in self.cluster_name):
+    if ('cx1' in sim.cluster_name or 'cx2' in sim.cluster_name):
       ict = True; hector = False
-    elif ('hector' in self.cluster_name):
+    elif ('hector' in sim.cluster_name):
       ict = False; hector = True
     else:
-      raise SystemExit("In 'get_simname_walltime_ncpus_pbs', could not recognize value of 'cluster_name': "+str(self.cluster_name))
+      raise SystemExit("In 'get_simname_walltime_ncpus_pbs', could not recognize value of 'cluster_name': "+str(sim.cluster_name))
 
 
     # Load current pbs file in order to check for number of nodes, machines, cpus:
@@ -2524,15 +2636,15 @@ class Monitoring:
       cmd = 'tail -1 '+dir+'/'+statfilename
       out = commands.getoutput(cmd)
       num_nodes = out.split()[int(node_col_num)-1]
-      new_total_ncpus = int(round(float(num_nodes)/float(self.nnopercpu)))
-      #if ('cx1' in self.cluster_name):
+      new_total_ncpus = int(round(float(num_nodes)/float(sim.nnopercpu)))
+      #if ('cx1' in sim.cluster_name):
       #  if (new_total_ncpus > 72):
       #    new_total_ncpus = 72
     else: # statfile could not be opened, probably it doesn't exist
-      new_total_ncpus = self.total_ncpus
+      new_total_ncpus = sim.total_ncpus
     # check if the simulation in running in serial, and keep it that way:
-    if (self.total_ncpus == 1):
-      new_total_ncpus = self.total_ncpus
+    if (sim.total_ncpus == 1):
+      new_total_ncpus = sim.total_ncpus
 
     # Now that the current number of nodes are known, load pbs files, and process it:
     infile = open(dir+'/pbs.sh', 'r')
@@ -2546,7 +2658,7 @@ class Monitoring:
     elif (hector):
       searchstring_nprocs = '#PBS -l mppwidth' # search for this in the pbs script
       searchstring_ncpupn = '#PBS -l mppnppn' # search for this in the pbs script
-    queue = str(self.queue)
+    queue = str(sim.queue)
     queue_string_found = False
     searchstring_mpiexec = 'mpiexec'
     searchstring_pbsexec = 'pbsexec'
@@ -2567,59 +2679,59 @@ class Monitoring:
         continue
       if (searchstring_pbswalltime in line):
         # Setting the pbswalltime for this simulation:
-        newlines.append('#PBS -l walltime='+self.pbs_walltime+'\n')
+        newlines.append('#PBS -l walltime='+sim.pbs_walltime+'\n')
         continue
       # Setting specific pbs queue:
       if (ict and line.startswith(searchstring_queue)):
         queue_string_found = True
-        if (str(self.queue) == 'None'):
+        if (str(sim.queue) == 'None'):
           queue = line.split(searchstring_queue)[-1].split('#')[0]
           newlines.append('#PBS -q '+queue+'\n')
         else:
-          if (not (self.queue == '---' or self.queue.strip() == '')): # meaning, we don't want a specific queue
-            queue = str(self.queue)
+          if (not (sim.queue == '---' or sim.queue.strip() == '')): # meaning, we don't want a specific queue
+            queue = str(sim.queue)
             newlines.append('#PBS -q '+queue+'\n')
         continue
       if ((ict and (searchstring_ncpus in line)) or (hector and (searchstring_nprocs in line or searchstring_ncpupn in line))):
         ## Get number of machines the sim is running on (cx1/2 only):
-        if (ict and self.nmachines == '---'): # thus it was not set by user
+        if (ict and sim.nmachines == '---'): # thus it was not set by user
           nmachines = line.split('select=')[-1].split(':')[0]
-        else: nmachines = self.nmachines
+        else: nmachines = sim.nmachines
         ## And the number of cpus per machine:
-        if (self.ncpus == '---'): # thus it was not set by user
+        if (sim.ncpus == '---'): # thus it was not set by user
           if (ict):
             ncpus = line.split('ncpus=')[-1].split(':')[0]
           elif (hector and searchstring_ncpupn in line):
             ncpus = line.split('mppnppn=')[-1]
-        else: ncpus = self.ncpus
+        else: ncpus = sim.ncpus
         # And the memory (cx1/2 only):
-        if (self.memory == '---'): # thus it was not set by user
+        if (sim.memory == '---'): # thus it was not set by user
           if (ict):
             memory = line.split('mem=')[-1].split(':')[0]
           elif (hector): memory = 'NAN'
-        else: memory = self.memory
+        else: memory = sim.memory
         # And the infiniband (cx1 only):
-        if (ict and self.infiniband == '---'): # thus it was not set by user
+        if (ict and sim.infiniband == '---'): # thus it was not set by user
           infiniband = 'true' == line.split('icib=')[-1].split(':')[0].split('#')[0].lower()
-        else: infiniband = self.infiniband
+        else: infiniband = sim.infiniband
         # For hector, get the number of total processes:
         if (hector and searchstring_nprocs in line):
           total_ncpus = line.split('mppwidth=')[-1]
 
         # Try to compute new pbs parameters:
         try:
-          if ('cx1' in self.cluster_name or hector): actual_ncpus_pnode = ncpus
-          elif ('cx2' in self.cluster_name): actual_ncpus_pnode = self.mpiprocs
+          if ('cx1' in sim.cluster_name or hector): actual_ncpus_pnode = ncpus
+          elif ('cx2' in sim.cluster_name): actual_ncpus_pnode = sim.mpiprocs
           if (ict):
             total_ncpus = int(nmachines) * int(actual_ncpus_pnode)
           elif (hector):
             nmachines = int(round(float(total_ncpus)/float(ncpus)))
           # Now compute the new number of machines for the checkpointed simulation:
           newnmachines = int(round(float(new_total_ncpus) / float(ncpus)))
-          if ('cx1' in self.cluster_name): 
+          if ('cx1' in sim.cluster_name): 
             if (newnmachines > 6):
               newnmachines = 6 # have to cap as 6 nodes are the maximum on cx1
-          elif ('cx2' in self.cluster_name):
+          elif ('cx2' in sim.cluster_name):
             if (newnmachines > 72):
               newnmachines = 72 # have to cap as 72 nodes are the maximum on cx2
           elif (hector):
@@ -2645,13 +2757,13 @@ class Monitoring:
           self.messaging.write_to_log_err_file(dir, errormsg, msgtype='err')
         # new PBS command:
         if (ict):
-          if ('cx1' in self.cluster_name):
+          if ('cx1' in sim.cluster_name):
             if (str(infiniband).lower() == 'true' or infiniband):
               pbscmd = "#PBS -l select="+str(newnmachines)+":ncpus="+str(ncpus)+":mem="+memory+':icib='+str(infiniband).lower()
             else:
               pbscmd = "#PBS -l select="+str(newnmachines)+":ncpus="+str(ncpus)+":mem="+memory
-          elif ('cx2' in self.cluster_name):
-            pbscmd = "#PBS -l select="+str(newnmachines)+":ncpus="+str(ncpus)+":mpiprocs="+str(self.mpiprocs)+":ompthreads="+str(self.ompthreads)+":mem="+memory
+          elif ('cx2' in sim.cluster_name):
+            pbscmd = "#PBS -l select="+str(newnmachines)+":ncpus="+str(ncpus)+":mpiprocs="+str(sim.mpiprocs)+":ompthreads="+str(sim.ompthreads)+":mem="+memory
         elif (hector):
           if (searchstring_nprocs in line):
             pbscmd = "#PBS -l mppwidth="+str(new_total_ncpus)
@@ -2685,11 +2797,11 @@ class Monitoring:
               flredecompcmd = flredecompcmd+'aprun -n '+str(new_total_ncpus)+' -N '+str(ncpus)+' '
             flredecompcmd = flredecompcmd+'./flredecomp -v -l -i '+str(total_ncpus)+' -o '+str(new_total_ncpus)+' '+oldflmlfilename.replace('.flml','')+' '+newflmlfilename.replace('.flml', '')+'; '
             # cx1 specific:
-            if ('cx1' in self.cluster_name):
+            if ('cx1' in sim.cluster_name):
               flredecompcmd = flredecompcmd+'pbsdsh2 cp -rpf $TMPDIR/\* $PBS_O_WORKDIR/; cd $PBS_O_WORKDIR; '
             flredecompcmd = flredecompcmd+'mv '+newflmlfilename+' '+oldflmlfilename+'; '
             # again, cx1 specific:
-            if ('cx1' in self.cluster_name):
+            if ('cx1' in sim.cluster_name):
               flredecompcmd = flredecompcmd+'pbsdsh2 cp -rpf $PBS_O_WORKDIR/\* $TMPDIR/; cd $TMPDIR'
             newlines.append(flredecompcmd+'\n')
           # Now that we dealt with flredecomp, for HECToR we also need to modify the line in which we start fluidity IFF new_total_ncpus != total_ncpus:
@@ -2704,11 +2816,11 @@ class Monitoring:
 
     # Before we start writing the assembled information to the pbs.sh file, let's check if this simulation 
     # should run on a specific queue, but the corresponding string was not found in the preset pbs.sh file:
-    if (not (queue_string_found) and 'cx1' in self.cluster_name):
-      if (not (str(self.queue) == 'None' or self.queue == '---' or self.queue.strip() == '')):
+    if (not (queue_string_found) and 'cx1' in sim.cluster_name):
+      if (not (str(sim.queue) == 'None' or sim.queue == '---' or sim.queue.strip() == '')):
         for i in range(len(newlines)):
           if (searchstring_pbswalltime in newlines[i]):
-            newlines[i] = newlines[i]+'#PBS -q '+self.queue+'\n'
+            newlines[i] = newlines[i]+'#PBS -q '+sim.queue+'\n'
             break
 
     # Newlines of pbs script have been assembled, now write to file:
@@ -2732,9 +2844,12 @@ class Monitoring:
     if (simulation_name.find('_checkpoint') >= 0):
       automated_checkpointed_simname = simulation_name.split('_checkpoint')[0].split('_autocheckp')[0]+'_autocheckp'
       # Change simulation name and write to file:
-      libspud.set_option("simulation_name", automated_checkpointed_simname)
-      libspud.write_options(dir+'/'+flml_filename)
-      libspud.clear_options()
+      with self.libspud_lock:
+        load_flml_options(dir+'/'+flml_filename)
+        libspud.set_option("simulation_name", automated_checkpointed_simname)
+        libspud.write_options(dir+'/'+flml_filename)
+        libspud.clear_options()
+      self.flml_options.forget(dir+'/'+flml_filename)
       # Also: Update simname in the Monitoring class:
       self.update_sim_properties(dir, simname=automated_checkpointed_simname)
     else:
@@ -2744,25 +2859,25 @@ class Monitoring:
     # End of change_simname_in_flml
 
 
-  def clean_cluster_dir(self, dir, cluster_name=None):
+  def clean_cluster_dir(self, sim, cluster_name=None):
     """ This method removes/deletes the directory 'dir' on the cluster
         Input:
-         dir: String of the directory the simulation is in
+         sim: SimulationState object of the simulation in 'dir'
          cluster_name: String of the name/address of the cluster
     """
+    dir = sim.dir
     if (cluster_name is None):
-      cluster_name = self.cluster_name
+      cluster_name = sim.cluster_name
     #####################
     # Rm dir on cluster #
     #####################
     error = True; cnt = 0
     # Remove corresponding directory on cluster:
     while (cnt < self.errmaxcnt and error):
-      cmd = 'ssh '+self.username+'@'+cluster_name+' "rm -rf '+self.cluster_dir+'/'+dir+'"'
-      out = commands.getoutput(cmd)
+      out = self.ssh_pool.run(self.username, cluster_name, 'rm -rf '+sim.cluster_dir+'/'+dir)
       # This is a normal ssh problem:
       try:
-        self.check_for_ssh_errors(out, calling_fun='clean_cluster_dir')
+        self.check_for_ssh_errors(out, dir=dir, calling_fun='clean_cluster_dir')
       except SSHConnectionException:
         # Connection is currently not available, raise exception again:
         raise SSHConnectionException
@@ -2776,7 +2891,7 @@ class Monitoring:
         error = False # ssh rm operation was successful
         break
       if (cnt >= self.errmaxcnt):
-        errormsg = "Error: "+out+". Tried "+str(self.errmaxcnt)+" times to connect to "+cluster_name+"/"+self.cluster_dir+" via ssh, but could not establish connection!"
+        errormsg = "Error: "+out+". Tried "+str(self.errmaxcnt)+" times to connect to "+cluster_name+"/"+sim.cluster_dir+" via ssh, but could not establish connection!"
         self.messaging.message_handling(dir, errormsg, 0, msgtype='err', subject='Error: SSH rm dir')
         raise SSHConnectionException
       if (error):
@@ -2784,61 +2899,64 @@ class Monitoring:
     
 
 
-  def clean_and_bkup_local_dir(self, dir, tar_filename):
-    """ This subroutine copies the latest checkpoint into subdirectory 'bkup'
-        and cleans up the mess in 'dir' a bit.
+  def backup_simulation(self, sim):
+    """ This method stores the result files (stat/detectors/detectors.dat)
+        and the checkpoint files of a simulation in its backup store
+        'dir/bkup/store', which only writes the parts of the files that
+        changed since the previous backup.
         Input:
-         dir: Name of the directory to clean up
+         sim: SimulationState object of the simulation
+        Output:
+         status: Integer which is 0 if the files were backed up
+    """
+    dir = sim.dir
+    filenames = []
+    for pattern in ['*.stat', '*.detectors', '*.detectors.dat', '*_checkpoint*']:
+      filenames.extend([filename for filename in glob.glob(dir+'/'+pattern) if (os.path.isfile(filename))])
+    store = BackupStore(dir+'/bkup/store', keep=self.bkup_keep)
+    try:
+      (snapshot, written) = store.backup(sorted(set(filenames)), label=sim.simname)
+    except (IOError, OSError) as e:
+      errormsg = 'Error: The files of the simulation could not be backed up: '+str(e)
+      self.messaging.message_handling(dir, errormsg, 2, msgtype='err', subject='Error: bkup')
+      return 1
+    msg = 'Backed up '+str(len(filenames))+' files to '+snapshot+', '+str(written)+' bytes were written'
+    self.messaging.message_handling(dir, msg, 3, msgtype='log', subject='Backup')
+    return 0
+
+
+  def clean_and_bkup_local_dir(self, sim, tar_filename):
+    """ This subroutine backs up the result and checkpoint files in the
+        backup store in subdirectory 'bkup' and cleans up the mess in
+        'dir' a bit.
+        Input:
+         sim: SimulationState object of the simulation, whose
+           directory 'dir' is cleaned up
          tar_filename: String of the tar_filename which 
            contains all the neccessary files to continue
            the simulation, except for the fluidity binary.
     """
+    dir = sim.dir
+    # The archive of the latest checkpoint was written to the bkup directory
+    # already, see 'archive_simulation'. Back up the stat/detectors/detectors.dat
+    # files, both the merged and the checkpointed ones, and the checkpoint files:
+    self.backup_simulation(sim)
     # remove all checkpoints in 'dir', as at this time, the latest checkpoint
-    # has been archived and is in the parent directory:
+    # has been archived and is in the bkup directory:
     cmd = 'cd '+dir+'; rm -rf *_checkpoint*'
     out = commands.getoutput(cmd) # Again, errors from shell do not matter here.
-    # Before copying the tarfile with the latest checkpoint, rename previous checkpoint bkup tarfile:
-    cmd = 'mv '+dir+'/bkup/most_recent_checkpoint.tar.gz '+dir+'/bkup/previous_checkpoint.tar.gz'
-    out = commands.getoutput(cmd) # Again, errors from shell do not matter here.
-    # Now copy the latest checkpoint to the bkup directory:
-    cmd = 'mv '+tar_filename+' '+dir+'/bkup/most_recent_checkpoint.tar.gz'
-    out = commands.getoutput(cmd) # Again, errors from shell do not matter here.
-    # bkup stat/detectors/detectors.dat files:
-    # first, work out the index the result file should have in the bkup folder:
-    (statfiles, status) = find_file_names(dir+'/', '*.stat')
-    if (status == 0):
-      # Simulation basename:
-      simbasename = self.simname.split('_autocheckp')[0]
-      # Now that index has been set, copy merged files (preserving timestamps etc):
-      cmd = 'cp -p '+dir+'/'+simbasename+'.stat '+dir+'/bkup/'; out = commands.getoutput(cmd)
-      cmd = 'cp -p '+dir+'/'+simbasename+'.detectors '+dir+'/bkup/'; out = commands.getoutput(cmd)
-      cmd = 'cp -p '+dir+'/'+simbasename+'.detectors.dat '+dir+'/bkup/'; out = commands.getoutput(cmd)
-      # For safety reasons, copy checkpointed statfiles to /bkup/, and give them an index:
-      (bkupstatfiles, status) = find_file_names(dir+'/bkup/', '*.stat')
-      index = len(bkupstatfiles) -1
-      if (index == 0):
-        resfilebasename = simbasename
-      else:
-        resfilebasename = self.simname
-      # If there are more than 1 statfile in the directory, copy the checkpointed files, and give them an index
-      cmd = 'cp -p '+dir+'/'+resfilebasename+'.stat '+dir+'/bkup/'+self.simname+'_'+str(index)+'.stat'; out = commands.getoutput(cmd)
-      cmd = 'cp -p '+dir+'/'+resfilebasename+'.detectors '+dir+'/bkup/'+self.simname+'_'+str(index)+'.detectors'; out = commands.getoutput(cmd)
-      cmd = 'cp -p '+dir+'/'+resfilebasename+'.detectors.dat '+dir+'/bkup/'+self.simname+'_'+str(index)+'.detectors.dat'; out = commands.getoutput(cmd)
     # remove checkpointed *stat and *detectors and *detectors.dat files, and possibly
     # log and error files:
     cmd = 'cd '+dir+'; rm *autocheckp.stat *autocheckp.detectors* fluidity.*'
     out = commands.getoutput(cmd) # Doesn't matter if we get back a 'No such file or directory' error
-    # Also copy the appended version of result files to bkup:
-    cmd = 'cp -p '+dir+'/*stat '+dir+'/*detectors* '+dir+'/bkup/'
-    out = commands.getoutput(cmd)
     # And, if still there, remove tarfile in parent directory:
     #cmd = 'rm '+tar_filename
     #out = commands.getoutput(cmd) # Again, errors from shell do not matter here.
-    msg = 'Local directory has been cleaned up, and most recent checkpoint, plus stat/detectors-files have been copied to '+dir+'/bkup/'
+    msg = 'Local directory has been cleaned up, and most recent checkpoint, plus stat/detectors-files have been backed up to '+dir+'/bkup/'
     self.messaging.message_handling(dir, msg, 3, msgtype='log', subject='Cleaned up')
 
 
-  def check_fixed_sim(self, dir=None):
+  def check_fixed_sim(self, dir):
     """ This subroutine checks if a crashed simulation in 
         'dir' has been taken care of manually, and if so, it
         expects a file 'is_fixed' in its local directory.
@@ -2848,8 +2966,6 @@ class Monitoring:
          simulation_crashed: False if simulation was fixed
            by the user, True otherwise
     """
-    if (dir is None):
-      dir = self.dir
     status = 1
     (file, status) = find_file_names(dir, 'is_fixed')
     if (status == 0):
@@ -2866,15 +2982,13 @@ class Monitoring:
     return simulation_crashed
 
 
-  def remove_previous_fluidity_output_files(self, dir=None):
+  def remove_previous_fluidity_output_files(self, dir):
     """ This method should be executed after a crashed simulation has been manually fixed,
         in order to get rid of the previous output files, as those were/might have been
         corrupted anyway.
         Input:
          dir: String of the directory name of the current simulation (being processed).
     """
-    if (dir is None):
-      dir = self.dir
     # First, find the flml file that was used to run the simulation the last time
     # That flml file can be easily found within the pbs script:
     # Assume the first '.flml' found within the pbs script is actually the flml
@@ -2909,9 +3023,10 @@ class Monitoring:
          calling_fun: String of the calling function, which is used for
            an error message
     """
-    # Taking care of optional argument:
+    # Taking care of optional argument, messages that do not belong to
+    # a particular simulation go to the common log files:
     if (dir is None):
-      dir = self.dir
+      dir = '.'
     # Common SSH errors:
     ssh_errors = ['Connection closed by', 'Connection timed out', 'lost connection', 'ssh_exchange_identification', 'Name or service not known', 'Permission denied']
     # Loop over defined common ssh_errors, and check if a common string
@@ -2935,13 +3050,17 @@ class Monitoring:
           self.messaging.message_handling(dir, errmsg, 0, msgtype='err', subject='SSH setup is wrong')
           raise SSHCrucialConnectionException
 
-  def check_for_ssh_qstat_error(self, string):
+  def check_for_ssh_qstat_error(self, string, cluster_name=None):
     """ This function checks if the given string contains common strings
         from the output of "qstat -a" and raises an user-defined exception
         if no such substring was found.
         Input:
          string: The string of the output from "qstat -a"
+         cluster_name: String of the name/address of the cluster "qstat -a"
+           ran on
     """
+    if (cluster_name is None):
+      cluster_name = self.cluster_name
     # Common qstat -a output substrings:
     qstat_sstrings = ['Job ID', 'Username', 'Queue', 'Jobname', 'SessID', 'NDS', 'TSK', 'Memory', 'Time', 'S']
     # If the cluster is cx1, we can skip the following operation, as cx1 only gives back a list of the jobs
@@ -2953,7 +3072,7 @@ class Monitoring:
     # Loop over lines of the given string, and check if we find any "qstat -a" substrings:
     corr_output = []
     # check if this simulation ran on cx1:
-    if ('cx1' in self.cluster_name.lower()):
+    if ('cx1' in cluster_name.lower()):
       corr_output.append(True)
     else: # else we have to check for the output from "qstat -a":
       for line in string.split('\n'):
@@ -2977,7 +3096,7 @@ class Monitoring:
     """
     # Taking care of optional argument:
     if (dir is None):
-      dir = self.dir
+      dir = '.'
     # Common SCP errors:
     scp_errors = ['Connection closed by', 'Connection timed out', 'lost connection', 'Name or service not known', 'No such file or directory', 'Permission denied']
     # Loop over defined common scp_errors, and check if a common string
@@ -3003,7 +3122,7 @@ class Monitoring:
           # Raise exception
           raise SCPCrucialException
 
-  def check_for_ssh_tar_errors(self, string, dir=None, calling_fun=None):
+  def check_for_ssh_tar_errors(self, string, dir=None, calling_fun=None, simname=None):
     """ This function checks for common ssh errors, tar errors and
         disk quota errors in a given string and raises an user-defined
         exception if such an error was found.
@@ -3012,14 +3131,19 @@ class Monitoring:
          dir: String of the directory for which ssh errors are checked.
          calling_fun: String of the calling function, which is used for
            an error message
+         simname: String of the simulation name, files starting with it
+           are crucial (Default: simname of the simulation in 'dir')
     """
     # Boolean to check if tar error is based on "file not found" error
     filenotfound = False
     filecrucial = False # Boolean to determine if file is crucial!
     unknowntarerror = False
-    # Taking care of optional argument:
+    # Taking care of optional arguments:
     if (dir is None):
-      dir = self.dir
+      dir = '.'
+    if (simname is None):
+      if (dir in self.simulations): simname = self.simulations[dir].simname
+      else: simname = ''
     # Check for common ssh exceptions:
     self.check_for_ssh_errors(string, dir=dir, calling_fun=calling_fun)
     # If that went well, check for disk quota and tar errors:
@@ -3049,7 +3173,7 @@ class Monitoring:
               # Append this line to tarerrormsg:
               tarerrormsg = tarerrormsg+'\n'+line
               # Also check if the current simname is part of this line, if so, this is a more crucial error:
-              if (line.find(self.simname) >= 0):
+              if (simname and line.find(simname) >= 0):
                 filecrucial = True
         elif (error in ['tar: Exiting with failure status']):
           unknowntarerror = True
@@ -3062,7 +3186,7 @@ class Monitoring:
     elif (unknowntarerror and filenotfound and filecrucial):
       # This means that a crucial file was not found, a crucial file is simname*
       # Error message:
-      errmsg = 'Error: TarCrucialException caught during "'+calling_fun+'".\nCould not find any file that starts with the simulation name '+self.simname+'.'
+      errmsg = 'Error: TarCrucialException caught during "'+calling_fun+'".\nCould not find any file that starts with the simulation name '+simname+'.'
       self.messaging.message_handling(dir, errmsg, 0, msgtype='err', subject='TarCrucialException on cluster caught')
       raise TarCrucialException
     elif (not filenotfound and unknowntarerror):
@@ -3073,10 +3197,12 @@ class Monitoring:
       raise TarCrucialException
 
 
-  def write_dict_status_pgftable(self, dict=None, printcols=None, string_replace=None, postprocessing=None, pdflatex=True, pdfcrop=True):
+  def write_dict_status_pgftable(self, dict=None, printcols=None, string_replace=None, postprocessing=None, pdflatex=True, pdfcrop=True, wait=False):
     """ This method assembles lists of the content of the given dictionary
         and then calls methods to write pgf data files of the dictionary,
-        and to update the pdf showing the table.
+        and to update the pdf showing the table. The table is rendered in
+        the background by 'self.table_renderer', at most once per
+        'table_interval' seconds, and only if its content changed.
         Input:
          dict: 2D Dictionary of which all content will be written to file
          printcols: List of columns to print in the table, whereas the elements
@@ -3100,6 +3226,9 @@ class Monitoring:
            generated texfile
          pdfcrop: Boolean determining if pdfcrop should run on the
           generated pdf
+         wait: Boolean determining if the table is rendered right away,
+           and this method returns once it is rendered, e.g. if the pdf
+           is attached to an email (Default: False)
     """
     # Define colors:
     color_err = '\\color{red!60!black}'
@@ -3133,7 +3262,59 @@ class Monitoring:
         string_replace.append(appendlist)
     # Start processing the dictionary:
     if (dict is None):
-      dict = self.dict
+      dict = self.get_dict()
+    # Take a consistent copy, the simulations might be updated meanwhile:
+    with self.dict_lock:
+      dict = copy.deepcopy(dict)
+    key = get_table_hash(dict, printcols, string_replace, postprocessing, pdflatex, pdfcrop)
+    self.table_renderer.request(key, (dict, printcols, string_replace, postprocessing, pdflatex, pdfcrop), wait=wait)
+
+
+  def flush_digest(self, dict=None):
+    """ In digest mode, this method sends the collected emails as one
+        summary email with the status table attached, if they are due
+        (see Messaging.flush_digest).
+        Input:
+         dict: 2D Dictionary of the status table (Default: current
+           dictionary of all simulations)
+    """
+    if (not self.messaging.digest_due()):
+      return
+    if (dict is None):
+      dict = self.get_dict()
+    self.write_dict_status_pgftable(dict, printcols=self.table_header, pdflatex=True, pdfcrop=True, wait=True)
+    self.messaging.flush_digest(attachment='logfiles/cropped_dict_status_table.pdf')
+
+
+  def write_dict_status_html(self, dict=None):
+    """ This method writes the status table of all simulations, with the
+        columns 'self.table_header', as static HTML page
+        'logfiles/dict_status_table.html' (reloaded by browsers every
+        'query_waittime' seconds) and as JSON 'logfiles/dict_status_table.json'.
+        Input:
+         dict: 2D Dictionary of which all content will be written to file
+           (Default: current dictionary of all simulations)
+    """
+    if (dict is None):
+      dict = self.get_dict()
+    pwd = os.getcwd()
+    # Only one thread writes the files at a time:
+    with self.html_lock:
+      write_dict_status_html('logfiles/dict_status_table.html', dict, self.table_header, printcolnames=self.table_colnames, caption='Status of running simulations in: '+pwd, refresh=self.query_waittime)
+      write_dict_status_json('logfiles/dict_status_table.json', dict, self.table_header)
+
+
+  def render_dict_status_pgftable(self, dict, printcols, string_replace, postprocessing, pdflatex=True, pdfcrop=True):
+    """ This method writes the pgf data file and the texfile of the given
+        dictionary, and runs pdflatex/pdfcrop on it, see
+        'write_dict_status_pgftable' for a description of the input arguments.
+        It is called by 'self.table_renderer' in its background thread.
+    """
+    # Define colors:
+    color_err = '\\color{red!60!black}'
+    color_run = '\\color{blue!60!black}'
+    color_que = '\\color{magenta!90!black}'
+    color_fin = '\\color{green!60!black}'
     # First assemble the header of the table:
     #for dir in sorted_nicely(dict.iterkeys()):
     for dir in sorted(dict.iterkeys()):
@@ -3188,7 +3369,7 @@ class Monitoring:
       printcols = array_labels
 
     # Assemble dictionary for printcolnames (only if we want to change the column name):
-    printcolnames = {'nmachines' : 'nodes', 'ncpus' : 'cpus', 'total_ncpus' : 'ncpus', 'memory' : 'mem', 'infiniband' : 'icib', 'sim_time' : 'time', 'error_status' : 'error', 'walltime' : 'wt', 'mpiprocs' : 'mpi'}
+    printcolnames = self.table_colnames
 
     # sorting the table by column total_ncpus:
     #sort_colname = 'total_ncpus'
@@ -3206,35 +3387,24 @@ class Monitoring:
 
 
   def write_dict_status_to_file(self):
-    """ This method dumps the crucial status information of each simulation
-        in an extra file ./logfiles/dict_status_dirname.
+    """ This method records the crucial status information of each
+        simulation in the state store and writes it to disk.
     """
-    # Assemble status text to be written to file:
-    # Assemble status of all registered simulations of the current pwd, 
-    # and write status to status files:
-    for dir in sorted_nicely(self.dict.keys()):
+    for dir in sorted_nicely(self.simulations.keys()):
       self.write_simulation_status_to_file(dir=dir)
+    self.state_store.flush()
 
 
-  def write_simulation_status_to_file(self, dir=None):
+  def write_simulation_status_to_file(self, dir):
     """
-        Write the status of one simulation to its corresponding status file
+        Records the status of one simulation in the state store, it is
+        written to disk with the next 'self.state_store.flush()', which is
+        done once per round of monitoring.
         Input:
          dir: String of the directory name the simulation sits in
     """
-    # Write status of the given simulation (corresponding to 'dir')
-    # to its status file:
-    if (dir is None):
-      dir = self.dir
-    # Get 1D dictionary with all the properties for this 'dir':
-    dir_dict = self.get_dict(dir=dir)
-    statusfile = 'logfiles/dict_status_'+dir
-    # Assembling content of the file:
-    status = 'directory: ' + dir + '\n'
-    for key, value in sorted(dir_dict.items()):
-      status = status + str(key) + ': ' + str(value) + '\n'
-    # Write simulation status to file:
-    string_append_to_file(status, statusfile, append=False)
+    with self.dict_lock:
+      self.state_store.record(dir, self.simulations[dir].get_properties())
 
 
   def get_hashes(self, msg):
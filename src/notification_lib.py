@@ -0,0 +1,140 @@
+import sys
+import time
+import Queue
+import threading
+import traceback
+
+
+
+class NotificationQueue:
+  """ A class for sending notifications (emails, popups) in background
+      threads, such that the monitoring does not wait for them. A
+      notification is a function returning a status (0 if it was sent
+      successfully) with its arguments. Notifications that failed are
+      tried again after 'backoff' seconds, which doubles with every
+      further try, up to 'max_backoff' seconds. The queue holds at most
+      'maxsize' notifications, 'put' waits for a free slot if it is full.
+      A notification can have a function that is called once it was sent
+      or failed for good, e.g. to remove temporary files it used.
+      Before the program exits, 'drain' should be called, which waits
+      until all notifications were sent.
+  """
+  def __init__(self, nworkers=1, maxsize=1000, retries=3, backoff=10.0, max_backoff=300.0):
+    """
+        Constructor with 5 optional input arguments:
+        Input:
+         nworkers: Integer of the number of threads sending the
+           notifications (Default: 1)
+         maxsize: Integer of the maximum number of queued notifications
+           (Default: 1000)
+         retries: Integer of how often a failed notification is tried
+           again (Default: 3)
+         backoff: Float of seconds to wait before the first retry
+           (Default: 10.0)
+         max_backoff: Float of the maximum number of seconds to wait
+           before a retry (Default: 300.0)
+    """
+    self.nworkers = max(1, nworkers)
+    self.retries = retries
+    self.backoff = backoff
+    self.max_backoff = max_backoff
+    self.queue = Queue.Queue(maxsize)
+    # Number of sent notifications, and of notifications which failed
+    # after all retries:
+    self.nsent = 0
+    self.nfailed = 0
+    # Whether retries are skipped, as the program is about to exit:
+    self.draining = False
+    self.threads = []
+    self.lock = threading.Lock()
+
+
+  def put(self, function, args=(), retries=None, done=None):
+    """ This method queues a notification.
+        Input:
+         function: Function sending the notification, which returns 0 if
+           it was sent successfully
+         args: Tuple of the arguments of 'function' (Default: ())
+         retries: Integer of how often the notification is tried again
+           if it failed (Default: None, which uses 'self.retries')
+         done: Tuple of a function and its arguments, which is called
+           after the notification was sent or failed after all retries
+           (Default: None)
+    """
+    if (retries is None):
+      retries = self.retries
+    with self.lock:
+      if (not self.threads):
+        for i in range(self.nworkers):
+          thread = threading.Thread(target=self.worker, name='notification-worker-'+str(i))
+          thread.daemon = True
+          thread.start()
+          self.threads.append(thread)
+    self.queue.put((function, args, retries, done))
+
+
+  def send(self, function, args):
+    """ Sends one notification.
+        Output:
+         status: Integer which is 0 if the notification was sent
+    """
+    try:
+      status = function(*args)
+    except Exception:
+      print 'Error: Exception caught while sending a notification:'
+      traceback.print_exc(file=sys.stdout)
+      status = 1
+    return status
+
+
+  def worker(self):
+    """ This method runs in the background threads and sends the queued
+        notifications.
+    """
+    while (True):
+      (function, args, retries, done) = self.queue.get()
+      try:
+        status = self.send(function, args)
+        attempt = 0
+        while (status != 0 and attempt < retries and not self.draining):
+          # Back off before trying again, unless the queue is drained:
+          waittime = min(self.backoff*2**attempt, self.max_backoff)
+          waituntil = time.time()+waittime
+          while (time.time() < waituntil and not self.draining):
+            time.sleep(min(1.0, waittime))
+          attempt = attempt + 1
+          status = self.send(function, args)
+        with self.lock:
+          if (status == 0):
+            self.nsent = self.nsent + 1
+          else:
+            self.nfailed = self.nfailed + 1
+      finally:
+        if (not (done is None)):
+          self.send(done[0], done[1])
+        self.queue.task_done()
+
+
+  def drain(self, timeout=None):
+    """ This method waits until all queued notifications were sent.
+        Meanwhile, notifications waiting for a retry are tried again right
+        away, and failed notifications are not tried again.
+        Input:
+         timeout: Float of the maximum number of seconds to wait, or None
+           to wait until all were sent (Default: None)
+        Output:
+         unsent: Integer of the number of notifications which are
+           still queued
+    """
+    self.draining = True
+    try:
+      waituntil = None
+      if (not (timeout is None)):
+        waituntil = time.time()+timeout
+      while (self.queue.unfinished_tasks > 0):
+        if (not (waituntil is None) and time.time() >= waituntil):
+          break
+        time.sleep(0.1)
+    finally:
+      self.draining = False
+    return self.queue.unfinished_tasks
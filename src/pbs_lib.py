@@ -0,0 +1,124 @@
+import os
+import json
+import threading
+from journal_lib import decode_properties
+
+
+
+class PbsScriptCache:
+  """ A class that keeps the properties parsed from the pbs scripts of the
+      simulations (see Monitoring.get_simname_walltime_ncpus_pbs), such
+      that a pbs script is only parsed again when its modification time or
+      size changed. As the parsed properties depend on the defaults of the
+      simulation, these are kept with them and compared as well.
+      The cache is stored as JSON in a file in 'logfiles', thus it is used
+      when the monitoring is restarted:
+       {path: {"signature": [mtime, size], "defaults": {name: value},
+               "properties": {name: value}}}
+      The cache can be used from several threads.
+  """
+  def __init__(self, filename='logfiles/pbs_cache.json'):
+    """
+        Constructor with 1 optional input argument:
+        Input:
+         filename: String of the cache file
+           (Default: 'logfiles/pbs_cache.json')
+    """
+    self.filename = filename
+    # Parsed pbs scripts, path : {'signature', 'defaults', 'properties'}:
+    self.entries = {}
+    # Whether entries changed since the cache file was written:
+    self.modified = False
+    self.lock = threading.Lock()
+    self.load()
+
+
+  def load(self):
+    """ This method reads in the cache file, if it exists. A cache file
+        that cannot be read in is ignored.
+    """
+    if (not os.path.isfile(self.filename)):
+      return
+    try:
+      f = open(self.filename, 'rb')
+      try:
+        entries = json.load(f)
+      finally:
+        f.close()
+    except (IOError, ValueError):
+      return
+    with self.lock:
+      for (path, entry) in entries.items():
+        self.entries[str(path)] = {'signature' : entry['signature'], 'defaults' : decode_properties(entry['defaults']), 'properties' : decode_properties(entry['properties'])}
+
+
+  def get(self, filename, defaults):
+    """ Returns the properties parsed from a pbs script, if it did not
+        change since it was parsed with the same defaults.
+        Input:
+         filename: String of the pbs script filename (including its directory)
+         defaults: Dictionary of the defaults the pbs script was parsed with
+        Output:
+         properties: Dictionary of the parsed properties, or None if the pbs
+           script has to be parsed
+    """
+    signature = get_pbs_signature(filename)
+    if (signature is None):
+      return None
+    with self.lock:
+      entry = self.entries.get(os.path.abspath(filename))
+    if (entry is None or entry['signature'] != signature or entry['defaults'] != defaults):
+      return None
+    return dict(entry['properties'])
+
+
+  def put(self, filename, defaults, properties):
+    """ This method stores the properties parsed from a pbs script.
+        Input:
+         filename: String of the pbs script filename (including its directory)
+         defaults: Dictionary of the defaults the pbs script was parsed with
+         properties: Dictionary of the parsed properties
+    """
+    signature = get_pbs_signature(filename)
+    if (signature is None):
+      return
+    with self.lock:
+      self.entries[os.path.abspath(filename)] = {'signature' : signature, 'defaults' : dict(defaults), 'properties' : dict(properties)}
+      self.modified = True
+
+
+  def save(self):
+    """ This method writes the cache file, if entries changed since it was
+        read in or written.
+    """
+    with self.lock:
+      if (not self.modified):
+        return
+      dirname = os.path.dirname(self.filename)
+      if (dirname != '' and not os.path.isdir(dirname)):
+        os.makedirs(dirname)
+      tmp_filename = self.filename+'.tmp'
+      f = open(tmp_filename, 'wb')
+      try:
+        f.write(json.dumps(self.entries))
+      finally:
+        f.close()
+      os.rename(tmp_filename, self.filename)
+      self.modified = False
+
+
+
+def get_pbs_signature(filename):
+  """ Returns the modification time and size of a pbs script, which
+      identify the version of the file that was parsed.
+      Input:
+       filename: String of the pbs script filename
+      Output:
+       signature: List of [mtime, size], or None if the file does
+         not exist
+  """
+  try:
+    statinfo = os.stat(filename)
+  except OSError:
+    return None
+  return [statinfo.st_mtime, statinfo.st_size]
@@ -0,0 +1,99 @@
+class SimulationState(object):
+  """ A class holding the monitoring state of one simulation, meaning the
+      properties of the simulation in one directory, e.g. its jobid on the
+      cluster, the cluster status and walltime, its pbs settings and the
+      flags simulation_running/crashed/finished. One object is kept per
+      simulation in the registry of the class Monitoring, and it is passed
+      explicitly to the methods that process this simulation, such that
+      more than one simulation can be processed at the same time.
+      The attributes are fixed (__slots__), which keeps the registry compact
+      and raises an AttributeError for misspelled properties.
+  """
+  __slots__ = ('dir', 'simname', 'jobid', 'cluster_status', 'cluster_walltime', 'sim_time', 'simulation_running', 'simulation_crashed', 'simulation_finished', 'pbs_walltime', 'nmachines', 'ncpus', 'memory', 'total_ncpus', 'mpiprocs', 'ompthreads', 'nnopercpu', 'infiniband', 'queue', 'cluster_name', 'cluster_dir', 'cluster_fluidity_dir', 'error_status', 'sim_clean_exit')
+  # Keys in the dictionary/dict_status_* files which differ from the attribute names:
+  dict_keys = {'cluster_status' : 'status', 'cluster_walltime' : 'walltime'}
+
+  def __init__(self, dir, **properties):
+    """
+        Constructor with the directory name of the simulation, all other
+        properties are optional keyword arguments, e.g. jobid='123'.
+        Input:
+         dir: String of the directory name the simulation sits in
+         properties: Keyword arguments of the simulation properties,
+           see __slots__
+    """
+    self.dir = dir
+    self.simname = '---'
+    self.jobid = '---'
+    self.cluster_status = ''
+    self.cluster_walltime = '---'
+    self.sim_time = '---'
+    self.simulation_running = False
+    self.simulation_crashed = False
+    self.simulation_finished = False
+    self.pbs_walltime = '72:00:00' # default value
+    self.nmachines = '---' # if not set by user, it'll read it in from preset pbs.sh
+    self.ncpus = '---'
+    self.memory = '---' # if not set by user, it'll read it in from preset pbs.sh
+    self.total_ncpus = '---'
+    self.mpiprocs = '---' # only for cx2
+    self.ompthreads = 1 # only for cx2
+    self.nnopercpu = 15000
+    self.infiniband = False
+    self.queue = None # if not set by user, it'll read it in from preset pbs.sh
+    self.cluster_name = ''
+    self.cluster_dir = ''
+    self.cluster_fluidity_dir = ''
+    self.error_status = 0
+    self.sim_clean_exit = False
+    self.update(**properties)
+
+
+  def update(self, **properties):
+    """ Sets the given properties, properties which are None are ignored.
+        Input:
+         properties: Keyword arguments of the simulation properties,
+           see __slots__
+    """
+    for (name, value) in properties.items():
+      if (not (value is None)):
+        setattr(self, name, value)
+
+
+  def copy(self, dir=None):
+    """ Returns a new object with the same properties.
+        Input:
+         dir: String of the directory name of the new simulation,
+           by default the directory name is copied as well
+        Output:
+         sim: SimulationState object
+    """
+    sim = SimulationState(self.dir)
+    for name in self.__slots__:
+      setattr(sim, name, getattr(self, name))
+    if (not (dir is None)):
+      sim.dir = dir
+    return sim
+
+
+  def get_properties(self):
+    """ Returns the properties (all attributes apart from the directory
+        name) as dictionary, which can be passed on to 'update'.
+        Output:
+         properties: Dictionary of attribute name : value
+    """
+    return dict([(name, getattr(self, name)) for name in self.__slots__[1:]])
+
+
+  def get_dict(self):
+    """ Returns the properties in the layout of the dictionary of the
+        simulations (which is also written to the dict_status_* files),
+        meaning without the directory name, and with the keys 'status'
+        and 'walltime' for the cluster status and walltime.
+        Output:
+         dict: 1D dictionary of the properties
+    """
+    dict = {}
+    for name in self.__slots__[1:]:
+      dict.update({self.dict_keys.get(name, name) : getattr(self, name)})
+    return dict
@@ -0,0 +1,230 @@
+import os
+import commands
+import errno
+import threading
+
+
+
+class SSHConnectionPool:
+  """ A class that keeps one long-lived, multiplexed ssh master connection
+      per (username, cluster_name), such that every ssh/rsync operation on a
+      cluster reuses an already authenticated connection instead of paying
+      a full key exchange. This makes use of OpenSSH's ControlMaster feature:
+      the first command to a cluster starts a master connection in the
+      background (kept alive for 'persist' seconds after its last use),
+      all following commands are sent through its control socket.
+      A dead master connection is detected by a command which could not
+      reach the cluster at all (ssh exits with 255 without any output of
+      the remote side). Then its control socket is removed, and the
+      command is run once more, which establishes a new master connection.
+      Commands that did reach the cluster are never run again, e.g. qsub.
+  """
+  # Diagnostic lines ssh prints on stderr when multiplexing did not work out,
+  # these must not end up in the output that is checked for ssh errors:
+  mux_messages = ['Control socket connect', 'ControlSocket ', 'mux_client_', 'muxclient:', 'Shared connection to ']
+  # Prefix of the error messages of the ssh client itself, e.g. if the
+  # cluster could not be connected to:
+  ssh_messages = ['ssh: ']
+
+  def __init__(self, control_dir=None, persist=600, connect_timeout=30):
+    """
+        Constructor with 3 optional input arguments:
+        Input:
+         control_dir: String of the directory the control sockets are
+           created in (Default: ~/.ssh/hpcmonitor)
+         persist: Integer of seconds an idle master connection is kept
+           open (Default: 600)
+         connect_timeout: Integer of seconds to wait for establishing a
+           new connection (Default: 30)
+    """
+    if (control_dir is None):
+      control_dir = os.path.expanduser('~/.ssh/hpcmonitor')
+    self.control_dir = control_dir
+    self.persist = persist
+    self.connect_timeout = connect_timeout
+    # Registered connections, (username, cluster_name) : control path:
+    self.connections = {}
+    # Dead control sockets are removed one at a time:
+    self.lock = threading.Lock()
+
+
+  def get_control_path(self, username, cluster_name):
+    """ Returns the path of the control socket of the master connection
+        to 'cluster_name', and registers the connection in the pool.
+        Input:
+         username: String of the user's username on the cluster
+         cluster_name: String of address of the cluster
+        Output:
+         control_path: String of the path of the control socket
+    """
+    key = (username, cluster_name)
+    if (not (key in self.connections)):
+      # Control sockets must not be accessible by anyone else:
+      try:
+        os.makedirs(self.control_dir, 0700)
+      except OSError as e:
+        if (e.errno != errno.EEXIST):
+          raise
+      self.connections.update({key : os.path.join(self.control_dir, username+'@'+cluster_name)})
+    return self.connections[key]
+
+
+  def get_ssh_options(self, username, cluster_name):
+    """ Returns the ssh options for multiplexing over the master connection
+        of 'username'@'cluster_name'.
+        Input:
+         username: String of the user's username on the cluster
+         cluster_name: String of address of the cluster
+        Output:
+         options: String of ssh command line options
+    """
+    control_path = self.get_control_path(username, cluster_name)
+    options = '-o ControlMaster=auto -o ControlPath='+control_path+' -o ControlPersist='+str(self.persist)
+    options = options+' -o ConnectTimeout='+str(self.connect_timeout)
+    return options
+
+
+  def get_ssh_cmd(self, username, cluster_name):
+    """ Returns the ssh command (without the remote command) that runs
+        through the master connection of 'username'@'cluster_name'.
+    """
+    return 'ssh '+self.get_ssh_options(username, cluster_name)+' '+username+'@'+cluster_name
+
+
+  def run(self, username, cluster_name, remote_cmd):
+    """ Runs the given command on the cluster through the pooled master
+        connection and returns its output, just like
+        commands.getoutput('ssh user@cluster "remote_cmd"') would do.
+        The output is passed on unchanged (apart from multiplexing
+        diagnostics) such that the usual ssh error checks still apply.
+        Input:
+         username: String of the user's username on the cluster
+         cluster_name: String of address of the cluster
+         remote_cmd: String of the command to run on the cluster
+        Output:
+         out: String of the output of the remote command
+    """
+    cmd = self.get_ssh_cmd(username, cluster_name)+' "'+remote_cmd+'"'
+    return self.run_local(username, cluster_name, cmd)
+
+
+  def rsync(self, username, cluster_name, options, source, destination):
+    """ Runs rsync with ssh as remote shell through the pooled master
+        connection of 'username'@'cluster_name'.
+        Input:
+         username: String of the user's username on the cluster
+         cluster_name: String of address of the cluster
+         options: String of rsync options, e.g. include/exclude rules
+         source: String of the source, e.g. 'dir/' or 'user@cluster:dir/'
+         destination: String of the destination
+        Output:
+         out: String of the output of rsync
+    """
+    cmd = 'rsync -e "'+'ssh '+self.get_ssh_options(username, cluster_name)+'" '+options+' '+source+' '+destination
+    return self.run_local(username, cluster_name, cmd)
+
+
+  def run_local(self, username, cluster_name, cmd):
+    """ Runs a local command which connects to 'cluster_name' via the
+        pooled master connection, e.g. ssh or rsync. If the command could
+        not connect to the cluster (see 'is_connection_failure'), and the
+        master connection is dead, its control socket is removed and the
+        command is run once more, which establishes a new master connection.
+        Input:
+         username: String of the user's username on the cluster
+         cluster_name: String of address of the cluster
+         cmd: String of the full local command
+        Output:
+         out: String of the output of the command
+    """
+    (status, out) = commands.getstatusoutput(cmd)
+    if (self.is_connection_failure(status, out) and self.remove_dead_master(username, cluster_name)):
+      # The command never reached the cluster, reconnect:
+      (status, out) = commands.getstatusoutput(cmd)
+    return self.strip_mux_messages(out)
+
+
+  def is_connection_failure(self, status, out):
+    """ Returns True if a ssh command could not reach the cluster, thus the
+        remote command was not run: ssh exits with 255 and there is no
+        output apart from the messages of the ssh client.
+        Input:
+         status: Integer of the exit status as returned by
+           commands.getstatusoutput, or the return code of a process
+         out: String of the output of the command
+        Output:
+         failed: Boolean which is True if the cluster was not reached
+    """
+    if (status > 255):
+      status = status >> 8
+    if (status != 255):
+      return False
+    for line in out.split('\n'):
+      if (line.strip() != '' and not any([line.startswith(msg) for msg in self.mux_messages+self.ssh_messages])):
+        return False
+    return True
+
+
+  def strip_mux_messages(self, out):
+    """ Removes diagnostic lines of the ssh multiplexing from the output
+        of a command. They do not mean that the command failed, e.g. ssh
+        falls back to a direct connection if the control socket cannot
+        be used.
+        Input:
+         out: String of the output of a ssh/rsync command
+        Output:
+         out: String of the output without multiplexing diagnostics
+    """
+    lines = [line for line in out.split('\n') if (not any([line.startswith(msg) for msg in self.mux_messages]))]
+    return '\n'.join(lines)
+
+
+  def remove_dead_master(self, username, cluster_name):
+    """ Removes the control socket of the master connection to
+        'cluster_name', if the master connection is dead. A master
+        connection which is alive is left alone, as other threads might
+        use it.
+        Output:
+         removed: Boolean which is True if a dead control socket was removed
+    """
+    control_path = self.get_control_path(username, cluster_name)
+    with self.lock:
+      if (not os.path.exists(control_path) or self.check(username, cluster_name)):
+        return False
+      try:
+        os.remove(control_path)
+      except OSError:
+        return False # socket does not exist (anymore)
+    return True
+
+
+  def check(self, username, cluster_name):
+    """ Checks if the master connection to 'cluster_name' is alive.
+        Output:
+         alive: Boolean which is True if the master connection is up
+    """
+    control_path = self.get_control_path(username, cluster_name)
+    (status, out) = commands.getstatusoutput('ssh -o ControlPath='+control_path+' -O check '+username+'@'+cluster_name)
+    return status == 0
+
+
+  def reset(self, username, cluster_name):
+    """ Closes the master connection to 'cluster_name' (if still up) and
+        removes its control socket, the next command reconnects. This must
+        only be done if no other thread uses the master connection, e.g.
+        when the program exits.
+    """
+    control_path = self.get_control_path(username, cluster_name)
+    commands.getoutput('ssh -o ControlPath='+control_path+' -O exit '+username+'@'+cluster_name)
+    try:
+      os.remove(control_path)
+    except OSError:
+      pass # socket does not exist (anymore)
+
+
+  def close_all(self):
+    """ Closes all master connections of the pool.
+    """
+    for (username, cluster_name) in self.connections.keys():
+      self.reset(username, cluster_name)
+    self.connections = {}
@@ -0,0 +1,522 @@
+import os
+import re
+import json
+import zlib
+import fcntl
+import threading
+from collections import OrderedDict
+from numpy import asarray, memmap, fromstring, float64
+import fluidity_tools
+
+
+
+class StatFile:
+  """ A class holding the contents of one .stat/.detectors file of
+      Fluidity as NumPy column arrays. The file is parsed only once, all
+      quantities are then read from the columns, e.g.
+       stat.get('fluid', 'Pressure', 'min')
+      returns the same as
+       fluidity_tools.stat_parser(filename)['fluid']['Pressure']['min']
+      StatFile objects should be obtained via get_stat_file(filename), which
+      keeps the most recently used files in memory, such that reading
+      several quantities of the same file does not parse it again.
+      Optionally, the columns are read from a binary sidecar file of the
+      .stat file (see StatSidecar), in which case they are memory-mapped
+      instead of being loaded into memory.
+  """
+  def __init__(self, filename, sidecar=False):
+    """
+        Constructor with the filename of the .stat file, which is parsed
+        right away.
+        Input:
+         filename: String of the .stat file
+         sidecar: Boolean, if True the columns are memory-mapped from
+           the binary sidecar file, which is created/updated if
+           necessary (Default: False)
+    """
+    self.filename = filename
+    # Signature of the parsed file, the file is parsed again when it changes:
+    self.signature = get_stat_file_signature(filename)
+    # Columns of the file, (key1, key2, ...) : array:
+    self.columns = None
+    if (sidecar):
+      try:
+        self.columns = StatSidecar(filename).load()
+      except (IOError, OSError, ValueError):
+        # No sidecar possible, e.g. directory not writable, or malformed rows:
+        self.columns = None
+    if (self.columns is None):
+      self.columns = {}
+      self.set_columns(fluidity_tools.stat_parser(filename))
+
+
+  def set_columns(self, stat, keys=()):
+    """ This method stores the (nested) dictionary returned by
+        fluidity_tools.stat_parser as flat dictionary of column arrays.
+        Input:
+         stat: (Nested) dictionary of the stat_parser
+         keys: Tuple of the keys of 'stat' in the nested dictionary
+    """
+    for (name, value) in stat.items():
+      if (isinstance(value, dict)):
+        self.set_columns(value, keys+(name,))
+      else:
+        self.columns[keys+(name,)] = asarray(value)
+
+
+  def get(self, *keys):
+    """ Returns the column of the given keys, in the order they are used
+        for the dictionary of fluidity_tools.stat_parser.
+        Input:
+         keys: Strings of the keys, e.g. 'fluid', 'Velocity%magnitude', 'max'
+        Output:
+         column: array of the values
+    """
+    try:
+      return self.columns[keys]
+    except KeyError:
+      raise KeyError("'"+"']['".join(keys)+"' not found in stat file: "+self.filename)
+
+
+  def has(self, *keys):
+    """ Returns True if the file contains a column of the given keys.
+    """
+    return keys in self.columns
+
+
+  def is_current(self):
+    """ Returns True if the file did not change since it was parsed.
+    """
+    return get_stat_file_signature(self.filename) == self.signature
+
+
+
+class StatFileCache:
+  """ A class that keeps the 'maxfiles' most recently used StatFile objects
+      in memory, keyed by their path. A cached file is parsed again if its
+      modification time or size changed, e.g. because the simulation
+      wrote more timesteps or the file was downloaded again from a cluster.
+      The cache can be used from several threads.
+  """
+  def __init__(self, maxfiles=8, sidecars=False):
+    """
+        Constructor with 2 optional input arguments:
+        Input:
+         maxfiles: Integer of the number of files kept in memory
+           (Default: 8)
+         sidecars: Boolean, if True the files are read via their binary
+           sidecar files (Default: False)
+    """
+    self.maxfiles = max(1, maxfiles)
+    self.sidecars = sidecars
+    # Cached files in the order of their use, path : StatFile:
+    self.statfiles = OrderedDict()
+    self.lock = threading.Lock()
+
+
+  def get(self, filename):
+    """ Returns the StatFile object of 'filename', which is parsed only
+        if it is not cached or changed since it was parsed.
+        Input:
+         filename: String of the .stat file
+        Output:
+         statfile: StatFile object
+    """
+    path = os.path.abspath(filename)
+    signature = get_stat_file_signature(filename)
+    with self.lock:
+      statfile = self.statfiles.pop(path, None)
+      if (not (statfile is None) and statfile.signature == signature):
+        # Mark as most recently used:
+        self.statfiles[path] = statfile
+        return statfile
+    # Parsing a large file takes long, thus other threads are not blocked meanwhile:
+    statfile = StatFile(filename, sidecar=self.sidecars)
+    with self.lock:
+      self.statfiles.pop(path, None)
+      self.statfiles[path] = statfile
+      while (len(self.statfiles) > self.maxfiles):
+        # Remove least recently used file:
+        self.statfiles.popitem(last=False)
+    return statfile
+
+
+  def clear(self):
+    """ Removes all files from the cache.
+    """
+    with self.lock:
+      self.statfiles.clear()
+
+
+
+class StatSidecar:
+  """ A class for the binary sidecar file of an ASCII .stat/.detectors file,
+      which is named like the file plus '.bin', e.g. 'sim.stat.bin'.
+      The sidecar consists of a header (a line 'HPCMSTAT <headersize>'
+      followed by JSON metadata, padded to 'headersize' bytes) and one
+      contiguous float64 block of 'ncolumns' x 'capacity' values in
+      column-major order, i.e. every column of the .stat file is stored
+      contiguously with room for 'capacity' rows. Thus the columns can be
+      memory-mapped without copying them into memory.
+      The sidecar remembers up to which byte of the .stat file the rows
+      were converted, such that rows appended to the .stat file (e.g. by
+      append_resfiles) are converted incrementally, and new space is only
+      allocated if the capacity is exhausted. If the .stat file was
+      replaced by a different one, the sidecar is created anew.
+      Binary .stat files of Fluidity (format 'binary') are not supported.
+  """
+  magic = 'HPCMSTAT'
+  version = 1
+  # The header size is a multiple of 'blocksize':
+  blocksize = 4096
+  # Number of bytes at the end of the converted rows whose checksum is stored:
+  tailsize = 256
+
+  def __init__(self, filename, chunksize=8388608):
+    """
+        Constructor with the filename of the .stat file.
+        Input:
+         filename: String of the .stat/.detectors file
+         chunksize: Integer of the number of bytes of the .stat file
+           converted at once (Default: 8 MB)
+    """
+    self.filename = filename
+    self.sidecar_filename = filename+'.bin'
+    self.chunksize = chunksize
+
+
+  def load(self):
+    """ This method brings the sidecar up to date and returns its columns.
+        Output:
+         columns: Dictionary of (key1, key2, ...) : memory-mapped array,
+           or None if the .stat file is not supported
+    """
+    f = open(self.filename, 'rb')
+    try:
+      # Serialises updates of the sidecar by several threads/processes:
+      fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+      header = self.update()
+      if (header is None):
+        return None
+      return self.get_columns(header)
+    finally:
+      f.close()
+
+
+  def update(self):
+    """ This method creates the sidecar or converts the rows which were
+        appended to the .stat file since the last update.
+        Output:
+         header: Dictionary of the header of the sidecar, or None if the
+           .stat file is not supported
+    """
+    source = self.read_source_header()
+    if (source is None):
+      return None
+    (fields, ncolumns, data_offset, header_crc) = source
+    size = os.path.getsize(self.filename)
+    header = self.read_header()
+    if (header is None or header['version'] != self.version or header['header_crc'] != header_crc
+        or header['ncolumns'] != ncolumns or header['source_offset'] > size
+        or header['tail_crc'] != self.get_tail_crc(header['source_offset'], data_offset)):
+      # No (valid) sidecar of this .stat file, start from scratch:
+      header = {'version' : self.version, 'fields' : fields, 'ncolumns' : ncolumns, 'header_crc' : header_crc,
+                'nrows' : 0, 'capacity' : 0, 'source_offset' : data_offset, 'data_offset' : data_offset,
+                'tail_crc' : self.get_tail_crc(data_offset, data_offset)}
+      header = self.create(header, self.estimate_nrows(data_offset, size))
+    if (header['source_offset'] < size):
+      header = self.append_rows(header, size)
+    return header
+
+
+  def read_source_header(self):
+    """ This method parses the XML header of the .stat file.
+        Output:
+         source: Tuple of (fields, ncolumns, data_offset, header_crc), where
+           fields is a list of [keys, column, components] with the
+           0-based column index, data_offset is the byte offset of the first
+           row and header_crc the checksum of the XML header, or None if the
+           file is not an ASCII .stat file
+    """
+    f = open(self.filename, 'rb')
+    header_lines = []
+    data_offset = 0
+    try:
+      for line in f:
+        header_lines.append(line)
+        data_offset = data_offset + len(line)
+        if (line.find('</header>') >= 0):
+          break
+      else:
+        return None # no (complete) header
+    finally:
+      f.close()
+    fields = []
+    ncolumns = 0
+    for line in header_lines:
+      attributes = dict(re.findall(r'(\w+)="([^"]*)"', line))
+      if (line.find('<constant') >= 0 and attributes.get('name') == 'format' and attributes.get('value') != 'plain_text'):
+        return None # binary .stat file
+      if (line.find('<field') < 0):
+        continue
+      if (attributes.get('material_phase')):
+        keys = [attributes['material_phase'], attributes['name'], attributes['statistic']]
+      else:
+        keys = [attributes['name'], attributes['statistic']]
+      column = int(attributes['column'])-1
+      components = int(attributes.get('components', 1))
+      fields.append([keys, column, components])
+      ncolumns = max(ncolumns, column+components)
+    if (ncolumns == 0):
+      return None
+    header_crc = zlib.crc32(''.join(header_lines)) & 0xffffffff
+    return fields, ncolumns, data_offset, header_crc
+
+
+  def get_tail_crc(self, offset, data_offset):
+    """ Returns the checksum of the last 'tailsize' bytes of the rows of
+        the .stat file before 'offset', which identifies the rows that
+        were already converted.
+    """
+    start = max(data_offset, offset-self.tailsize)
+    f = open(self.filename, 'rb')
+    try:
+      f.seek(start)
+      return zlib.crc32(f.read(offset-start)) & 0xffffffff
+    finally:
+      f.close()
+
+
+  def estimate_nrows(self, offset, size):
+    """ Returns an estimate of the number of rows between the byte offsets
+        'offset' and 'size' of the .stat file, based on the length of the
+        row at 'offset'.
+    """
+    f = open(self.filename, 'rb')
+    try:
+      f.seek(offset)
+      rowlength = len(f.readline())
+    finally:
+      f.close()
+    if (rowlength == 0):
+      return 1
+    return int(1.1*(size-offset)/rowlength)+1
+
+
+  def read_header(self):
+    """ This method reads the header of the sidecar.
+        Output:
+         header: Dictionary of the header, or None if there is no valid
+           sidecar
+    """
+    try:
+      f = open(self.sidecar_filename, 'rb')
+    except IOError:
+      return None
+    try:
+      line = f.readline(64)
+      parts = line.split()
+      if (len(parts) != 2 or parts[0] != self.magic):
+        return None
+      headersize = int(parts[1])
+      header = json.loads(f.read(headersize-len(line)))
+      header['headersize'] = headersize
+      for key in ['version', 'fields', 'ncolumns', 'header_crc', 'nrows', 'capacity', 'source_offset', 'data_offset', 'tail_crc']:
+        if (not (key in header)):
+          return None
+      if (os.fstat(f.fileno()).st_size < headersize+8*header['ncolumns']*header['capacity']):
+        return None # truncated sidecar
+    except (ValueError, KeyError, TypeError):
+      return None
+    finally:
+      f.close()
+    return header
+
+
+  def get_header_text(self, header, headersize):
+    """ Returns the header of the sidecar as string of 'headersize' bytes,
+        or None if the header does not fit in.
+    """
+    metadata = dict(header)
+    metadata.pop('headersize', None)
+    text = self.magic+' '+str(headersize)+'\n'+json.dumps(metadata)+'\n'
+    if (len(text) > headersize):
+      return None
+    return text+' '*(headersize-len(text))
+
+
+  def create(self, header, capacity, columns=None):
+    """ This method writes a new sidecar with room for 'capacity' rows and
+        replaces the previous sidecar (if any). The header leaves some
+        space such that it can be updated in place later on.
+        Input:
+         header: Dictionary of the header
+         capacity: Integer of the number of rows to allocate
+         columns: Memory-mapped array of the previous sidecar, of which
+           the first header['nrows'] rows are copied (Default: None)
+        Output:
+         header: Dictionary of the header of the new sidecar
+    """
+    header = dict(header)
+    header['capacity'] = max(1, capacity, header['nrows'])
+    headersize = self.blocksize
+    while (self.get_header_text(header, headersize-1024) is None):
+      headersize = headersize + self.blocksize
+    header['headersize'] = headersize
+    tmp_filename = self.sidecar_filename+'.tmp'
+    f = open(tmp_filename, 'wb')
+    try:
+      f.write(self.get_header_text(header, headersize))
+      # Allocates the block (sparse, where supported):
+      f.truncate(headersize+8*header['ncolumns']*header['capacity'])
+    finally:
+      f.close()
+    if (not (columns is None) and header['nrows'] > 0):
+      newcolumns = memmap(tmp_filename, dtype=float64, mode='r+', offset=headersize, shape=(header['ncolumns'], header['capacity']))
+      newcolumns[:, :header['nrows']] = columns[:, :header['nrows']]
+      newcolumns.flush()
+      del newcolumns
+    os.rename(tmp_filename, self.sidecar_filename)
+    return header
+
+
+  def open_columns(self, header, mode='r'):
+    """ Returns the memory-mapped block of the sidecar as array of the
+        shape (ncolumns, capacity).
+    """
+    return memmap(self.sidecar_filename, dtype=float64, mode=mode, offset=header['headersize'], shape=(header['ncolumns'], header['capacity']))
+
+
+  def append_rows(self, header, size):
+    """ This method converts the rows of the .stat file from byte
+        header['source_offset'] up to 'size' and appends them to the
+        sidecar. An incomplete last row is left for the next update.
+        Input:
+         header: Dictionary of the header of the sidecar
+         size: Integer of the size of the .stat file
+        Output:
+         header: Dictionary of the updated header of the sidecar
+    """
+    ncolumns = header['ncolumns']
+    offset = header['source_offset']
+    nrows = header['nrows']
+    columns = self.open_columns(header, mode='r+')
+    f = open(self.filename, 'rb')
+    try:
+      while (offset < size):
+        f.seek(offset)
+        data = f.read(min(self.chunksize, size-offset))
+        if (data.find('\n') < 0 and offset+len(data) < size):
+          # Row longer than a chunk:
+          data = data+f.readline()
+        end = data.rfind('\n')+1
+        if (end == 0):
+          break # only an incomplete row left
+        rows = fromstring(data[:end], dtype=float64, sep=' ')
+        if (len(rows) % ncolumns != 0):
+          raise ValueError('Malformed rows in stat file: '+self.filename)
+        rows = rows.reshape(-1, ncolumns)
+        if (nrows+len(rows) > header['capacity']):
+          # Not enough space left, allocate more (at least twice as much):
+          header.update({'nrows' : nrows, 'source_offset' : offset})
+          capacity = max(2*header['capacity'], nrows+len(rows)+self.estimate_nrows(offset+end, size))
+          header = self.create(header, capacity, columns=columns)
+          columns = self.open_columns(header, mode='r+')
+        columns[:, nrows:nrows+len(rows)] = rows.T
+        nrows = nrows + len(rows)
+        offset = offset + end
+      columns.flush()
+    finally:
+      f.close()
+    # The header is updated last, thus readers never see incomplete rows:
+    header.update({'nrows' : nrows, 'source_offset' : offset, 'tail_crc' : self.get_tail_crc(offset, header['data_offset'])})
+    text = self.get_header_text(header, header['headersize'])
+    if (text is None):
+      # Header outgrew its space, write the sidecar anew:
+      return self.create(header, header['capacity'], columns=self.open_columns(header))
+    f = open(self.sidecar_filename, 'r+b')
+    try:
+      f.write(text)
+    finally:
+      f.close()
+    return header
+
+
+  def get_columns(self, header):
+    """ Returns the columns of the sidecar as memory-mapped arrays, keyed
+        like the columns of StatFile. Fields with more than one component
+        are arrays of the shape (components, nrows), as with
+        fluidity_tools.stat_parser.
+        Input:
+         header: Dictionary of the header of the sidecar
+        Output:
+         columns: Dictionary of (key1, key2, ...) : array
+    """
+    block = self.open_columns(header)
+    nrows = header['nrows']
+    columns = {}
+    for (keys, column, components) in header['fields']:
+      keys = tuple([str(key) for key in keys])
+      if (components == 1):
+        columns[keys] = block[column, :nrows]
+      else:
+        columns[keys] = block[column:column+components, :nrows]
+    return columns
+
+
+
+def get_stat_file_signature(filename):
+  """ Returns the modification time and size of a file, which identify
+      the version of the file that was parsed.
+      Input:
+       filename: String of the file
+      Output:
+       signature: Tuple of (mtime, size)
+  """
+  statinfo = os.stat(filename)
+  return (statinfo.st_mtime, statinfo.st_size)
+
+
+# Cache shared by all read_*_from_stat/detector routines:
+stat_file_cache = StatFileCache()
+
+
+def get_stat_file(filename):
+  """ Returns the StatFile object of 'filename' from the shared cache.
+      Input:
+       filename: String of the .stat file
+      Output:
+       statfile: StatFile object
+  """
+  return stat_file_cache.get(filename)
+
+
+def set_stat_sidecars(sidecars):
+  """ Switches reading the .stat files via their binary sidecar files
+      (see StatSidecar) on or off for the shared cache.
+      Input:
+       sidecars: Boolean, True for reading via sidecar files
+  """
+  stat_file_cache.sidecars = sidecars
+  stat_file_cache.clear()
+
+
+def update_stat_sidecar(filename):
+  """ Creates the binary sidecar file of a .stat file, or converts the
+      rows which were appended to the .stat file since its last update.
+      Input:
+       filename: String of the .stat/.detectors file
+      Output:
+       status: Integer which is 0 if the sidecar is up to date, and
+         non-zero otherwise
+  """
+  f = open(filename, 'rb')
+  try:
+    fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+    if (StatSidecar(filename).update() is None):
+      return 1
+  except (IOError, OSError, ValueError):
+    return 1
+  finally:
+    f.close()
+  return 0
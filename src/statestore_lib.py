@@ -0,0 +1,198 @@
+import os
+import time
+import json
+import sqlite3
+import threading
+from simulation_lib import SimulationState
+from journal_lib import decode_properties
+
+
+
+class SQLiteStateStore:
+  """ A class for storing the state of all simulations in one SQLite
+      database, as an alternative to the StateJournal with the same
+      methods (exists, has, record, flush and replay). The database holds
+      the tables:
+       simulations: One row per simulation with the directory name and its
+         properties (see SimulationState) as columns, plus all properties
+         as JSON (column 'properties'), from which the state is restored.
+         Indexed on cluster_status and error_status.
+       transitions: One row per change of the state of a simulation, with
+         the properties that changed as JSON.
+       messages: One row per message of the monitoring (see
+         Messaging.message_handling).
+      Records and messages are collected in memory and written with 'flush'
+      in one transaction, which is done once per round of monitoring.
+      The state of the whole fleet can then be queried, e.g.
+       store.get_dirs(simulation_crashed=True)
+      returns the directories of all crashed simulations.
+  """
+  # Properties of the simulations, which are the columns of the simulations table:
+  columns = SimulationState.__slots__[1:]
+
+  def __init__(self, filename='logfiles/state.sqlite'):
+    """
+        Constructor with 1 optional input argument:
+        Input:
+         filename: String of the database file
+           (Default: 'logfiles/state.sqlite')
+    """
+    self.filename = filename
+    # Latest recorded state of every simulation, dir : {property : value}:
+    self.states = {}
+    # Records and messages not written to the database yet:
+    self.pending = []
+    self.pending_messages = []
+    # Number of the last record:
+    self.seq = 0
+    self.connection = None
+    self.lock = threading.Lock()
+
+
+  def connect(self):
+    """ Returns the connection to the database, which is opened (and its
+        tables are created) on first use. It must be called with
+        'self.lock' held.
+    """
+    if (self.connection is None):
+      connection = sqlite3.connect(self.filename, check_same_thread=False)
+      connection.text_factory = str
+      cursor = connection.cursor()
+      cursor.execute('CREATE TABLE IF NOT EXISTS simulations (dir TEXT PRIMARY KEY, '+', '.join(self.columns)+', properties TEXT, updated REAL)')
+      cursor.execute('CREATE INDEX IF NOT EXISTS simulations_cluster_status ON simulations (cluster_status)')
+      cursor.execute('CREATE INDEX IF NOT EXISTS simulations_error_status ON simulations (error_status)')
+      cursor.execute('CREATE TABLE IF NOT EXISTS transitions (seq INTEGER PRIMARY KEY, time REAL, dir TEXT, properties TEXT)')
+      cursor.execute('CREATE INDEX IF NOT EXISTS transitions_dir ON transitions (dir)')
+      cursor.execute('CREATE TABLE IF NOT EXISTS messages (id INTEGER PRIMARY KEY AUTOINCREMENT, time REAL, dir TEXT, msgtype TEXT, subject TEXT, message TEXT)')
+      cursor.execute('CREATE INDEX IF NOT EXISTS messages_dir ON messages (dir)')
+      connection.commit()
+      self.connection = connection
+    return self.connection
+
+
+  def exists(self):
+    """ Returns True if the database holds the state of a previous run.
+    """
+    if (not os.path.isfile(self.filename)):
+      return False
+    with self.lock:
+      row = self.connect().execute('SELECT COUNT(*) FROM simulations').fetchone()
+    return row[0] > 0
+
+
+  def has(self, dir):
+    """ Returns True if the state of the simulation in 'dir' was recorded.
+    """
+    with self.lock:
+      return dir in self.states
+
+
+  def record(self, dir, properties):
+    """ This method records the state of a simulation, only the properties
+        that changed since the last record of this simulation make it into
+        the transitions table. The record is written with the next 'flush'.
+        Input:
+         dir: String of the directory name the simulation sits in
+         properties: Dictionary of all properties of the simulation
+    """
+    with self.lock:
+      state = self.states.setdefault(dir, {})
+      changes = dict([(name, value) for (name, value) in properties.items() if (not (name in state) or state[name] != value)])
+      if (not changes):
+        return
+      state.update(changes)
+      self.seq = self.seq + 1
+      self.pending.append((self.seq, time.time(), dir, changes))
+
+
+  def record_message(self, dir, msgtype, subject, message):
+    """ This method records a message of the monitoring, it is written
+        with the next 'flush'.
+        Input:
+         dir: String of the directory name of the simulation
+         msgtype: String of the type, either 'log' or 'err'
+         subject: String of the subject
+         message: String of the message
+    """
+    with self.lock:
+      self.pending_messages.append((time.time(), dir, msgtype, subject, message))
+
+
+  def flush(self):
+    """ This method writes all pending records and messages to the
+        database in one transaction.
+    """
+    with self.lock:
+      if (not (self.pending or self.pending_messages)):
+        return
+      connection = self.connect()
+      dirs = sorted(set([record[2] for record in self.pending]))
+      with connection:
+        connection.executemany('INSERT INTO transitions (seq, time, dir, properties) VALUES (?, ?, ?, ?)',
+                               [(seq, now, dir, json.dumps(changes)) for (seq, now, dir, changes) in self.pending])
+        rows = []
+        for dir in dirs:
+          state = self.states[dir]
+          rows.append(tuple([dir]+[state.get(name) for name in self.columns]+[json.dumps(state), time.time()]))
+        connection.executemany('INSERT OR REPLACE INTO simulations (dir, '+', '.join(self.columns)+', properties, updated) VALUES ('+', '.join(['?']*(len(self.columns)+3))+')', rows)
+        connection.executemany('INSERT INTO messages (time, dir, msgtype, subject, message) VALUES (?, ?, ?, ?, ?)', self.pending_messages)
+      self.pending = []
+      self.pending_messages = []
+
+
+  def replay(self):
+    """ This method reads in the state of all simulations from the
+        database.
+        Output:
+         states: Dictionary of dir : {property : value} of all simulations
+           whose state was recorded
+    """
+    with self.lock:
+      connection = self.connect()
+      self.states = {}
+      for (dir, properties) in connection.execute('SELECT dir, properties FROM simulations'):
+        self.states[dir] = decode_properties(json.loads(properties))
+      self.seq = connection.execute('SELECT MAX(seq) FROM transitions').fetchone()[0] or 0
+      return dict([(dir, dict(state)) for (dir, state) in self.states.items()])
+
+
+  def get_dirs(self, **conditions):
+    """ Returns the directories of the simulations whose properties have
+        the given values, e.g. get_dirs(cluster_status='R', error_status=0).
+        Only the state that was flushed to the database is considered.
+        Input:
+         conditions: Keyword arguments of property : value
+        Output:
+         dirs: List of strings of the directory names
+    """
+    for name in conditions.keys():
+      if (not (name in self.columns)):
+        raise KeyError('Unknown property of simulations: '+name)
+    query = 'SELECT dir FROM simulations'
+    if (conditions):
+      query = query+' WHERE '+' AND '.join([name+' = ?' for name in conditions.keys()])
+    with self.lock:
+      return [row[0] for row in self.connect().execute(query, conditions.values())]
+
+
+  def get_history(self, dir):
+    """ Returns the state transitions of a simulation.
+        Input:
+         dir: String of the directory name of the simulation
+        Output:
+         history: List of tuples (time, {property : value}) in the order
+           they were recorded
+    """
+    with self.lock:
+      rows = self.connect().execute('SELECT time, properties FROM transitions WHERE dir = ? ORDER BY seq', (dir,)).fetchall()
+    return [(row[0], decode_properties(json.loads(row[1]))) for row in rows]
+
+
+  def close(self):
+    """ Writes pending records and closes the database.
+    """
+    self.flush()
+    with self.lock:
+      if (not (self.connection is None)):
+        self.connection.close()
+        self.connection = None
@@ -0,0 +1,140 @@
+import sys
+import time
+import hashlib
+import threading
+import traceback
+
+
+
+class TableRenderer:
+  """ A class that renders the status table of the simulations (pgf data
+      file, texfile, pdflatex and pdfcrop) in a background thread, such that
+      the monitoring does not wait for LaTeX. A request only marks the table
+      as dirty with its latest content, and requests are coalesced into at
+      most one rendering per 'interval' seconds, which renders the latest
+      content. Content that is identical to the rendered content (compared
+      by a hash of the content, see get_table_hash) is not rendered again.
+      A request with 'wait=True' renders right away (regardless of
+      'interval') and returns once the table is rendered, e.g. if the pdf
+      of the table is attached to an email.
+  """
+  def __init__(self, render, interval=60.0):
+    """
+        Constructor with the function that renders the table, and
+        1 optional input argument:
+        Input:
+         render: Function that renders the table, called with the
+           arguments given to 'request'
+         interval: Float of the minimum number of seconds between two
+           renderings (Default: 60.0)
+    """
+    self.render = render
+    self.interval = interval
+    # Latest requested content that is not rendered yet, (key, args):
+    self.pending = None
+    # Hash of the content that is being rendered, and of the rendered content:
+    self.rendering_key = None
+    self.rendered_key = None
+    # Whether the pending content is rendered without waiting for 'interval':
+    self.urgent = False
+    # Time of the last rendering:
+    self.last_render = 0.0
+    # Number of renderings, and of requests which did not need one:
+    self.nrenders = 0
+    self.nskipped = 0
+    self.thread = None
+    self.condition = threading.Condition()
+
+
+  def request(self, key, args, wait=False):
+    """ This method requests the table to be rendered with the given
+        content.
+        Input:
+         key: String of the hash of the content
+         args: Tuple of the arguments to the render function
+         wait: Boolean, if True, the table is rendered right away, and
+           this method returns once it is rendered (Default: False)
+    """
+    with self.condition:
+      if (not (self.pending is None)):
+        latest_key = self.pending[0]
+      elif (not (self.rendering_key is None)):
+        latest_key = self.rendering_key
+      else:
+        latest_key = self.rendered_key
+      if (key == latest_key):
+        self.nskipped = self.nskipped + 1
+      elif (key == self.rendered_key and self.rendering_key is None):
+        # The content changed back to the rendered content:
+        self.pending = None
+        self.nskipped = self.nskipped + 1
+      else:
+        self.pending = (key, args)
+        if (self.thread is None):
+          self.thread = threading.Thread(target=self.worker, name='table-renderer')
+          self.thread.daemon = True
+          self.thread.start()
+      if (wait and not (self.pending is None)):
+        self.urgent = True
+      self.condition.notify_all()
+    if (wait):
+      self.flush()
+
+
+  def flush(self):
+    """ This method renders the pending content right away, and returns
+        once no rendering is pending or running.
+    """
+    with self.condition:
+      if (not (self.pending is None)):
+        self.urgent = True
+        self.condition.notify_all()
+      while (not (self.pending is None and self.rendering_key is None)):
+        # wait with a timeout, otherwise KeyboardInterrupt is not received:
+        self.condition.wait(1.0)
+
+
+  def worker(self):
+    """ This method runs in the background thread and renders the pending
+        content, at most once per 'self.interval' seconds.
+    """
+    while (True):
+      with self.condition:
+        while (self.pending is None):
+          self.condition.wait()
+        delay = self.last_render+self.interval-time.time()
+        if (delay > 0 and not self.urgent):
+          self.condition.wait(delay)
+          continue
+        (key, args) = self.pending
+        self.pending = None
+        self.urgent = False
+        self.rendering_key = key
+      try:
+        self.render(*args)
+      except Exception:
+        print 'Error: Exception caught while rendering the status table:'
+        traceback.print_exc(file=sys.stdout)
+        # Render the next request, even if its content is the same:
+        key = None
+      with self.condition:
+        self.rendered_key = key
+        self.rendering_key = None
+        self.last_render = time.time()
+        self.nrenders = self.nrenders + 1
+        self.condition.notify_all()
+
+
+
+def get_table_hash(dict, *args):
+  """ Returns a hash of the content of a table, which is the same for the
+      same content, regardless of the order of the entries of the
+      dictionaries.
+      Input:
+       dict: 2D Dictionary of the content of the table
+       args: Further arguments that affect the table, e.g. its columns
+      Output:
+       key: String of the hash
+  """
+  rows = [(dir, sorted(dict[dir].items())) for dir in sorted(dict.keys())]
+  return hashlib.md5(repr((rows, args))).hexdigest()
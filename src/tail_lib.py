@@ -0,0 +1,146 @@
+import os
+import glob
+import tempfile
+import threading
+import subprocess
+
+
+
+class TailPuller:
+  """ A class for pulling only the appended end of result files that grow
+      while a simulation is running, e.g. its stat/detectors/detectors.dat
+      files, instead of having rsync compare the whole files every round.
+      The size of every file is recorded after it was pulled. If the local
+      file still has that size in the next round, only the remote file
+      from 'overlap' bytes before its local end onwards is sent through
+      the pooled ssh connection (see SSHConnectionPool) with 'tail -c'.
+      The overlapping bytes must be the same as the end of the local file,
+      which shows the remote file was only appended to. Only then the rest
+      is appended to the local file, otherwise the file has to be pulled
+      in full (e.g. by rsync) and its size is recorded again.
+  """
+  def __init__(self, ssh_pool, overlap=4096):
+    """
+        Constructor with 1 input argument and 1 optional input argument:
+        Input:
+         ssh_pool: SSHConnectionPool object the files are sent through
+         overlap: Integer of the number of bytes before the local end of
+           a file, which are compared to the remote file (Default: 4096)
+    """
+    self.ssh_pool = ssh_pool
+    self.overlap = max(1, overlap)
+    # Sizes of the files after they were last pulled, (dir, name) : size:
+    self.sizes = {}
+    self.lock = threading.Lock()
+
+
+  def get_filenames(self, dir, patterns):
+    """ Returns the names of the local files in 'dir' matching the shell
+        patterns.
+    """
+    names = set()
+    for pattern in patterns:
+      names.update([os.path.basename(filename) for filename in glob.glob(os.path.join(dir, pattern)) if (os.path.isfile(filename))])
+    return sorted(names)
+
+
+  def record(self, dir, patterns):
+    """ This method records the sizes of the local files in 'dir' matching
+        the shell patterns, after they were pulled in full.
+        Input:
+         dir: String of the directory name of the simulation
+         patterns: List of shell patterns of the growing files
+    """
+    with self.lock:
+      for name in self.get_filenames(dir, patterns):
+        self.sizes[(dir, name)] = os.path.getsize(os.path.join(dir, name))
+
+
+  def forget(self, dir):
+    """ This method removes the recorded sizes of the files in 'dir', thus
+        they are pulled in full next time.
+    """
+    with self.lock:
+      for key in [key for key in self.sizes.keys() if (key[0] == dir)]:
+        del self.sizes[key]
+
+
+  def pull(self, username, cluster_name, cluster_dir, dir, patterns):
+    """ This method appends the new end of every file in 'dir' matching the
+        shell patterns, whose local size is the recorded one.
+        Input:
+         username: String of the user's username on the cluster
+         cluster_name: String of address of the cluster
+         cluster_dir: Parent directory of 'dir' on the cluster
+         dir: String of the directory name of the simulation
+         patterns: List of shell patterns of the growing files
+        Output:
+         pulled: List of the names of the files that are up to date, all
+           other files have to be pulled in full
+    """
+    pulled = []
+    for name in self.get_filenames(dir, patterns):
+      filename = os.path.join(dir, name)
+      with self.lock:
+        size = self.sizes.pop((dir, name), None)
+      if (size is None or size == 0 or os.path.getsize(filename) != size):
+        continue
+      remote_filename = cluster_dir+'/'+dir+'/'+name
+      try:
+        (status, unreached) = self.pull_file(username, cluster_name, remote_filename, filename, size)
+        if (unreached and self.ssh_pool.remove_dead_master(username, cluster_name)):
+          # Master connection died, reconnect and try once more:
+          (status, unreached) = self.pull_file(username, cluster_name, remote_filename, filename, size)
+      except (IOError, OSError):
+        status = 1
+      if (status == 0):
+        with self.lock:
+          self.sizes[(dir, name)] = os.path.getsize(filename)
+        pulled.append(name)
+    return pulled
+
+
+  def pull_file(self, username, cluster_name, remote_filename, filename, size):
+    """ Appends the end of the remote file from byte 'size' onwards to the
+        local file, if the remote file starts with the local file.
+        Input:
+         username: String of the user's username on the cluster
+         cluster_name: String of address of the cluster
+         remote_filename: String of the filename on the cluster
+         filename: String of the local filename
+         size: Integer of the size of the local file
+        Output:
+         status: 0 if the local file is up to date, 1 otherwise
+         unreached: Boolean which is True if ssh could not reach the cluster
+           (see SSHConnectionPool.is_connection_failure)
+    """
+    overlap = min(self.overlap, size)
+    cmd = self.ssh_pool.get_ssh_cmd(username, cluster_name)+' "tail -c +'+str(size-overlap+1)+" '"+remote_filename+"'\""
+    errors = tempfile.TemporaryFile()
+    f = open(filename, 'r+b')
+    try:
+      process = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=errors)
+      f.seek(size-overlap)
+      # The remote file must not have changed before the local end:
+      head = process.stdout.read(overlap)
+      matched = (head == f.read(overlap))
+      if (matched):
+        f.seek(size)
+        while (True):
+          block = process.stdout.read(1048576)
+          if (block == ''):
+            break
+          f.write(block)
+      else:
+        process.kill()
+      returncode = process.wait()
+      if (returncode != 0 or not matched):
+        # Remove what was appended, the file must be pulled in full:
+        f.truncate(size)
+        errors.seek(0)
+        unreached = (head == '' and self.ssh_pool.is_connection_failure(returncode, errors.read()))
+        return 1, unreached
+    finally:
+      f.close()
+      errors.close()
+    return 0, False
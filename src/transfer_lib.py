@@ -0,0 +1,392 @@
+import os
+import re
+import time
+import tempfile
+import threading
+
+
+
+class TransferBatcher:
+  """ A class that combines the rsync transfers of several simulations from
+      (pull) or to (push) the same directory on a cluster into one rsync
+      process, which runs over the pooled ssh connection (see
+      SSHConnectionPool). The files of every simulation are selected by
+      filter rules anchored at its directory, thus one rsync builds one
+      file list for all of them.
+      A transfer requested by a worker thread waits up to 'window' seconds
+      for the transfers of the other busy workers ('get_nactive' returns
+      their number), and is started right away once all of them joined.
+      The output of rsync is split up per directory (see
+      split_transfer_output), such that every simulation checks only for
+      its own errors. As rsync runs on the parent directory, a missing
+      directory of a simulation is not an error of rsync, thus all
+      directories are checked on the cluster afterwards with one ssh
+      command, and an error is added to the output of missing ones.
+      At most 'lanes' transfers run at the same time per cluster, further
+      transfers wait for a free lane, and the one with the fewest bytes
+      (estimated by the previous transfer of the same simulations) is
+      started first, such that small transfers are not stuck behind large
+      ones. The bandwidth of all lanes of a cluster can be limited with
+      'bwlimit'. The bytes and throughput of every transfer are passed on
+      to 'report', e.g. to write them to the log file of the simulation.
+  """
+  # Marker of the lines rsync writes for every transferred file to its log:
+  log_marker = 'HPCMONITOR_TRANSFER'
+  # Marker of the lines of the directories which are missing on the cluster:
+  missing_marker = 'HPCMONITOR_MISSING'
+
+  def __init__(self, ssh_pool, window=1.0, get_nactive=None, lanes=2, bwlimit=None, report=None):
+    """
+        Constructor with the ssh connection pool, and 5 optional input
+        arguments:
+        Input:
+         ssh_pool: SSHConnectionPool object used for rsync
+         window: Float of the maximum number of seconds a transfer waits
+           for other transfers to the same cluster directory (Default: 1.0)
+         get_nactive: Function returning the number of workers which
+           might request a transfer, or None if there is only one
+           (Default: None)
+         lanes: Integer of the number of transfers that run at the same
+           time per cluster (Default: 2)
+         bwlimit: Integer of the maximum bandwidth in KB/s of all
+           transfers per cluster, or None for no limit (Default: None)
+         report: Function report(dir, msg), which is called with a message
+           about the bytes and throughput of the transfer of every
+           simulation, or None (Default: None)
+    """
+    self.ssh_pool = ssh_pool
+    self.window = window
+    self.get_nactive = get_nactive
+    self.lanes = max(1, lanes)
+    self.bwlimit = bwlimit
+    self.report = report
+    # Number of running transfers per (username, cluster_name), and the
+    # transfers waiting for a lane, [(estimated bytes, number), ...]:
+    self.running = {}
+    self.waiting = {}
+    self.ntransfers = 0
+    # Bytes of the last transfer per (direction, dir):
+    self.transferred_bytes = {}
+    # Batches that are waiting to be started, key : batch, where key is
+    # (direction, username, cluster_name, cluster_dir) and batch a
+    # dictionary with the requests {dir : (includes, excludes)}, its
+    # 'deadline' and the 'results' {dir : out}, once it is done:
+    self.batches = {}
+    self.condition = threading.Condition()
+
+
+  def pull(self, username, cluster_name, cluster_dir, dir, includes, excludes=None):
+    """ Syncs files of a simulation from the cluster into 'dir', like
+         rsync -arvq --include=<includes> --exclude=<excludes> user@cluster:cluster_dir/dir/ dir/
+        would do, together with the pulls of other simulations.
+        Input:
+         username: String of the user's username on the cluster
+         cluster_name: String of address of the cluster
+         cluster_dir: Parent directory of 'dir' on the cluster
+         dir: String of the directory name of the simulation
+         includes: List of file basenames/patterns to include
+         excludes: List of file basenames/patterns to exclude, all other
+           files are excluded anyway (Default: None)
+        Output:
+         out: String of the output of rsync concerning this simulation
+    """
+    return self.submit('pull', username, cluster_name, cluster_dir, dir, includes, excludes)
+
+
+  def push(self, username, cluster_name, cluster_dir, dir, includes, excludes=None):
+    """ Syncs files of a simulation from 'dir' to the cluster, like
+         rsync -arvq --include=<includes> --exclude=<excludes> dir/ user@cluster:cluster_dir/dir/
+        would do, together with the pushes of other simulations.
+        See 'pull' for the input arguments.
+        Output:
+         out: String of the output of rsync concerning this simulation
+    """
+    return self.submit('push', username, cluster_name, cluster_dir, dir, includes, excludes)
+
+
+  def submit(self, direction, username, cluster_name, cluster_dir, dir, includes, excludes):
+    """ This method adds a transfer to the batch of its cluster directory,
+        and waits until the batch was transferred.
+        Output:
+         out: String of the output of rsync concerning 'dir'
+    """
+    key = (direction, username, cluster_name, cluster_dir)
+    with self.condition:
+      batch = self.batches.get(key)
+      leader = (batch is None)
+      if (leader):
+        batch = {'requests' : {}, 'deadline' : time.time()+self.window, 'results' : None}
+        self.batches[key] = batch
+      batch['requests'][dir] = (includes, excludes or [])
+      self.condition.notify_all()
+      if (leader):
+        # Wait for the transfers of the other workers:
+        while (time.time() < batch['deadline'] and len(batch['requests']) < self.get_nworkers()):
+          self.condition.wait(min(0.1, max(0.0, batch['deadline']-time.time())))
+        del self.batches[key]
+      else:
+        while (batch['results'] is None):
+          self.condition.wait(1.0)
+        return batch['results'][dir]
+    try:
+      results = self.transfer(key, batch['requests'])
+    except BaseException:
+      results = dict([(request_dir, 'Error: Exception caught in the batched rsync transfer') for request_dir in batch['requests'].keys()])
+      raise
+    finally:
+      with self.condition:
+        batch['results'] = results
+        self.condition.notify_all()
+    return results[dir]
+
+
+  def get_nworkers(self):
+    """ Returns the number of workers that might join a batch.
+    """
+    if (self.get_nactive is None):
+      return 1
+    return max(1, self.get_nactive())
+
+
+  def acquire_lane(self, cluster_key, estimate):
+    """ This method waits for a free lane of the cluster, transfers with
+        fewer estimated bytes get a lane first.
+        Input:
+         cluster_key: Tuple of (username, cluster_name)
+         estimate: Integer of the estimated bytes of the transfer
+    """
+    with self.condition:
+      self.ntransfers = self.ntransfers + 1
+      entry = (estimate, self.ntransfers)
+      waiting = self.waiting.setdefault(cluster_key, [])
+      waiting.append(entry)
+      while (self.running.get(cluster_key, 0) >= self.lanes or min(waiting) != entry):
+        self.condition.wait(1.0)
+      waiting.remove(entry)
+      self.running[cluster_key] = self.running.get(cluster_key, 0) + 1
+
+
+  def release_lane(self, cluster_key):
+    """ This method frees the lane of a finished transfer.
+        Input:
+         cluster_key: Tuple of (username, cluster_name)
+    """
+    with self.condition:
+      self.running[cluster_key] = self.running[cluster_key] - 1
+      self.condition.notify_all()
+
+
+  def transfer(self, key, requests):
+    """ This method runs one rsync for all requested transfers, once a
+        lane of the cluster is free.
+        Input:
+         key: Tuple of (direction, username, cluster_name, cluster_dir)
+         requests: Dictionary of dir : (includes, excludes)
+        Output:
+         results: Dictionary of dir : output of rsync concerning 'dir'
+    """
+    (direction, username, cluster_name, cluster_dir) = key
+    (fd, filter_filename) = tempfile.mkstemp(prefix='hpcmonitor_rsync_filter_')
+    filterfile = os.fdopen(fd, 'w')
+    try:
+      filterfile.write('\n'.join(get_transfer_filter_rules(requests))+'\n')
+    finally:
+      filterfile.close()
+    (fd, log_filename) = tempfile.mkstemp(prefix='hpcmonitor_rsync_log_')
+    os.close(fd)
+    with self.condition:
+      estimate = sum([self.transferred_bytes.get((direction, dir), 0) for dir in requests.keys()])
+    self.acquire_lane((username, cluster_name), estimate)
+    try:
+      rsync_options = '-arvq --filter="merge '+filter_filename+'"'
+      # Log the bytes of every transferred file:
+      rsync_options = rsync_options+' --log-file='+log_filename+' --log-file-format="'+self.log_marker+' %b %n"'
+      if (not (self.bwlimit is None)):
+        # The bandwidth is shared by all lanes:
+        rsync_options = rsync_options+' --bwlimit='+str(max(1, int(self.bwlimit/self.lanes)))
+      remote = username+'@'+cluster_name+':'+cluster_dir+'/'
+      starttime = time.time()
+      if (direction == 'pull'):
+        out = self.ssh_pool.rsync(username, cluster_name, rsync_options, remote, './')
+      else:
+        out = self.ssh_pool.rsync(username, cluster_name, rsync_options, './', remote)
+      elapsed = time.time()-starttime
+      nbytes = read_transfer_log(log_filename, requests.keys(), self.log_marker)
+    finally:
+      self.release_lane((username, cluster_name))
+      os.remove(filter_filename)
+      os.remove(log_filename)
+    with self.condition:
+      for dir in requests.keys():
+        self.transferred_bytes[(direction, dir)] = nbytes[dir]
+    if (not (self.report is None)):
+      for dir in sorted(requests.keys()):
+        msg = 'rsync '+direction+' of '+dir+': '+str(nbytes[dir])+' bytes in '+'%.1f' % elapsed+' s'
+        msg = msg+' ('+'%.2f' % (nbytes[dir]/max(elapsed, 1e-3)/1e6)+' MB/s, batch of '+str(len(requests))+' simulations with '+str(sum(nbytes.values()))+' bytes)'
+        self.report(dir, msg)
+    results = split_transfer_output(out, requests.keys())
+    return self.check_transferred_dirs(key, results)
+
+
+  def check_transferred_dirs(self, key, results):
+    """ This method checks if the directories of a transfer exist on the
+        cluster, and adds an error to the output of the missing ones.
+        Input:
+         key: Tuple of (direction, username, cluster_name, cluster_dir)
+         results: Dictionary of dir : output of rsync concerning 'dir'
+        Output:
+         results: Dictionary of dir : output concerning 'dir'
+    """
+    (direction, username, cluster_name, cluster_dir) = key
+    dirs = sorted(results.keys())
+    out = self.ssh_pool.run(username, cluster_name, get_dir_check_cmd(cluster_dir, dirs, self.missing_marker))
+    (missing, error) = read_dir_check_output(out, dirs, self.missing_marker)
+    for dir in dirs:
+      if (error != ''):
+        # The check failed itself, e.g. the connection was lost:
+        msg = error
+      elif (dir in missing):
+        msg = 'rsync: '+cluster_dir+'/'+dir+' on '+cluster_name+' failed: No such file or directory'
+      else:
+        continue
+      results[dir] = '\n'.join([line for line in [results[dir], msg] if (line != '')])
+    return results
+
+
+
+def get_transfer_filter_rules(requests):
+  """ Returns the rsync filter rules, relative to the parent directory of
+      the simulations, which select the files of every simulation like
+      its include/exclude patterns would relative to its directory.
+      The rules of every directory are anchored at it, e.g. '/run_1/', thus
+      they do not match other directories starting with the same name,
+      e.g. 'run_10'. The first matching rule applies, and the excludes come
+      before the includes, thus an exclude like 'bkup' also applies if
+      everything ('*') is included.
+      Input:
+       requests: Dictionary of dir : (includes, excludes)
+      Output:
+       rules: List of strings of rsync filter rules
+  """
+  rules = []
+  for dir in sorted(requests.keys()):
+    (includes, excludes) = requests[dir]
+    for pattern in excludes:
+      if (pattern != '*'):
+        rules.append('- /'+dir+'/'+pattern)
+        rules.append('- /'+dir+'/**/'+pattern)
+    rules.append('+ /'+dir+'/')
+    for pattern in includes:
+      if (pattern == '*'):
+        rules.append('+ /'+dir+'/***')
+      else:
+        rules.append('+ /'+dir+'/'+pattern)
+        rules.append('+ /'+dir+'/**/'+pattern)
+    rules.append('- /'+dir+'/**')
+  # Everything else in the parent directory is excluded:
+  rules.append('- /*')
+  return rules
+
+
+def read_transfer_log(log_filename, dirs, log_marker):
+  """ Reads the bytes that were transferred per directory from the log
+      file of rsync, whose lines of transferred files contain
+      '<log_marker> <bytes> <path>'.
+      Input:
+       log_filename: String of the filename of the log file
+       dirs: List of the directory names of the transfer
+       log_marker: String of the marker of the lines of transferred files
+      Output:
+       nbytes: Dictionary of dir : bytes transferred
+  """
+  nbytes = dict([(dir, 0) for dir in dirs])
+  f = open(log_filename, 'r')
+  try:
+    for line in f:
+      index = line.find(log_marker+' ')
+      if (index < 0):
+        continue
+      fields = line[index+len(log_marker)+1:].strip().split(' ', 1)
+      if (len(fields) < 2):
+        continue
+      dir = fields[1].split('/')[0]
+      if (dir in nbytes):
+        try:
+          nbytes[dir] = nbytes[dir] + int(fields[0])
+        except ValueError:
+          pass
+  finally:
+    f.close()
+  return nbytes
+
+
+def get_dir_check_cmd(cluster_dir, dirs, marker):
+  """ Returns the command, which prints '<marker> <dir>' for every
+      directory which does not exist in 'cluster_dir'.
+      Input:
+       cluster_dir: Parent directory of the directories on the cluster
+       dirs: List of the directory names
+       marker: String of the marker of the lines of missing directories
+      Output:
+       cmd: String of the command
+  """
+  return '; '.join(["test -d '"+cluster_dir+'/'+dir+"' || echo '"+marker+' '+dir+"'" for dir in dirs])
+
+
+def read_dir_check_output(out, dirs, marker):
+  """ Reads the output of the command of 'get_dir_check_cmd'.
+      Input:
+       out: String of the output of the command
+       dirs: List of the directory names
+       marker: String of the marker of the lines of missing directories
+      Output:
+       missing: List of the missing directories
+       error: String of the output if it contains anything else (e.g. a
+         connection error), otherwise ''
+  """
+  missing = []
+  for line in out.split('\n'):
+    if (line.strip() == ''):
+      continue
+    fields = line.strip().split(' ', 1)
+    if (len(fields) == 2 and fields[0] == marker and fields[1] in dirs):
+      missing.append(fields[1])
+    else:
+      return [], out
+  return missing, ''
+
+
+def split_transfer_output(out, dirs):
+  """ Splits the output of a batched rsync into the output concerning every
+      directory. Lines mentioning a directory concern only that one, the
+      summary lines of rsync ('rsync error: ...') concern the directories
+      that are mentioned elsewhere. If any other line does not mention a
+      directory (e.g. a connection error), the whole output concerns all
+      directories.
+      Input:
+       out: String of the output of rsync
+       dirs: List of the directory names of the transfer
+      Output:
+       results: Dictionary of dir : output concerning 'dir'
+  """
+  results = dict([(dir, []) for dir in dirs])
+  summary = []
+  patterns = [(dir, re.compile('(^|[/"\' ])'+re.escape(dir)+'(/|"|\'| |$)')) for dir in dirs]
+  for line in out.split('\n'):
+    if (line.strip() == ''):
+      continue
+    matches = [dir for (dir, pattern) in patterns if (pattern.search(line))]
+    if (matches):
+      for dir in matches:
+        results[dir].append(line)
+    elif (line.startswith('rsync error:') or line.startswith('rsync warning:')):
+      summary.append(line)
+    else:
+      # Not attributable, e.g. a connection error:
+      return dict([(dir, out) for dir in dirs])
+  if (summary and not any(results.values())):
+    return dict([(dir, out) for dir in dirs])
+  for dir in dirs:
+    if (results[dir]):
+      results[dir] = results[dir]+summary
+  return dict([(dir, '\n'.join(lines)) for (dir, lines) in results.items()])
@@ -0,0 +1,103 @@
+import os
+import sys
+import shutil
+import commands
+import tempfile
+import unittest
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from transfer_lib import TransferBatcher, get_transfer_filter_rules, split_transfer_output, get_dir_check_cmd, read_dir_check_output
+
+
+
+class TestTransferFilterRules(unittest.TestCase):
+
+  def test_rules_are_anchored_per_directory(self):
+    rules = get_transfer_filter_rules({'run_1' : (['sim*', 'pbs.sh'], ['*'])})
+    self.assertEqual(rules, ['+ /run_1/', '+ /run_1/sim*', '+ /run_1/**/sim*', '+ /run_1/pbs.sh', '+ /run_1/**/pbs.sh', '- /run_1/**', '- /*'])
+
+  def test_prefix_directories_get_separate_rules(self):
+    rules = get_transfer_filter_rules({'run_10' : (['b*'], ['*']), 'run_1' : (['a*'], ['*'])})
+    self.assertEqual(rules, ['+ /run_1/', '+ /run_1/a*', '+ /run_1/**/a*', '- /run_1/**', '+ /run_10/', '+ /run_10/b*', '+ /run_10/**/b*', '- /run_10/**', '- /*'])
+    # No rule of 'run_1' matches anything in 'run_10':
+    for rule in rules[:4]:
+      self.assertTrue(rule[2:].startswith('/run_1/'))
+
+  def test_excludes_come_before_includes(self):
+    rules = get_transfer_filter_rules({'run_1' : (['*'], ['bkup', '*'])})
+    self.assertEqual(rules, ['- /run_1/bkup', '- /run_1/**/bkup', '+ /run_1/', '+ /run_1/***', '- /run_1/**', '- /*'])
+
+  def test_no_requests(self):
+    self.assertEqual(get_transfer_filter_rules({}), ['- /*'])
+
+
+
+class TestSplitTransferOutput(unittest.TestCase):
+
+  def test_empty_output(self):
+    self.assertEqual(split_transfer_output('', ['run_1', 'run_10']), {'run_1' : '', 'run_10' : ''})
+
+  def test_lines_are_attributed_to_prefix_directories_correctly(self):
+    out = 'rsync: send_files failed to open "/home/u/run_10/sim.stat": Permission denied (13)'
+    results = split_transfer_output(out, ['run_1', 'run_10'])
+    self.assertEqual(results['run_1'], '')
+    self.assertEqual(results['run_10'], out)
+
+  def test_summary_goes_to_mentioned_directories(self):
+    line = 'rsync: change_dir "/home/u/run_1" failed: No such file or directory (2)'
+    summary = 'rsync error: some files/attrs were not transferred (see previous errors) (code 23)'
+    results = split_transfer_output(line+'\n'+summary, ['run_1', 'run_2'])
+    self.assertEqual(results['run_1'], line+'\n'+summary)
+    self.assertEqual(results['run_2'], '')
+
+  def test_summary_only_goes_to_all_directories(self):
+    out = 'rsync error: error in rsync protocol data stream (code 12)'
+    self.assertEqual(split_transfer_output(out, ['run_1', 'run_2']), {'run_1' : out, 'run_2' : out})
+
+  def test_unattributable_line_goes_to_all_directories(self):
+    out = 'rsync: some/file\nssh: connect to host cluster port 22: Connection timed out'
+    self.assertEqual(split_transfer_output(out, ['run_1', 'run_2']), {'run_1' : out, 'run_2' : out})
+
+
+
+class TestDirCheck(unittest.TestCase):
+
+  def test_cmd(self):
+    self.assertEqual(get_dir_check_cmd('/home/u', ['run_1', 'run_2'], 'MISSING'), "test -d '/home/u/run_1' || echo 'MISSING run_1'; test -d '/home/u/run_2' || echo 'MISSING run_2'")
+
+  def test_missing_directories(self):
+    self.assertEqual(read_dir_check_output('MISSING run_10\n', ['run_1', 'run_10'], 'MISSING'), (['run_10'], ''))
+    self.assertEqual(read_dir_check_output('', ['run_1', 'run_10'], 'MISSING'), ([], ''))
+
+  def test_other_output_is_an_error(self):
+    out = 'ssh: connect to host cluster port 22: Connection timed out'
+    self.assertEqual(read_dir_check_output(out, ['run_1'], 'MISSING'), ([], out))
+
+
+
+class LocalPool:
+  """ Runs the 'remote' commands on the local machine.
+  """
+  def run(self, username, cluster_name, remote_cmd):
+    return commands.getoutput(remote_cmd)
+
+
+class TestCheckTransferredDirs(unittest.TestCase):
+
+  def setUp(self):
+    self.cluster_dir = tempfile.mkdtemp()
+    os.mkdir(os.path.join(self.cluster_dir, 'run_1'))
+
+  def tearDown(self):
+    shutil.rmtree(self.cluster_dir)
+
+  def test_missing_directory_gets_an_error(self):
+    batcher = TransferBatcher(LocalPool())
+    results = batcher.check_transferred_dirs(('pull', 'u', 'cluster', self.cluster_dir), {'run_1' : '', 'run_10' : ''})
+    self.assertEqual(results['run_1'], '')
+    self.assertTrue('run_10' in results['run_10'])
+    self.assertTrue('No such file or directory' in results['run_10'])
+
+
+
+if __name__ == '__main__':
+  unittest.main()